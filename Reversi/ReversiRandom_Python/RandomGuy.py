@@ -2,171 +2,271 @@
 import sys
 import socket
 import time
+import argparse
+import multiprocessing
 from random import randint
+from bitboard import Board, row_col, square
+from search import Searcher, SearchTimeout, evaluate
+from endgame import EndgameSolver, should_solve, CLOCK_FRACTION, DEFAULT_THRESHOLD
+from timeman import TimeManager
+from parallel import ParallelSearcher
+from book import OpeningBook
+from protocol import MessageReader, GAME_OVER
+from transposition import TranspositionTable, zobrist_hash
+from ponder import Ponderer
+from patterns import PatternEvaluator, load_weights
 
 t1 = 0.0    # the amount of time remaining to player 1
 t2 = 0.0    # the amount of time remaining to player 2
 
 state = [[0 for x in range(8)] for y in range(8)] # state[0][0] is the bottom left corner of the board (on the GUI)
+board = Board()     # the same position as "state" as a bitboard; filled in by readMessage
+reader = None       # the MessageReader for the server connection; created by initClient
+quiet = False       # True suppresses the per-turn output
+
+player = 0          # our player number (1 or 2); set by playGame
+mode = "random"     # "random" picks a random move, "search" runs the alpha-beta search
+moveTime = None     # fixed number of seconds per move; None lets the time manager decide
+hashSize = 16       # the size of the transposition table in megabytes
+workers = 1         # the number of search processes
+endgameEmpties = DEFAULT_THRESHOLD    # solve exactly at or below this many empty squares
+searcher = None     # the Searcher used by move(); created in main
+book = None         # the OpeningBook consulted before searching, if one was given
+ponderer = None     # the Ponderer searching on the opponent's time, if pondering is on
+pondered = None     # (move, score, depth, elapsed) pondered for the current position, or None
+solver = EndgameSolver()
+timeManager = TimeManager()
+
+# prints a progress message unless the client runs in quiet mode
+def log(message):
+    if (not quiet):
+        print message
 
 # You should modify this function
 # validMoves is a list of valid locations that you could place your "stone" on this turn
 # Note that "state" is a global variable 2D list that shows the state of the game
 def move(validMoves):
-    # just return a random move
-    myMove = randint(0,len(validMoves)-1)
-    
-    return myMove
+    if (mode == "random"):
+        # just return a random move
+        myMove = randint(0,len(validMoves)-1)
+
+        return myMove
+
+    # play straight from the opening book when the position is in it
+    if (book is not None):
+        entry = book.lookup(zobrist_hash(board, player))
+        if (entry is not None) and (row_col(entry[0]) in validMoves):
+            log("book: move {0} score {1} depth {2}".format(row_col(entry[0]), entry[1], entry[2]))
+            return validMoves.index(row_col(entry[0]))
+
+    remaining = t1 if (player == 1) else t2
+    empties = 64 - board.disc_count()
+    usable = timeManager.usable(remaining, empties)
+
+    # solve the last few empty squares exactly if the clock allows it
+    if (should_solve(empties, usable, endgameEmpties)):
+        start = time.time()
+        try:
+            limit = timeManager.endgame_limit(remaining, empties, CLOCK_FRACTION)
+            best = solver.solve(board, player, limit)[0]
+            return validMoves.index(row_col(best))
+        except SearchTimeout:
+            log("endgame: solver ran out of time, searching instead")
+            remaining -= time.time() - start
+
+    # split the clock into a soft and a hard limit for this move
+    if (moveTime is None):
+        soft, hard = timeManager.allocate(remaining, board.disc_count(), empties)
+    else:
+        soft, hard = moveTime / 2.0, moveTime
+    log("time: soft {0:.2f} hard {1:.2f} remaining {2:.2f}".format(soft, hard, remaining))
+
+    # the search on the opponent's time already covered part of the budget
+    if (pondered is not None) and (row_col(pondered[0]) in validMoves):
+        best, score, depth, elapsed = pondered
+        log("ponder: move {0} score {1} depth {2} after {3:.2f}s".format(row_col(best), score, depth, elapsed))
+        if (elapsed >= soft):
+            ponderer.credit(soft)
+            return validMoves.index(row_col(best))
+        ponderer.credit(elapsed)
+        soft -= elapsed
+        hard -= elapsed
+
+    # search the position and return the index of the best move in validMoves
+    best = searcher.search(board, player, hard, soft_limit=soft)[0]
+
+    return validMoves.index(row_col(best))
 
 #establishes a connection with the server
 def initClient(me,thehost):
+    global reader
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
     server_address = (thehost, 3333+me)
     print >> sys.stderr, 'starting up on %s port %s' % server_address
     sock.connect(server_address)
     
-    info = sock.recv(1024)
+    reader = MessageReader(sock)
+    info = reader.read_line()
     
-    print info
+    log(info)
 
     return sock
 
 # reads messages from the server
+# (the sock argument is kept for compatibility; messages are read through the buffered reader)
 def readMessage(sock):
-    mensaje = sock.recv(1024).split("\n")
-    #print mensaje
-
-    turn = int(mensaje[0])
-    print "Turn: " + str(turn)
-
-    if (turn == -999):
+    global t1, t2, board
+    turn, round, newT1, newT2, newBoard = reader.read_message()
+    log("Turn: " + str(turn))
+
+    if (turn == GAME_OVER):
+        if (ponderer is not None):
+            ponderer.stop()
+            log(ponderer.stats())
         time.sleep(1)
         sys.exit()
 
-    round = int(mensaje[1])
-    print "Round: " + str(round)
-    t1 = float(mensaje[2])  # update of the amount of time available to player 1
-    #print t1
-    t2 = float(mensaje[3])  # update of the amount of time available to player 2
-    #print t2
+    log("Round: " + str(round))
+    t1 = newT1  # update of the amount of time available to player 1
+    t2 = newT2  # update of the amount of time available to player 2
 
-    count = 4
+    board = newBoard
+    state[:] = board.to_state()
     for i in range(8):
-        for j in range(8):
-            state[i][j] = int(mensaje[count])
-            count = count + 1
-        print state[i]
+        log(state[i])
 
     return turn, round
 
-def checkDirection(row,col,incx,incy,me):
-    sequence = []
-    for i in range(1,8):
-        r = row+incy*i
-        c = col+incx*i
-    
-        if ((r < 0) or (r > 7) or (c < 0) or (c > 7)):
-            break
-
-        sequence.append(state[r][c])
-
-    count = 0
-    for i in range(len(sequence)):
-        if (me == 1):
-            if (sequence[i] == 2):
-                count = count + 1
-            else:
-                if ((sequence[i] == 1) and (count > 0)):
-                    return True
-                break
-        else:
-            if (sequence[i] == 1):
-                count = count+ 1
-            else:
-                if ((sequence[i] == 2) and (count > 0)):
-                    return True
-                break
-    
-    return False
-
-def couldBe(row, col, me):
-    for incx in range(-1,2):
-        for incy in range(-1,2):
-            if ((incx == 0) and (incy == 0)):
-                continue
-
-            if (checkDirection(row,col,incx,incy,me)):
-                return True
-
-    return False
-
 # generates the set of valid moves for the player; returns a list of valid moves (validMoves)
 def getValidMoves(round, me):
-    validMoves = []
-    print "Round: " + str(round)
-    
-    for i in range(8):
-        print state[i]
-
-    if (round < 4):
-        if (state[3][3] == 0):
-            validMoves.append([3, 3])
-        if (state[3][4] == 0):
-            validMoves.append([3, 4])
-        if (state[4][3] == 0):
-            validMoves.append([4, 3])
-        if (state[4][4] == 0):
-            validMoves.append([4, 4])
-    else:
-        for i in range(8):
-            for j in range(8):
-                if (state[i][j] == 0):
-                    if (couldBe(i, j, me)):
-                        validMoves.append([i, j])
+    log("Round: " + str(round))
+
+    validMoves = board.valid_moves(me, round)
 
     return validMoves
 
 
+# starts pondering on the position after our move; the reply predicted by the last search is pondered
+# if the search chose the move we played, otherwise all replies are
+def startPondering(myMove, me):
+    if (board.disc_count() < 4):
+        return
+    sq = square(myMove[0], myMove[1])
+    after = board.copy()
+    after.make(me, sq)
+    if (64 - after.disc_count() <= endgameEmpties):
+        return
+    pv = searcher.pv
+    predicted = pv[1] if (len(pv) > 1 and pv[0] == sq) else None
+    ponderer.start(after, 3 - me, predicted)
+
+
 # main function that (1) establishes a connection with the server, and then plays whenever it is this player's turn
 def playGame(me, thehost):
+    global player, pondered
+    player = me
     
     # create a random number generator
     
     sock = initClient(me, thehost)
     
     while (True):
-        print "Read"
+        log("Read")
         status = readMessage(sock)
     
         if (status[0] == me):
-            print "Move";
+            log("Move")
+            if (ponderer is not None):
+                pondered = ponderer.finish(board, me)
             validMoves = getValidMoves(status[1], me)
-            print validMoves
+            log(validMoves)
             
             myMove = move(validMoves)
         
             sel = str(validMoves[myMove][0]) + "\n" + str(validMoves[myMove][1]) + "\n";
-            print "<" + sel + ">"
-            sock.send(sel);
-            print "sent the message"
+            log("<" + sel + ">")
+            sock.sendall(sel);
+            log("sent the message")
+
+            # think about the reply while the opponent is thinking
+            if (ponderer is not None):
+                startPondering(validMoves[myMove], me)
         else:
-            print "It isn't my turn"
+            log("It isn't my turn")
+            if (ponderer is not None):
+                ponderer.observe(board)
 
 
     return
 
 
 
-# call: python RandomGuy.py [ipaddress] [player_number]
+# parses the command line (see below); the arena in arena.py passes agent options through here as well
+def parseArguments(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("ipaddress")
+    parser.add_argument("player_number", type=int)
+    parser.add_argument("--mode", choices=("random", "search"), default="random")
+    parser.add_argument("--time", type=float, default=moveTime)
+    parser.add_argument("--hash", type=int, default=hashSize)
+    parser.add_argument("--endgame", type=int, default=endgameEmpties)
+    parser.add_argument("--workers", type=int, default=workers)
+    parser.add_argument("--book")
+    parser.add_argument("--patterns")
+    parser.add_argument("--ponder", action="store_true")
+    parser.add_argument("--quiet", action="store_true")
+    return parser.parse_args(argv)
+
+# sets up the player (searcher, book, pondering) from the parsed arguments
+def configure(args):
+    global quiet, mode, moveTime, endgameEmpties, workers, searcher, book, ponderer
+    quiet = args.quiet
+    mode = args.mode
+    moveTime = args.time
+    endgameEmpties = args.endgame
+    # The helpers of a parallel search only speed it up with a CPU each (see
+    # parallel.py); on fewer they slow the main search down
+    workers = min(args.workers, multiprocessing.cpu_count())
+    if (workers < args.workers and not quiet):
+        print "The search runs on {0} worker(s), one per CPU".format(workers)
+    evaluator = evaluate
+    if (args.patterns is not None):
+        evaluator = PatternEvaluator(load_weights(args.patterns))
+    if (workers > 1):
+        searcher = ParallelSearcher(workers, args.hash, verbose=not quiet, evaluate=evaluator)
+    else:
+        searcher = Searcher(evaluator, TranspositionTable(args.hash), verbose=not quiet)
+    solver.verbose = not quiet
+    if (args.book is not None):
+        book = OpeningBook(args.book)
+    if (args.ponder and mode == "search"):
+        ponderer = Ponderer(searcher)
+
+
+# call: python RandomGuy.py [ipaddress] [player_number] [--mode random|search] [--time seconds] [--hash megabytes] [--endgame empties] [--workers N] [--book file] [--patterns file] [--ponder] [--quiet]
 #   ipaddress is the ipaddress on the computer the server was launched on.  Enter "localhost" if it is on the same computer
 #   player_number is 1 (for the black player) and 2 (for the white player)
+#   --mode selects random moves (the default) or the alpha-beta search
+#   --time fixes the number of seconds the search may spend on each move; by default the time manager
+#     budgets every move from the remaining clock
+#   --hash is the size of the transposition table in megabytes
+#   --endgame is the number of empty squares at which the search switches to the exact endgame solver
+#   --workers is the number of processes the search runs on (Lazy SMP with a shared transposition table), at most one per CPU
+#   --book is an opening book built with book.py
+#   --patterns evaluates positions with pattern weights fitted by patterns.py instead of the square weights
+#   --ponder keeps searching while the opponent is thinking (search mode only)
+#   --quiet turns off the per-turn output
 if __name__ == "__main__":
 
     print 'Number of arguments:', len(sys.argv), 'arguments.'
     print 'Argument List:', str(sys.argv)
 
-    print str(sys.argv[1])
-    
-    playGame(int(sys.argv[2]), sys.argv[1])
+    args = parseArguments(sys.argv[1:])
+
+    print str(args.ipaddress)
+
+    configure(args)
+
+    playGame(args.player_number, args.ipaddress)
 
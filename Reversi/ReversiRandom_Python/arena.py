@@ -0,0 +1,337 @@
+################################################################################
+# ARENA
+#
+# Plays games between two RandomGuy.py agents without the Java server. The
+# game loop follows the rules of ReversiServer: the first four moves fill the
+# centre squares, a player without a valid move passes, the game ends after
+# two passes in a row, the empty squares go to the winner, and a player whose
+# clock runs out loses with no discs.
+#
+# Each agent is its own copy of the RandomGuy module, configured with the same
+# options as on the command line and asked for moves through move(validMoves).
+# Games are spread over a pool of processes and the agents swap colours
+# every game.
+#
+# call: python arena.py [--agent1 "options"] [--agent2 "options"] [--games N]
+#                       [--processes P] [--minutes M] [--record file]
+#   e.g. python arena.py --agent1="--mode search --time 0.1" --games 200
+#
+import os
+import imp
+import sys
+import math
+import time
+import random
+import argparse
+import itertools
+import multiprocessing
+from bitboard import Board, square
+
+CLIENT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                      "RandomGuy.py")
+Z = 1.96            # 95% confidence
+
+
+def wilson(score, n, z=Z):
+    """
+    Computes the Wilson score interval of a win rate
+
+    :param score: The number of wins (draws count a half)
+    :param n: The number of games
+    :param z: The normal quantile of the confidence level
+    :return: A (low, high) tuple
+    """
+    if n == 0:
+        return 0.0, 1.0
+    p = float(score) / n
+    denominator = 1 + z * z / n
+    centre = p + z * z / (2 * n)
+    spread = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+    return (centre - spread) / denominator, (centre + spread) / denominator
+
+
+# ------------------------------------------------------------------------------
+# Agent
+#
+# One copy of RandomGuy.py. Loading the module under a new name gives every
+# agent its own globals (board, clock, searcher, ...).
+#
+class Agent(object):
+
+    count = 0
+
+    # Constructor; 'options' are RandomGuy.py command line options
+    def __init__(self, options):
+        Agent.count += 1
+        self.options = options
+        self.module = imp.load_source("arena_agent_{0}".format(Agent.count),
+                                      CLIENT)
+        args = self.module.parseArguments(["localhost", "1"] +
+                                          options.split() + ["--quiet"])
+        if args.ponder:
+            raise ValueError("the agents of a game take turns in one process, "
+                             "so they cannot ponder")
+        self.module.configure(args)
+
+    # Get ready for a game as 'player'
+    def new_game(self, player):
+        self.module.player = player
+        if self.module.searcher is not None:
+            self.module.searcher.tt.clear()
+
+    # Nodes searched and seconds spent searching so far
+    def search_stats(self):
+        searcher = self.module.searcher
+        if self.module.mode != "search" or searcher is None:
+            return 0, 0.0
+        return searcher.total_nodes, searcher.total_time
+
+    def move(self, board, round, t1, t2):
+        """
+        Asks the agent for a move, the same way playGame does
+
+        :param board: The current Board
+        :param round: The number of moves played so far
+        :param t1: Seconds left on player 1's clock
+        :param t2: Seconds left on player 2's clock
+        :return: The move as [row, col]
+        """
+        client = self.module
+        client.board = board.copy()
+        client.state[:] = board.to_state()
+        client.t1 = t1
+        client.t2 = t2
+        validMoves = board.valid_moves(client.player, round)
+        return validMoves[client.move(validMoves)]
+
+
+def play_game(black, white, minutes=1.0, record=False):
+    """
+    Plays one game by the server's rules
+
+    :param black: The Agent playing player 1
+    :param white: The Agent playing player 2
+    :param minutes: The time on each player's clock
+    :param record: Keep every position of the game
+    :return: A dictionary with the winner (0 for a draw), the final disc
+             counts, and the moves, seconds, nodes and search time of each
+             player (indexed by player number); 'positions' holds
+             (black, white, player to move) for every move if 'record' is set
+    """
+    agents = [None, black, white]
+    clock = [None, minutes * 60.0, minutes * 60.0]
+    moves = [None, 0, 0]
+    spent = [None, 0.0, 0.0]
+    before = [None, black.search_stats(), white.search_stats()]
+    black.new_game(1)
+    white.new_game(2)
+
+    board = Board()
+    positions = list()
+    round = 0
+    player = 1
+    passes = 0
+    timeout = None
+    while True:
+        valid = board.valid_moves(player, round)
+        if valid:
+            start = time.time()
+            move = agents[player].move(board, round, clock[1], clock[2])
+            elapsed = time.time() - start
+            clock[player] -= elapsed
+            spent[player] += elapsed
+            moves[player] += 1
+            if clock[player] <= 0.0:
+                timeout = player
+                break
+            if move not in valid:
+                raise ValueError("player {0} played {1}, which is not one of "
+                                 "{2}".format(player, move, valid))
+            if record:
+                positions.append((board.discs[1], board.discs[2], player))
+            board.make(player, square(move[0], move[1]))
+            round += 1
+            passes = 0
+        else:
+            passes += 1
+            if passes == 2:
+                break
+        player = 3 - player
+
+    discs = [None, board.count(1), board.count(2)]
+    if timeout is not None:
+        winner = 3 - timeout
+        discs[timeout] = 0
+    elif discs[1] != discs[2]:
+        winner = 1 if discs[1] > discs[2] else 2
+        discs[winner] = 64 - discs[3 - winner]
+    else:
+        winner = 0
+
+    nodes = [None]
+    search_time = [None]
+    for p in (1, 2):
+        after = agents[p].search_stats()
+        nodes.append(after[0] - before[p][0])
+        search_time.append(after[1] - before[p][1])
+    return {"winner": winner, "discs": discs, "timeout": timeout,
+            "moves": moves, "spent": spent, "nodes": nodes,
+            "search_time": search_time, "positions": positions}
+
+
+# ------------------------------------------------------------------------------
+# Match
+#
+_agents = None      # the two agents of this process
+
+
+def _init(options):
+    global _agents
+    _agents = (Agent(options[0]), Agent(options[1]))
+
+
+def _play(job):
+    index, minutes, record, seed = job
+    random.seed(seed + index)
+    first, second = _agents
+    # Agent 1 plays black in even games and white in odd ones
+    if index % 2 == 0:
+        return index, play_game(first, second, minutes, record)
+    return index, play_game(second, first, minutes, record)
+
+
+class MatchStats(object):
+
+    # Constructor
+    def __init__(self):
+        self.games = 0
+        self.wins = [0, 0]      # per agent
+        self.draws = 0
+        self.timeouts = [0, 0]
+        self.margin = 0         # agent 1's discs minus agent 2's, summed
+        self.moves = [0, 0]
+        self.spent = [0.0, 0.0]
+        self.nodes = [0, 0]
+        self.search_time = [0.0, 0.0]
+
+    # Add the result of game 'index'
+    def add(self, index, result):
+        # players[a] is the player number agent a had in this game
+        players = (1, 2) if index % 2 == 0 else (2, 1)
+        self.games += 1
+        if result["winner"] == 0:
+            self.draws += 1
+        discs = result["discs"]
+        self.margin += discs[players[0]] - discs[players[1]]
+        for a in (0, 1):
+            p = players[a]
+            if result["winner"] == p:
+                self.wins[a] += 1
+            if result["timeout"] == p:
+                self.timeouts[a] += 1
+            self.moves[a] += result["moves"][p]
+            self.spent[a] += result["spent"][p]
+            self.nodes[a] += result["nodes"][p]
+            self.search_time[a] += result["search_time"][p]
+
+    # The share of the points agent 1 scored
+    def score(self):
+        return (self.wins[0] + 0.5 * self.draws) / max(self.games, 1)
+
+    def report(self, options):
+        """
+        Summarizes the match
+
+        :param options: The options of both agents
+        :return: The summary as a list of lines
+        """
+        low, high = wilson(self.wins[0] + 0.5 * self.draws, self.games)
+        lines = ["games {0}: agent 1 won {1}, lost {2}, drew {3}".format(
+                     self.games, self.wins[0], self.wins[1], self.draws),
+                 "agent 1 score {0:.1f}% (95% CI {1:.1f}% - {2:.1f}%), average "
+                 "margin {3:+.1f} discs".format(100 * self.score(), 100 * low,
+                                                100 * high,
+                                                float(self.margin) /
+                                                max(self.games, 1))]
+        for a in (0, 1):
+            nps = self.nodes[a] / self.search_time[a] \
+                if self.search_time[a] > 0 else 0
+            lines.append("agent {0} [{1}]: {2:.1f} ms/move, {3:.0f} nps, "
+                         "{4} timeouts".format(a + 1, options[a],
+                                               1000 * self.spent[a] /
+                                               max(self.moves[a], 1),
+                                               nps, self.timeouts[a]))
+        return lines
+
+
+def run_match(options, games, processes=1, minutes=1.0, record=None,
+              seed=470, verbose=True):
+    """
+    Plays a match between two agents
+
+    :param options: The RandomGuy.py options of both agents
+    :param games: The number of games
+    :param processes: The number of processes to play on. Agents with more
+                      than one search worker need processes=1, because pool
+                      processes cannot start processes of their own
+    :param minutes: The time on each player's clock
+    :param record: A file to append every position to, as lines of
+                   "black white player margin" where margin is the final disc
+                   difference from black's point of view
+    :param seed: The random seed of game 0; game i uses seed + i
+    :param verbose: Print progress every tenth of the match
+    :return: The MatchStats
+    """
+    jobs = [(i, minutes, record is not None, seed) for i in range(games)]
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, _init, (options,))
+        results = pool.imap_unordered(_play, jobs)
+    else:
+        pool = None
+        _init(options)
+        results = itertools.imap(_play, jobs)
+
+    stats = MatchStats()
+    output_file = open(record, "a") if record is not None else None
+    start = time.time()
+    for index, result in results:
+        stats.add(index, result)
+        if output_file is not None:
+            discs = result["discs"]
+            for black, white, player in result["positions"]:
+                output_file.write("{0} {1} {2} {3}\n".format(
+                    black, white, player, discs[1] - discs[2]))
+        if verbose and stats.games % max(games // 10, 1) == 0:
+            print >> sys.stderr, "arena: {0}/{1} games, agent 1 score " \
+                                 "{2:.1f}%, {3:.0f}s".format(
+                                     stats.games, games, 100 * stats.score(),
+                                     time.time() - start)
+    if output_file is not None:
+        output_file.close()
+    if pool is not None:
+        pool.close()
+        pool.join()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agent1", default="--mode search")
+    parser.add_argument("--agent2", default="--mode random")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--processes", type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument("--minutes", type=float, default=1.0)
+    parser.add_argument("--record")
+    parser.add_argument("--seed", type=int, default=470)
+    args = parser.parse_args()
+
+    options = (args.agent1, args.agent2)
+    stats = run_match(options, args.games, args.processes, args.minutes,
+                      args.record, args.seed)
+    for line in stats.report(options):
+        print >> sys.stderr, line
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+################################################################################
+# BITBOARD
+#
+# Bitboard representation of a Reversi position. Each player's discs are kept
+# in a single 64-bit integer where bit (row * 8 + col) is set when the player
+# owns state[row][col]. Players are numbered exactly as the server numbers them
+# (1 for black, 2 for white) so a Board can be indexed with the same 'me' value
+# that RandomGuy.py already uses.
+#
+FULL = 0xFFFFFFFFFFFFFFFF
+NOT_COL_0 = 0xFEFEFEFEFEFEFEFE      # every square except column 0
+NOT_COL_7 = 0x7F7F7F7F7F7F7F7F      # every square except column 7
+
+# The four centre squares that must be filled during the first four rounds
+CENTRE = (1 << 27) | (1 << 28) | (1 << 35) | (1 << 36)
+
+# (shift, mask) pairs for the eight directions. A positive shift moves towards
+# higher rows/columns. The mask removes the bits that wrapped around a column
+# edge and, because it is 64 bits wide, also truncates anything shifted past
+# bit 63.
+DIRECTIONS = (
+    (1, NOT_COL_0),     # col + 1
+    (-1, NOT_COL_7),    # col - 1
+    (8, FULL),          # row + 1
+    (-8, FULL),         # row - 1
+    (9, NOT_COL_0),     # row + 1, col + 1
+    (7, NOT_COL_7),     # row + 1, col - 1
+    (-7, NOT_COL_0),    # row - 1, col + 1
+    (-9, NOT_COL_7),    # row - 1, col - 1
+)
+
+
+# ------------------------------------------------------------------------------
+# Bit Helper Functions
+#
+def square(row, col):
+    """
+    Converts a (row, col) pair into a bit index
+
+    :param row: The row of the square (0 is the bottom row on the GUI)
+    :param col: The column of the square
+    :return: The bit index of the square
+    """
+    return row * 8 + col
+
+
+def row_col(sq):
+    """
+    Converts a bit index into the [row, col] list format used by getValidMoves
+
+    :param sq: The bit index of the square
+    :return: A [row, col] list
+    """
+    return [sq >> 3, sq & 7]
+
+
+def popcount(bits):
+    """
+    Counts the number of set bits in a 64-bit mask
+
+    :param bits: The mask to count
+    :return: The number of set bits
+    """
+    return bin(bits).count("1")
+
+
+def iter_bits(bits):
+    """
+    Yields the index of every set bit in a mask, lowest index first
+
+    :param bits: The mask to iterate over
+    """
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def moves_mask(own, opp):
+    """
+    Generates the legal (flipping) moves for the player owning 'own' with a
+    shift-and-mask flood fill in each of the eight directions
+
+    :param own: The discs of the player to move
+    :param opp: The discs of the opponent
+    :return: A mask of every empty square that flips at least one disc
+    """
+    empty = ~(own | opp) & FULL
+    moves = 0
+    for shift, mask in DIRECTIONS:
+        if shift > 0:
+            x = (own << shift) & mask & opp
+            x |= (x << shift) & mask & opp
+            x |= (x << shift) & mask & opp
+            x |= (x << shift) & mask & opp
+            x |= (x << shift) & mask & opp
+            x |= (x << shift) & mask & opp
+            moves |= (x << shift) & mask & empty
+        else:
+            shift = -shift
+            x = (own >> shift) & mask & opp
+            x |= (x >> shift) & mask & opp
+            x |= (x >> shift) & mask & opp
+            x |= (x >> shift) & mask & opp
+            x |= (x >> shift) & mask & opp
+            x |= (x >> shift) & mask & opp
+            moves |= (x >> shift) & mask & empty
+    return moves
+
+
+def flips_mask(own, opp, sq):
+    """
+    Computes the discs flipped when the owner of 'own' plays on square 'sq'
+
+    :param own: The discs of the player to move
+    :param opp: The discs of the opponent
+    :param sq: The bit index of the move
+    :return: A mask of the opponent discs that change colour
+    """
+    bit = 1 << sq
+    flipped = 0
+    for shift, mask in DIRECTIONS:
+        line = 0
+        if shift > 0:
+            x = (bit << shift) & mask
+            while x & opp:
+                line |= x
+                x = (x << shift) & mask
+        else:
+            x = (bit >> -shift) & mask
+            while x & opp:
+                line |= x
+                x = (x >> -shift) & mask
+        if x & own:
+            flipped |= line
+    return flipped
+
+
+# ------------------------------------------------------------------------------
+# Board
+#
+# A Reversi position stored as two bitboards. discs[1] holds player 1's discs
+# and discs[2] holds player 2's discs (discs[0] is unused so that the server's
+# player numbers can be used as indices).
+#
+class Board(object):
+    __slots__ = ("discs",)
+
+    # Constructor
+    def __init__(self, black=0, white=0):
+        self.discs = [0, black, white]
+
+    # Build a board from a state[row][col] list-of-lists
+    @classmethod
+    def from_state(cls, state):
+        board = cls()
+        for i in range(8):
+            for j in range(8):
+                if state[i][j]:
+                    board.discs[state[i][j]] |= 1 << (i * 8 + j)
+        return board
+
+    # Build a board from the 64 cells of a server message (row-major order)
+    @classmethod
+    def from_cells(cls, cells):
+        board = cls()
+        for sq in range(64):
+            cell = int(cells[sq])
+            if cell:
+                board.discs[cell] |= 1 << sq
+        return board
+
+    # Convert the board back to a state[row][col] list-of-lists
+    def to_state(self):
+        state = [[0 for x in range(8)] for y in range(8)]
+        for p in (1, 2):
+            for sq in iter_bits(self.discs[p]):
+                state[sq >> 3][sq & 7] = p
+        return state
+
+    # Convert the board to the 64 newline-separated cells the server sends
+    def to_cells(self):
+        black = self.discs[1]
+        white = self.discs[2]
+        cells = list()
+        for sq in range(64):
+            bit = 1 << sq
+            cells.append("1" if black & bit else "2" if white & bit else "0")
+        return "\n".join(cells) + "\n"
+
+    # Return an independent copy of the board
+    def copy(self):
+        return Board(self.discs[1], self.discs[2])
+
+    # Mask of all empty squares
+    def empties(self):
+        return ~(self.discs[1] | self.discs[2]) & FULL
+
+    # Number of discs on the board; equal to the server's round counter since
+    # every round places exactly one disc and passes do not advance it
+    def disc_count(self):
+        return popcount(self.discs[1] | self.discs[2])
+
+    # Number of discs owned by 'player'
+    def count(self, player):
+        return popcount(self.discs[player])
+
+    # Mask of legal moves for 'player'. During the first four rounds the server
+    # only allows the empty centre squares, without requiring a flip
+    def move_mask(self, player, round=None):
+        own = self.discs[player]
+        opp = self.discs[3 - player]
+        if round is None:
+            round = popcount(own | opp)
+        if round < 4:
+            return CENTRE & ~(own | opp)
+        return moves_mask(own, opp)
+
+    # List of legal moves as [row, col] pairs, in the same order as the
+    # row-major scan done by getValidMoves
+    def valid_moves(self, player, round=None):
+        return [row_col(sq) for sq in iter_bits(self.move_mask(player, round))]
+
+    # Mask of the discs that would be flipped if 'player' played on 'sq'
+    def flips(self, player, sq):
+        return flips_mask(self.discs[player], self.discs[3 - player], sq)
+
+    # Play 'player' on 'sq' and return the flipped mask so the move can be
+    # undone with unmake()
+    def make(self, player, sq):
+        flipped = flips_mask(self.discs[player], self.discs[3 - player], sq)
+        self.discs[player] ^= flipped | (1 << sq)
+        self.discs[3 - player] ^= flipped
+        return flipped
+
+    # Undo a move previously played with make()
+    def unmake(self, player, sq, flipped):
+        self.discs[player] ^= flipped | (1 << sq)
+        self.discs[3 - player] ^= flipped
+
+    # Equality is based on the disc positions only
+    def __eq__(self, other):
+        return isinstance(other, Board) and self.discs == other.discs
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    # toString method; prints the board with row 7 at the top like the GUI
+    def __str__(self):
+        rows = list()
+        for i in range(7, -1, -1):
+            row = ""
+            for j in range(8):
+                bit = 1 << (i * 8 + j)
+                if self.discs[1] & bit:
+                    row += "1"
+                elif self.discs[2] & bit:
+                    row += "2"
+                else:
+                    row += "0"
+            rows.append(row)
+        return "\n".join(rows)
+
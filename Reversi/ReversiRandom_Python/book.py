@@ -0,0 +1,172 @@
+################################################################################
+# OPENING BOOK
+#
+# A persistent opening book stored as an open-addressing hash table on disk.
+# The file is memory-mapped when the client starts, so loading it only reads
+# the header; each lookup reads a single slot or two.
+#
+# File layout (little endian):
+#   header: magic "RVBK", version (uint32), number of slots (uint32)
+#   slots:  Zobrist key (uint64), move (int8), depth (uint8), score (int16)
+# A key of 0 marks an empty slot.
+#
+# call: python book.py [--out book.bin] [--games G] [--plies P] [--depth D]
+#   builds a book from G self-play games, searching every position of the
+#   first P plies to depth D
+#
+import os
+import sys
+import mmap
+import time
+import random
+import struct
+import argparse
+from bitboard import Board, iter_bits
+from search import Searcher
+from transposition import zobrist_hash
+
+MAGIC = "RVBK"
+VERSION = 1
+HEADER = struct.Struct("<4sII")
+SLOT = struct.Struct("<QbBh")
+
+
+# ------------------------------------------------------------------------------
+# OpeningBook
+#
+# Read-only view of a book file.
+#
+class OpeningBook(object):
+
+    # Constructor; maps the book file into memory
+    def __init__(self, filename):
+        self.__file = open(filename, "rb")
+        self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, slots = HEADER.unpack_from(self.__map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{0} is not a version {1} opening book".format(
+                filename, VERSION))
+        self.mask = slots - 1
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, key):
+        """
+        Looks up a position in the book
+
+        :param key: The Zobrist hash of the position (see transposition.py)
+        :return: A (move, score, depth) tuple, or None if the position is not
+                 in the book
+        """
+        i = key & self.mask
+        while True:
+            k, move, depth, score = SLOT.unpack_from(self.__map, HEADER.size +
+                                                     i * SLOT.size)
+            if k == key:
+                self.hits += 1
+                return move, score, depth
+            if k == 0:
+                self.misses += 1
+                return None
+            i = (i + 1) & self.mask
+
+    # Unmap the book file
+    def close(self):
+        self.__map.close()
+        self.__file.close()
+
+
+def write_book(filename, entries):
+    """
+    Writes a book file
+
+    :param filename: The name of the file to write
+    :param entries: A dictionary mapping Zobrist keys to (move, score, depth)
+    """
+    slots = 1
+    while slots < 2 * len(entries):
+        slots *= 2
+    table = [None] * slots
+    for key, entry in entries.items():
+        i = key & (slots - 1)
+        while table[i] is not None:
+            i = (i + 1) & (slots - 1)
+        table[i] = (key,) + entry
+
+    with open(filename, "wb") as output_file:
+        output_file.write(HEADER.pack(MAGIC, VERSION, slots))
+        for slot in table:
+            if slot is None:
+                output_file.write(SLOT.pack(0, -1, 0, 0))
+            else:
+                key, move, score, depth = slot
+                output_file.write(SLOT.pack(key, move, depth, score))
+
+
+# ------------------------------------------------------------------------------
+# Book Builder
+#
+def build_book(games, plies, depth, epsilon=0.3, seed=470, verbose=True):
+    """
+    Builds book entries from self-play. Every position in the first 'plies'
+    plies of each game is searched to a fixed depth; the game then continues
+    with the best move, or with a random move with probability 'epsilon' so
+    that the games cover different lines
+
+    :param games: The number of self-play games
+    :param plies: The number of plies of each game to put in the book
+    :param depth: The search depth for every book position
+    :param epsilon: The probability of playing a random move
+    :param seed: The random seed
+    :param verbose: Print progress after every game
+    :return: A dictionary mapping Zobrist keys to (move, score, depth)
+    """
+    rng = random.Random(seed)
+    searcher = Searcher(verbose=False)
+    entries = dict()
+    start = time.time()
+    for g in range(games):
+        board = Board()
+        player = 1
+        for ply in range(plies):
+            moves = list(iter_bits(board.move_mask(player)))
+            if not moves:
+                player = 3 - player
+                continue
+            key = zobrist_hash(board, player)
+            if key not in entries:
+                move, score, d = searcher.search(board, player, 3600.0, depth,
+                                                 3600.0)
+                entries[key] = (move, score, d)
+            if rng.random() < epsilon:
+                move = rng.choice(moves)
+            else:
+                move = entries[key][0]
+            board.make(player, move)
+            player = 3 - player
+        if verbose:
+            print >> sys.stderr, "book: game {0}/{1}, {2} positions, " \
+                                 "{3:.0f}s".format(g + 1, games, len(entries),
+                                                   time.time() - start)
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default="book.bin")
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--plies", type=int, default=12)
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--epsilon", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=470)
+    args = parser.parse_args()
+
+    entries = build_book(args.games, args.plies, args.depth, args.epsilon,
+                         args.seed)
+    write_book(args.out, entries)
+    print >> sys.stderr, "book: wrote {0} positions to {1} ({2} bytes)".format(
+        len(entries), args.out, os.path.getsize(args.out))
+
+
+if __name__ == "__main__":
+    main()
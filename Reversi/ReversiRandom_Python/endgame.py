@@ -0,0 +1,178 @@
+################################################################################
+# ENDGAME SOLVER
+#
+# Exact solver for positions with only a few empty squares left. Instead of a
+# heuristic score it computes the final disc differential (with the empty
+# squares given to the winner, like the server does). The search first finds
+# out whether the position is a win, loss or draw with a null window and then
+# computes the exact score inside the window that result allows.
+#
+import time
+from bitboard import FULL, moves_mask, flips_mask, popcount, row_col
+from search import PRIORITY, SearchTimeout, final_score, CHECK_INTERVAL
+
+DEFAULT_THRESHOLD = 12      # solve exactly at or below this many empties
+FASTEST_FIRST = 7           # order by opponent mobility above this many empties
+ESTIMATED_NPS = 20000.0     # conservative solver speed used to plan the clock
+BRANCHING = 2.6             # rough effective branching factor of the solver
+CLOCK_FRACTION = 0.5        # never plan to use more of the clock than this
+
+# QUADRANT[sq] is the parity bit of the quadrant 'sq' lies in
+QUADRANT = [1 << ((sq >> 5) * 2 + ((sq & 7) >> 2)) for sq in range(64)]
+
+# Squares in static priority order, used to seed the empty-square list
+ORDERED_SQUARES = sorted(range(64), key=PRIORITY.__getitem__)
+
+
+# ------------------------------------------------------------------------------
+# Clock Helper Functions
+#
+def estimated_time(empties):
+    """
+    Rough estimate of the time needed to solve a position exactly
+
+    :param empties: The number of empty squares
+    :return: The estimated number of seconds
+    """
+    return BRANCHING ** empties / ESTIMATED_NPS
+
+
+def should_solve(empties, remaining, threshold=DEFAULT_THRESHOLD):
+    """
+    Decides whether to switch from the heuristic search to the exact solver
+
+    :param empties: The number of empty squares
+    :param remaining: The number of seconds left on our clock
+    :param threshold: The largest number of empties to solve
+    :return: True if the position should be solved exactly
+    """
+    if empties > threshold:
+        return False
+    return estimated_time(empties) < remaining * CLOCK_FRACTION
+
+
+# ------------------------------------------------------------------------------
+# EndgameSolver
+#
+# Keeps a list of the empty squares and only tries moves on those squares, so
+# no full move generation is needed. Moves in quadrants with an odd number of
+# empties are tried first (parity ordering); higher up in the tree moves are
+# ordered by how few replies they leave the opponent (fastest-first).
+#
+class EndgameSolver(object):
+
+    # Constructor
+    def __init__(self, verbose=True):
+        self.verbose = verbose
+        self.nodes = 0
+        self.deadline = None
+
+    def solve(self, board, player, time_limit):
+        """
+        Solves a position exactly
+
+        :param board: The Board to solve
+        :param player: The player to move (1 or 2)
+        :param time_limit: The number of seconds available; SearchTimeout is
+                           raised if the solver runs out of time
+        :return: A (square, score) tuple where score is the final disc
+                 differential for 'player'; square is None for a pass
+        """
+        start = time.time()
+        self.deadline = start + time_limit
+        self.nodes = 0
+
+        own = board.discs[player]
+        opp = board.discs[3 - player]
+        empty = ~(own | opp) & FULL
+        empties = [sq for sq in ORDERED_SQUARES if empty >> sq & 1]
+        parity = 0
+        for sq in empties:
+            parity ^= QUADRANT[sq]
+        if not moves_mask(own, opp):
+            return None, -self.__solve(opp, own, empties, parity, -64, 64)
+
+        # Win/loss/draw pass with a null window around zero
+        move, score = self.__root(own, opp, empties, parity, -1, 1)
+        if score > 0:
+            move, score = self.__root(own, opp, empties, parity, 0, 65)
+        elif score < 0:
+            move, score = self.__root(own, opp, empties, parity, -65, 0)
+
+        if self.verbose:
+            elapsed = time.time() - start
+            nps = int(self.nodes / elapsed) if elapsed > 0 else 0
+            print "endgame: empties {0} move {1} score {2} nodes {3} nps {4}"\
+                .format(len(empties), row_col(move), score, self.nodes, nps)
+        return move, score
+
+    # Search every root move inside the window (alpha, beta)
+    def __root(self, own, opp, empties, parity, alpha, beta):
+        best = None
+        for sq, flipped in self.__ordered_moves(own, opp, empties, parity):
+            score = -self.__solve(opp ^ flipped, own | flipped | (1 << sq),
+                                  [e for e in empties if e != sq],
+                                  parity ^ QUADRANT[sq], -beta, -alpha)
+            if best is None or score > alpha:
+                best = sq
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+        return best, alpha
+
+    # Legal moves as (square, flipped) pairs in search order
+    def __ordered_moves(self, own, opp, empties, parity):
+        moves = list()
+        if len(empties) > FASTEST_FIRST:
+            for sq in empties:
+                flipped = flips_mask(own, opp, sq)
+                if flipped:
+                    mobility = popcount(moves_mask(opp ^ flipped,
+                                                   own | flipped | (1 << sq)))
+                    moves.append((mobility, not parity & QUADRANT[sq], sq,
+                                  flipped))
+            moves.sort()
+            return [(m[2], m[3]) for m in moves]
+        for odd in (True, False):
+            for sq in empties:
+                if bool(parity & QUADRANT[sq]) == odd:
+                    flipped = flips_mask(own, opp, sq)
+                    if flipped:
+                        moves.append((sq, flipped))
+        return moves
+
+    # Exact alpha-beta search returning the final disc differential for 'own'
+    def __solve(self, own, opp, empties, parity, alpha, beta):
+        self.nodes += 1
+        if not self.nodes & CHECK_INTERVAL and time.time() > self.deadline:
+            raise SearchTimeout()
+
+        if len(empties) == 1:
+            return self.__last(own, opp, empties[0])
+
+        moves = self.__ordered_moves(own, opp, empties, parity)
+        if not moves:
+            if not moves_mask(opp, own):
+                return final_score(own, opp)
+            return -self.__solve(opp, own, empties, parity, -beta, -alpha)
+
+        for sq, flipped in moves:
+            score = -self.__solve(opp ^ flipped, own | flipped | (1 << sq),
+                                  [e for e in empties if e != sq],
+                                  parity ^ QUADRANT[sq], -beta, -alpha)
+            if score > alpha:
+                alpha = score
+                if alpha >= beta:
+                    break
+        return alpha
+
+    # Score of a position with one empty square left
+    def __last(self, own, opp, sq):
+        flipped = flips_mask(own, opp, sq)
+        if flipped:
+            return 2 * (popcount(own | flipped) + 1) - 64
+        flipped = flips_mask(opp, own, sq)
+        if flipped:
+            return 64 - 2 * (popcount(opp | flipped) + 1)
+        return final_score(own, opp)
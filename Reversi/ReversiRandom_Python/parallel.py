@@ -0,0 +1,206 @@
+################################################################################
+# PARALLEL SEARCH
+#
+# Lazy SMP search across processes. Every worker runs the normal iterative
+# deepening search on the same position, and they all share one transposition
+# table in shared memory, so the work one worker has done speeds up the
+# others. Worker 0 is the main search: it alone keeps to the depth and time
+# limits, its result is the result of the search, and once it is done it stops
+# the others. The other workers are helpers that fill the table ahead of it:
+# they run on, past the depth asked for, until they are stopped, and
+# odd-numbered helpers start one ply deeper than even-numbered ones, so the
+# workers are out of step instead of all searching the same depth at once.
+#
+# Helpers only pay off with a CPU for each worker; on fewer CPUs they take
+# time from the main search. RandomGuy therefore never runs more workers than
+# there are CPUs.
+#
+# call: python parallel.py [--workers N] [--depth D] [--positions P]
+#   reports the speedup of N workers over one worker at a fixed depth, and
+#   the speedup to expect with a CPU for every worker, from the nodes searched
+#
+import sys
+import time
+import random
+import argparse
+import multiprocessing
+from bitboard import Board, iter_bits, row_col
+from search import Searcher, MAX_DEPTH, evaluate
+from transposition import TranspositionTable
+
+
+def _worker(index, evaluate, tt, stop, jobs, results):
+    searcher = Searcher(evaluate, tt, verbose=False, stop=stop)
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        black, white, player, time_limit, max_depth, soft_limit = job
+        board = Board(black, white)
+        if index == 0:
+            move, score, depth = searcher.search(board, player, time_limit,
+                                                 max_depth, soft_limit)
+            # The main search is done, so the helpers can stop as well
+            stop.value = 1
+        else:
+            move, score, depth = searcher.search(board, player, time_limit,
+                                                 MAX_DEPTH, time_limit,
+                                                 1 + index % 2)
+        results.put((index, move, score, depth, searcher.nodes, searcher.pv))
+
+
+# ------------------------------------------------------------------------------
+# ParallelSearcher
+#
+# Drop-in replacement for Searcher that runs the search on a pool of worker
+# processes. The pool is started once and reused for every move.
+#
+class ParallelSearcher(object):
+
+    # Constructor
+    def __init__(self, workers=2, size_mb=16, verbose=True, evaluate=evaluate):
+        self.workers = workers
+        self.verbose = verbose
+        self.tt = TranspositionTable(size_mb, shared=True)
+        self.stop = multiprocessing.Value("b", 0, lock=False)
+        self.results = multiprocessing.Queue()
+        self.nodes = 0
+        self.total_nodes = 0
+        self.total_time = 0.0
+        self.pv = list()
+        self.__jobs = list()
+        self.__processes = list()
+        for i in range(workers):
+            jobs = multiprocessing.Queue()
+            p = multiprocessing.Process(target=_worker,
+                                        args=(i, evaluate, self.tt,
+                                              self.stop, jobs, self.results))
+            p.daemon = True
+            p.start()
+            self.__jobs.append(jobs)
+            self.__processes.append(p)
+
+    def search(self, board, player, time_limit=1.0, max_depth=MAX_DEPTH,
+               soft_limit=None):
+        """
+        Searches a position on every worker at once
+
+        :param board: The Board to search
+        :param player: The player to move (1 or 2)
+        :param time_limit: The hard limit in seconds
+        :param max_depth: The deepest iteration to run
+        :param soft_limit: No new iteration is started after this many seconds
+        :return: A (square, score, depth) tuple from the main search
+        """
+        start = time.time()
+        self.stop.value = 0
+        job = (board.discs[1], board.discs[2], player, time_limit, max_depth,
+               soft_limit)
+        for jobs in self.__jobs:
+            jobs.put(job)
+
+        best = None
+        self.nodes = 0
+        for i in range(self.workers):
+            index, move, score, depth, nodes, pv = self.results.get()
+            self.nodes += nodes
+            if index == 0:
+                best = (move, score, depth)
+                self.pv = pv
+
+        elapsed = time.time() - start
+        self.total_nodes += self.nodes
+        self.total_time += elapsed
+        if self.verbose and best[0] is not None:
+            nps = int(self.nodes / elapsed) if elapsed > 0 else 0
+            print "smp: workers {0} depth {1} move {2} score {3} nodes {4} " \
+                  "nps {5}".format(self.workers, best[2], row_col(best[0]),
+                                   best[1], self.nodes, nps)
+        return best[0], best[1], best[2]
+
+    # Shut the worker processes down
+    def close(self):
+        for jobs in self.__jobs:
+            jobs.put(None)
+        for p in self.__processes:
+            p.join()
+
+
+# ------------------------------------------------------------------------------
+# Speedup Benchmark
+#
+def random_positions(count, plies, seed=470):
+    """
+    Generates positions by playing random moves from the empty board
+
+    :param count: The number of positions
+    :param plies: The number of moves to play for each position
+    :param seed: The random seed
+    :return: A list of (board, player to move) tuples
+    """
+    rng = random.Random(seed)
+    positions = list()
+    while len(positions) < count:
+        board = Board()
+        player = 1
+        for i in range(plies):
+            moves = list(iter_bits(board.move_mask(player)))
+            if moves:
+                board.make(player, rng.choice(moves))
+            player = 3 - player
+        if len(board.valid_moves(player)) > 1:
+            positions.append((board, player))
+    return positions
+
+
+def time_to_depth(searcher, positions, depth):
+    """
+    Measures how long a searcher needs to complete a fixed depth
+
+    :param searcher: A Searcher or ParallelSearcher
+    :param positions: A list of (board, player to move) tuples
+    :param depth: The depth to search every position to
+    :return: A tuple of the total number of seconds and the total number of
+             nodes searched by every worker
+    """
+    start = time.time()
+    nodes = 0
+    for board, player in positions:
+        searcher.tt.clear()
+        searcher.search(board, player, 3600.0, depth, 3600.0)
+        nodes += searcher.nodes
+    return time.time() - start, nodes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument("--depth", type=int, default=6)
+    parser.add_argument("--positions", type=int, default=10)
+    parser.add_argument("--plies", type=int, default=20)
+    args = parser.parse_args()
+
+    positions = random_positions(args.positions, args.plies)
+    single, single_nodes = time_to_depth(Searcher(verbose=False), positions,
+                                         args.depth)
+    searcher = ParallelSearcher(args.workers, verbose=False)
+    multi, multi_nodes = time_to_depth(searcher, positions, args.depth)
+    searcher.close()
+
+    # With a CPU for every worker, each searches its share of the nodes at the
+    # same time, which gives the speedup to expect on enough CPUs even where
+    # the workers have to share fewer
+    print >> sys.stderr, "depth {0}, {1} positions, {2} CPUs".format(
+        args.depth, len(positions), multiprocessing.cpu_count())
+    print >> sys.stderr, "1 worker:  {0:.2f}s {1} nodes".format(single,
+                                                              single_nodes)
+    print >> sys.stderr, "{0} workers: {1:.2f}s {2} nodes".format(
+        args.workers, multi, multi_nodes)
+    print >> sys.stderr, "speedup: {0:.2f}x (with {1} CPUs: {2:.2f}x)".format(
+        single / multi, args.workers,
+        float(single_nodes) * args.workers / max(multi_nodes, 1))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+################################################################################
+# PATTERN EVALUATION
+#
+# Static evaluation from pattern tables. Each pattern is a fixed list of
+# squares (an edge, a line, a diagonal, a 3x3 corner); its contents are read
+# as a base-3 number (0 empty, 1 black, 2 white) and used to index a table of
+# weights. Every rotation and reflection of a pattern shares one table, and
+# there is a separate set of tables for each phase of the game. The score of
+# a position is the sum of one table entry per pattern instance.
+#
+# The evaluator keeps the index of every instance up to date as moves are
+# made and unmade during the search, so evaluating a leaf is just the table
+# lookups.
+#
+# The weights are fitted offline to the final disc margin of self-play games
+# recorded by arena.py (needs numpy):
+#
+# call: python patterns.py positions.txt [more.txt ...] [--out patterns.bin]
+#                          [--epochs E] [--rate R]
+#
+import sys
+import time
+import struct
+import argparse
+from array import array
+from bitboard import popcount, iter_bits
+
+MAGIC = "RVPT"
+VERSION = 1
+HEADER = struct.Struct("<4sIII")    # magic, version, phases, table size
+PHASES = 6
+SCALE = 100         # weights are stored in hundredths of a disc
+SHRINKAGE = 10.0    # pulls the weights of rarely seen patterns towards 0
+
+
+def _squares(cells):
+    return tuple(row * 8 + col for row, col in cells)
+
+
+# The patterns, each given by one of its instances
+PATTERNS = (
+    ("edge", _squares((0, c) for c in range(8))),
+    ("line2", _squares((1, c) for c in range(8))),
+    ("line3", _squares((2, c) for c in range(8))),
+    ("line4", _squares((3, c) for c in range(8))),
+    ("diag8", _squares((i, i) for i in range(8))),
+    ("diag7", _squares((i, i + 1) for i in range(7))),
+    ("diag6", _squares((i, i + 2) for i in range(6))),
+    ("diag5", _squares((i, i + 3) for i in range(5))),
+    ("diag4", _squares((i, i + 4) for i in range(4))),
+    ("corner", _squares((r, c) for r in range(3) for c in range(3))),
+)
+
+
+def _symmetries(sq):
+    row, col = sq >> 3, sq & 7
+    for r, c in ((row, col), (col, row)):
+        for rr, cc in ((r, c), (7 - r, c), (r, 7 - c), (7 - r, 7 - c)):
+            yield rr * 8 + cc
+
+
+def _instances():
+    instances = list()      # (table offset, squares)
+    offsets = list()
+    size = 0
+    for name, squares in PATTERNS:
+        offsets.append(size)
+        images = zip(*[list(_symmetries(sq)) for sq in squares])
+        seen = set()
+        for image in images:
+            if frozenset(image) not in seen:
+                seen.add(frozenset(image))
+                instances.append((size, image))
+        size += 3 ** len(squares)
+    return instances, offsets, size
+
+
+INSTANCES, OFFSETS, TABLE_SIZE = _instances()
+
+# UPDATES[sq] lists (instance, 3 ** position of sq in the instance)
+UPDATES = [list() for _sq in range(64)]
+for _i, (_offset, _squares_of) in enumerate(INSTANCES):
+    for _k, _sq in enumerate(_squares_of):
+        UPDATES[_sq].append((_i, 3 ** _k))
+UPDATES = [tuple(_u) for _u in UPDATES]
+
+# The weight set used at every disc count
+PHASE = [min(max(discs - 4, 0) * PHASES // 60, PHASES - 1)
+         for discs in range(65)]
+
+
+def pattern_indices(black, white):
+    """
+    Computes the table index of every pattern instance from scratch
+
+    :param black: The mask of black's discs
+    :param white: The mask of white's discs
+    :return: A list with one index per instance in INSTANCES
+    """
+    indices = list()
+    for offset, squares in INSTANCES:
+        index = offset
+        power = 1
+        for sq in squares:
+            if black >> sq & 1:
+                index += power
+            elif white >> sq & 1:
+                index += 2 * power
+            power *= 3
+        indices.append(index)
+    return indices
+
+
+def load_weights(filename):
+    """
+    Reads a weights file written by save_weights
+
+    :param filename: The name of the file
+    :return: A list with one array of weights per phase
+    """
+    with open(filename, "rb") as input_file:
+        magic, version, phases, size = HEADER.unpack(
+            input_file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION or phases != PHASES or \
+                size != TABLE_SIZE:
+            raise ValueError("{0} does not hold version {1} pattern "
+                             "weights".format(filename, VERSION))
+        weights = list()
+        for p in range(phases):
+            table = array("i")
+            table.fromfile(input_file, size)
+            weights.append(table)
+    return weights
+
+
+def save_weights(filename, weights):
+    """
+    Writes a weights file
+
+    :param filename: The name of the file
+    :param weights: A list with one array of weights per phase
+    """
+    with open(filename, "wb") as output_file:
+        output_file.write(HEADER.pack(MAGIC, VERSION, PHASES, TABLE_SIZE))
+        for table in weights:
+            table.tofile(output_file)
+
+
+# ------------------------------------------------------------------------------
+# PatternEvaluator
+#
+# Pattern evaluation for the Searcher. Unlike the plain evaluate function it
+# has state: reset() is called with the root position of every search, and
+# make()/unmake() with every move the search plays and takes back.
+#
+class PatternEvaluator(object):
+
+    # Constructor; 'weights' has one array per phase
+    def __init__(self, weights):
+        self.weights = weights
+        self.indices = list()
+        self.black = 0          # black's discs, to tell whose turn it is
+
+    # Start from 'board'
+    def reset(self, board):
+        self.indices = pattern_indices(board.discs[1], board.discs[2])
+        self.black = board.discs[1]
+
+    # 'player' plays 'sq', flipping the discs in 'flipped'
+    def make(self, player, sq, flipped):
+        indices = self.indices
+        for i, power in UPDATES[sq]:
+            indices[i] += player * power
+        # A flipped disc changes from 3 - player to player
+        change = 2 * player - 3
+        for f in iter_bits(flipped):
+            for i, power in UPDATES[f]:
+                indices[i] += change * power
+        if player == 1:
+            self.black |= flipped | (1 << sq)
+        else:
+            self.black &= ~flipped
+
+    # Take back the move of make()
+    def unmake(self, player, sq, flipped):
+        indices = self.indices
+        for i, power in UPDATES[sq]:
+            indices[i] -= player * power
+        change = 2 * player - 3
+        for f in iter_bits(flipped):
+            for i, power in UPDATES[f]:
+                indices[i] -= change * power
+        if player == 1:
+            self.black &= ~(flipped | (1 << sq))
+        else:
+            self.black |= flipped
+
+    def __call__(self, own, opp):
+        """
+        Evaluates the current position
+
+        :param own: The discs of the player to move
+        :param opp: The discs of the opponent
+        :return: The score of the position (positive is good for the player)
+        """
+        table = self.weights[PHASE[popcount(own | opp)]]
+        score = sum(map(table.__getitem__, self.indices))
+        if own & self.black or not opp & self.black:
+            return score
+        return -score
+
+
+# ------------------------------------------------------------------------------
+# Fitting
+#
+def read_positions(filenames):
+    """
+    Reads positions recorded by arena.py
+
+    :param filenames: The files to read
+    :return: A list of (black, white, margin) tuples, where margin is the final
+             disc difference from black's point of view
+    """
+    positions = list()
+    for filename in filenames:
+        with open(filename) as input_file:
+            for line in input_file:
+                black, white, player, margin = line.split()
+                positions.append((int(black), int(white), int(margin)))
+    return positions
+
+
+def fit(positions, epochs=200, rate=0.02, verbose=True):
+    """
+    Fits the weights of every phase to the final margins by least squares.
+    Each epoch moves every weight by its average error over the positions
+    that use it
+
+    :param positions: A list of (black, white, margin) tuples
+    :param epochs: The number of passes over the positions
+    :param rate: The step size
+    :param verbose: Print the error of every phase
+    :return: A list with one array of weights per phase
+    """
+    import numpy
+
+    features = [list() for p in range(PHASES)]
+    targets = [list() for p in range(PHASES)]
+    for black, white, margin in positions:
+        phase = PHASE[popcount(black | white)]
+        features[phase].append(pattern_indices(black, white))
+        targets[phase].append(margin)
+
+    weights = list()
+    for p in range(PHASES):
+        table = numpy.zeros(TABLE_SIZE)
+        if features[p]:
+            x = numpy.array(features[p], dtype=numpy.int64)
+            y = numpy.array(targets[p], dtype=numpy.float64)
+            flat = x.ravel()
+            counts = numpy.bincount(flat, minlength=TABLE_SIZE) + SHRINKAGE
+            for epoch in range(epochs):
+                error = y - table[x].sum(axis=1)
+                gradient = numpy.bincount(flat,
+                                          numpy.repeat(error, x.shape[1]),
+                                          TABLE_SIZE)
+                table += rate * gradient / counts
+            if verbose:
+                rmse = numpy.sqrt(numpy.mean((y - table[x].sum(axis=1)) ** 2))
+                print >> sys.stderr, "phase {0}: {1} positions, rms error " \
+                                     "{2:.2f} discs".format(p, len(y), rmse)
+        scaled = numpy.rint(table * SCALE).astype(int)
+        weights.append(array("i", scaled.tolist()))
+    return weights
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("positions", nargs="+")
+    parser.add_argument("--out", default="patterns.bin")
+    parser.add_argument("--epochs", type=int, default=200)
+    parser.add_argument("--rate", type=float, default=0.02)
+    args = parser.parse_args()
+
+    start = time.time()
+    positions = read_positions(args.positions)
+    weights = fit(positions, args.epochs, args.rate)
+    save_weights(args.out, weights)
+    print >> sys.stderr, "patterns: fitted {0} positions in {1:.0f}s, wrote " \
+                         "{2}".format(len(positions), time.time() - start,
+                                      args.out)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+################################################################################
+# PONDERING
+#
+# Searches on the opponent's time. After we send a move, a background thread
+# searches the position we expect to be in after the opponent's reply (the
+# reply predicted by our principal variation), or, when there is no
+# prediction, every possible reply in turn. The main thread keeps waiting for
+# the server in the meantime; a blocking recv() releases the interpreter lock,
+# so the search thread gets the CPU.
+#
+# When the opponent's move arrives and it was pondered (a ponder hit) the
+# search simply continues on the now-known position, and the search results
+# and transposition table entries are reused for our move. On a miss the
+# thread starts over on the actual position for whatever time is left.
+#
+import time
+import threading
+from bitboard import iter_bits
+from search import PASS
+
+SLICE = 0.1         # initial time per reply when pondering all replies
+FOREVER = 3600.0    # time limit of a ponder search; it is stopped explicitly
+
+
+class _Flag(object):
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+
+# ------------------------------------------------------------------------------
+# Ponderer
+#
+class Ponderer(object):
+
+    # Constructor
+    def __init__(self, searcher):
+        self.searcher = searcher
+        if searcher.stop is None:
+            searcher.stop = _Flag()
+        self.hits = 0
+        self.misses = 0
+        self.saved = 0.0        # seconds of our clock answered from pondering
+        self.__thread = None
+        self.__base = None      # position after our move (opponent to move)
+        self.__targets = list() # positions being pondered (we are to move)
+        self.__player = 0       # our player number in the pondered positions
+        self.__observed = False # the opponent's move has been seen
+        self.__result = None
+        self.__started = 0.0
+
+    def start(self, board, player, predicted=None):
+        """
+        Starts pondering after our move has been sent
+
+        :param board: The Board after our move
+        :param player: The opponent, who is to move
+        :param predicted: The reply predicted by our search, or None to ponder
+                          every reply
+        """
+        self.stop()
+        replies = list(iter_bits(board.move_mask(player)))
+        if not replies:
+            return
+        if predicted is not None and predicted != PASS and predicted in replies:
+            replies = [predicted]
+        targets = list()
+        for sq in replies:
+            child = board.copy()
+            child.make(player, sq)
+            targets.append(child)
+        self.__base = board.copy()
+        self.__observed = False
+        self.__run(targets, 3 - player)
+
+    def observe(self, board):
+        """
+        Called with every status update that arrives while pondering. Once the
+        board differs from the position after our move the opponent has moved,
+        and pondering is narrowed to (or restarted on) the actual position
+
+        :param board: The Board from the update
+        """
+        if self.__base is None or self.__observed or board == self.__base:
+            return
+        self.__observed = True
+        if len(self.__targets) == 1 and self.__targets[0] == board:
+            self.hits += 1
+            return
+        if board in self.__targets:
+            self.hits += 1
+        else:
+            self.misses += 1
+        self.stop()
+        self.__run([board.copy()], self.__player)
+
+    def finish(self, board, player):
+        """
+        Stops pondering when it is our turn
+
+        :param board: The Board we have to move in
+        :param player: Our player number
+        :return: A (move, score, depth, elapsed) tuple if the position was
+                 pondered, otherwise None
+        """
+        if self.__base is None:
+            return None
+        if not self.__observed:
+            if board == self.__base:
+                # The opponent passed, which is never pondered
+                self.misses += 1
+            else:
+                self.observe(board)
+        pondered = len(self.__targets) == 1 and self.__targets[0] == board \
+            and player == self.__player
+        elapsed = time.time() - self.__started
+        self.stop()
+        self.__base = None
+        if not pondered or self.__result is None:
+            return None
+        return self.__result + (elapsed,)
+
+    # Record how much of our own clock a ponder result replaced
+    def credit(self, seconds):
+        self.saved += seconds
+
+    # Stop the ponder thread and wait for it
+    def stop(self):
+        while self.__thread is not None and self.__thread.is_alive():
+            # Set the flag repeatedly; a searcher may clear it when it starts
+            self.searcher.stop.value = 1
+            self.__thread.join(0.01)
+        self.__thread = None
+        self.searcher.stop.value = 0
+
+    # Summary of the ponder statistics
+    def stats(self):
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        return "ponder: hits {0} misses {1} hit rate {2:.1f}% saved {3:.2f}s"\
+            .format(self.hits, self.misses, rate, self.saved)
+
+    # Start the ponder thread on 'targets' with 'player' to move
+    def __run(self, targets, player):
+        self.__targets = targets
+        self.__player = player
+        self.__result = None
+        self.__started = time.time()
+        self.searcher.stop.value = 0
+        self.__thread = threading.Thread(target=self.__ponder,
+                                         args=(targets, player))
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    # Thread body
+    def __ponder(self, targets, player):
+        if len(targets) == 1:
+            self.__result = self.searcher.search(targets[0], player, FOREVER,
+                                                 soft_limit=FOREVER)
+            return
+        # Cycle through every reply with growing time slices so that all of
+        # them get transposition table entries early on
+        slice = SLICE
+        while not self.searcher.stop.value:
+            for target in targets:
+                self.searcher.search(target, player, slice, soft_limit=slice)
+                if self.searcher.stop.value:
+                    return
+            slice *= 2
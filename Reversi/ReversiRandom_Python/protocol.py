@@ -0,0 +1,107 @@
+################################################################################
+# PROTOCOL
+#
+# Buffered reader for the Reversi server's socket protocol. The server sends
+# each status message as newline-terminated lines:
+#
+#   turn, round, t1, t2, then the 64 cells of state[row][col] in row-major order
+#
+# followed by an empty line, and a single "-999" line when the game is over.
+# TCP gives no guarantee that one recv() returns exactly one message, so the
+# reader keeps the bytes it has received and only parses a message once all
+# of its lines are there. Leftover bytes are kept for the next message.
+#
+from bitboard import Board
+
+GAME_OVER = -999
+BOARD_LINES = 64
+HEADER_LINES = 4
+
+
+# ------------------------------------------------------------------------------
+# MessageReader
+#
+class MessageReader(object):
+
+    # Constructor
+    def __init__(self, sock, bufsize=4096):
+        self.sock = sock
+        self.bufsize = bufsize
+        self.__buffer = ""
+
+    # Receive more bytes from the server
+    def __fill(self):
+        data = self.sock.recv(self.bufsize)
+        if not data:
+            raise EOFError("the server closed the connection")
+        self.__buffer += data
+
+    def read_line(self):
+        """
+        Reads a single line, such as the greeting sent when connecting
+
+        :return: The line without its line terminator
+        """
+        end = self.__buffer.find("\n")
+        while end < 0:
+            self.__fill()
+            end = self.__buffer.find("\n")
+        line = self.__buffer[:end].rstrip("\r")
+        self.__buffer = self.__buffer[end + 1:]
+        return line
+
+    def read_message(self):
+        """
+        Reads one complete status message, waiting for more data as needed
+
+        :return: A (turn, round, t1, t2, board) tuple. For the game over
+                 message turn is GAME_OVER and the other fields are None
+        """
+        message = self.__parse()
+        while message is None:
+            self.__fill()
+            message = self.__parse()
+        return message
+
+    # Parse one message from the front of the buffer, or return None if it
+    # has not been received completely
+    def __parse(self):
+        buf = self.__buffer
+        size = len(buf)
+        pos = 0
+        # Skip the empty line(s) left over from the previous message
+        while pos < size and buf[pos] in "\r\n":
+            pos += 1
+        end = buf.find("\n", pos)
+        if end < 0:
+            return None
+        turn = int(buf[pos:end])
+        if turn == GAME_OVER:
+            self.__buffer = buf[end + 1:]
+            return GAME_OVER, None, None, None, None
+        if buf.count("\n", end + 1) < HEADER_LINES - 1 + BOARD_LINES:
+            return None
+
+        pos = end + 1
+        end = buf.index("\n", pos)
+        round = int(buf[pos:end])
+        pos = end + 1
+        end = buf.index("\n", pos)
+        t1 = float(buf[pos:end])
+        pos = end + 1
+        end = buf.index("\n", pos)
+        t2 = float(buf[pos:end])
+        pos = end + 1
+
+        board = Board()
+        discs = board.discs
+        for sq in range(BOARD_LINES):
+            cell = buf[pos]
+            if cell == "1":
+                discs[1] |= 1 << sq
+            elif cell == "2":
+                discs[2] |= 1 << sq
+            pos = buf.index("\n", pos) + 1
+
+        self.__buffer = buf[pos:]
+        return turn, round, t1, t2, board
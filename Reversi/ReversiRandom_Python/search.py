@@ -0,0 +1,336 @@
+################################################################################
+# ALPHA-BETA SEARCH
+#
+# Negamax search with alpha-beta pruning and iterative deepening over the
+# bitboards from bitboard.py. Positions are passed around as (own, opp) mask
+# pairs from the point of view of the player to move, so making a move is just
+# a couple of xors and nothing ever has to be undone. The only exception is an
+# incremental evaluator (see patterns.py), which is told about every move made
+# and taken back.
+#
+import time
+from bitboard import CENTRE, FULL, moves_mask, flips_mask, popcount, \
+    iter_bits, row_col
+from transposition import TranspositionTable, zobrist_hash, update_hash, \
+    EXACT, LOWER, UPPER, NO_MOVE
+
+INFINITY = 1000000
+WIN_SCORE = 100000      # added to the disc differential of a finished game
+MAX_DEPTH = 60
+PASS = -1               # marks a pass in a principal variation
+CHECK_INTERVAL = 255    # the clock is checked every CHECK_INTERVAL + 1 nodes
+
+
+def _mask(*squares):
+    bits = 0
+    for sq in squares:
+        bits |= 1 << sq
+    return bits
+
+
+CORNERS = _mask(0, 7, 56, 63)
+X_SQUARES = _mask(9, 14, 49, 54)
+C_SQUARES = _mask(1, 6, 8, 15, 48, 55, 57, 62)
+EDGES = 0xFF818181818181FF & ~(CORNERS | C_SQUARES)
+
+# Static move ordering: corners first, then edges, then the interior, with the
+# X and C squares next to the corners last
+PRIORITY = [2] * 64
+for _sq in iter_bits(CORNERS):
+    PRIORITY[_sq] = 0
+for _sq in iter_bits(EDGES):
+    PRIORITY[_sq] = 1
+for _sq in iter_bits(X_SQUARES | C_SQUARES):
+    PRIORITY[_sq] = 3
+
+# Square weights used by the static evaluation, grouped by weight
+SQUARE_WEIGHTS = (
+    (100, CORNERS),
+    (-20, C_SQUARES),
+    (-50, X_SQUARES),
+    (10, _mask(2, 5, 16, 23, 40, 47, 58, 61)),
+    (5, _mask(3, 4, 24, 31, 32, 39, 59, 60)),
+    (-2, _mask(10, 11, 12, 13, 17, 22, 25, 30, 33, 38, 41, 46,
+               50, 51, 52, 53)),
+)
+MOBILITY_WEIGHT = 8
+
+
+# ------------------------------------------------------------------------------
+# Evaluation Helper Functions
+#
+def evaluate(own, opp):
+    """
+    Static evaluation of a position from the point of view of the player to
+    move, based on square weights and mobility
+
+    :param own: The discs of the player to move
+    :param opp: The discs of the opponent
+    :return: The score of the position (positive is good for the player)
+    """
+    score = 0
+    for weight, mask in SQUARE_WEIGHTS:
+        score += weight * (popcount(own & mask) - popcount(opp & mask))
+    mobility = popcount(moves_mask(own, opp)) - popcount(moves_mask(opp, own))
+    return score + MOBILITY_WEIGHT * mobility
+
+
+def final_score(own, opp):
+    """
+    Exact disc differential of a finished game. Like the server, the empty
+    squares are given to the winner
+
+    :param own: The discs of the player to move
+    :param opp: The discs of the opponent
+    :return: The final disc differential from the point of view of 'own'
+    """
+    diff = popcount(own) - popcount(opp)
+    if diff > 0:
+        diff += popcount(~(own | opp) & FULL)
+    elif diff < 0:
+        diff -= popcount(~(own | opp) & FULL)
+    return diff
+
+
+def legal_moves(own, opp):
+    """
+    Legal moves for the player to move, including the centre-placement rule
+    used during the first four rounds
+
+    :param own: The discs of the player to move
+    :param opp: The discs of the opponent
+    :return: A mask of the legal moves
+    """
+    if popcount(own | opp) < 4:
+        return CENTRE & ~(own | opp)
+    return moves_mask(own, opp)
+
+
+def order_moves(moves, hint=None):
+    """
+    Orders a mask of moves for searching: the hint (usually the best move
+    from the previous iteration) first, then by static square priority
+
+    :param moves: A mask of legal moves
+    :param hint: A square to try first, if it is legal
+    :return: A list of squares
+    """
+    ordered = sorted(iter_bits(moves), key=PRIORITY.__getitem__)
+    if hint is not None and hint in ordered:
+        ordered.remove(hint)
+        ordered.insert(0, hint)
+    return ordered
+
+
+# ------------------------------------------------------------------------------
+# SearchTimeout
+#
+# Raised inside the search when the time budget runs out.
+#
+class SearchTimeout(Exception):
+    pass
+
+
+# ------------------------------------------------------------------------------
+# Searcher
+#
+# Iterative deepening negamax search. The best move of every completed depth
+# is remembered so the search can be cut off at any time.
+#
+class Searcher(object):
+
+    # Constructor
+    def __init__(self, evaluate=evaluate, tt=None, verbose=True, stop=None):
+        self.evaluate = evaluate
+        # Evaluators with make/unmake follow the moves of the search
+        self.incremental = hasattr(evaluate, "make")
+        self.tt = tt if tt is not None else TranspositionTable()
+        self.verbose = verbose
+        self.stop = stop        # the search is abandoned once stop.value is set
+        self.nodes = 0
+        self.deadline = None
+        self.reports = list()   # one (depth, move, score, nodes, nps) per depth
+        self.total_nodes = 0
+        self.total_time = 0.0
+        self.pv = list()        # principal variation of the last completed depth
+        self.__partial = None
+
+    def search(self, board, player, time_limit=1.0, max_depth=MAX_DEPTH,
+               soft_limit=None, start_depth=1):
+        """
+        Searches a position with iterative deepening until the time limit or
+        the maximum depth is reached
+
+        :param board: The Board to search
+        :param player: The player to move (1 or 2)
+        :param time_limit: The hard limit; the search is cut off after this
+                           many seconds
+        :param max_depth: The deepest iteration to run
+        :param soft_limit: No new iteration is started after this many
+                           seconds; defaults to half of the hard limit
+        :param start_depth: The depth of the first iteration
+        :return: A (square, score, depth) tuple; square is None when the player
+                 has to pass
+        """
+        start = time.time()
+        self.deadline = start + time_limit
+        if soft_limit is None:
+            soft_limit = time_limit / 2.0
+        self.nodes = 0
+        self.reports = list()
+        self.pv = list()
+
+        own = board.discs[player]
+        opp = board.discs[3 - player]
+        moves = legal_moves(own, opp)
+        if not moves:
+            return None, 0, 0
+        if not moves & (moves - 1):
+            # Only one legal move, so there is nothing to search
+            return moves.bit_length() - 1, 0, 0
+
+        self.tt.new_search()
+        if self.incremental:
+            self.evaluate.reset(board)
+        key = zobrist_hash(board, player)
+        empties = popcount(~(own | opp) & FULL)
+        best = order_moves(moves)[0]
+        best_score = 0
+        depth = 0
+        try:
+            for d in range(min(start_depth, empties),
+                           min(max_depth, empties) + 1):
+                score, move, pv = self.__root(own, opp, player, key, moves, d)
+                best, best_score, depth = move, score, d
+                self.pv = pv
+                self.__report(d, move, score, start)
+                if time.time() - start > soft_limit:
+                    break
+        except SearchTimeout:
+            if self.__partial is not None and self.__partial[0] != best:
+                best, best_score = self.__partial
+        self.total_nodes += self.nodes
+        self.total_time += time.time() - start
+        if self.verbose:
+            print self.tt.stats()
+        return best, best_score, depth
+
+    # Raise SearchTimeout if the deadline has passed or the search was stopped
+    def check_time(self):
+        if time.time() > self.deadline or \
+                (self.stop is not None and self.stop.value):
+            raise SearchTimeout()
+
+    # Search every root move to depth 'depth'
+    def __root(self, own, opp, player, key, moves, depth):
+        alpha = -INFINITY
+        best = None
+        pv = list()
+        hint = self.pv[0] if self.pv else None
+        self.__partial = None
+        for sq in order_moves(moves, hint):
+            flipped = flips_mask(own, opp, sq)
+            child_pv = list()
+            if self.incremental:
+                self.evaluate.make(player, sq, flipped)
+            score = -self.__negamax(opp ^ flipped, own | flipped | (1 << sq),
+                                    3 - player,
+                                    update_hash(key, player, sq, flipped),
+                                    depth - 1, -INFINITY, -alpha, 1, child_pv,
+                                    sq == hint)
+            if self.incremental:
+                self.evaluate.unmake(player, sq, flipped)
+            if score > alpha:
+                alpha = score
+                best = sq
+                pv = [sq] + child_pv
+                self.__partial = (sq, score)
+        self.tt.store(key, depth, EXACT, alpha, best)
+        return alpha, best, pv
+
+    # Negamax with alpha-beta pruning. 'key' is the Zobrist hash of the
+    # position and 'player' the colour of 'own'. 'pv' is filled with the
+    # principal variation below this node; 'follow' is True while the path so
+    # far matches the principal variation of the previous iteration
+    def __negamax(self, own, opp, player, key, depth, alpha, beta, ply, pv,
+                  follow):
+        self.nodes += 1
+        if not self.nodes & CHECK_INTERVAL:
+            self.check_time()
+
+        moves = legal_moves(own, opp)
+        if not moves:
+            if not moves_mask(opp, own):
+                score = final_score(own, opp)
+                if score > 0:
+                    return WIN_SCORE + score
+                if score < 0:
+                    return -WIN_SCORE + score
+                return 0
+            child_pv = list()
+            follow = follow and len(self.pv) > ply and \
+                self.pv[ply] == PASS
+            score = -self.__negamax(opp, own, 3 - player,
+                                    update_hash(key, player, None, 0), depth,
+                                    -beta, -alpha, ply + 1, child_pv, follow)
+            if score > alpha:
+                pv[:] = [PASS] + child_pv
+            return score
+
+        if depth <= 0:
+            return self.evaluate(own, opp)
+
+        # Only the moves of the previous principal variation are followed;
+        # the move of a table entry is just a hint for the order
+        follow = follow and len(self.pv) > ply
+        hint = None
+        entry = self.tt.probe(key)
+        if entry is not None:
+            tt_depth, flag, tt_score, hint = entry
+            if tt_depth >= depth and not follow:
+                if flag == EXACT:
+                    return tt_score
+                if flag == LOWER and tt_score >= beta:
+                    return tt_score
+                if flag == UPPER and tt_score <= alpha:
+                    return tt_score
+        if follow:
+            hint = self.pv[ply]
+
+        alpha_orig = alpha
+        best = NO_MOVE
+        for sq in order_moves(moves, hint):
+            flipped = flips_mask(own, opp, sq)
+            child_pv = list()
+            if self.incremental:
+                self.evaluate.make(player, sq, flipped)
+            score = -self.__negamax(opp ^ flipped, own | flipped | (1 << sq),
+                                    3 - player,
+                                    update_hash(key, player, sq, flipped),
+                                    depth - 1, -beta, -alpha, ply + 1,
+                                    child_pv, follow and sq == hint)
+            if self.incremental:
+                self.evaluate.unmake(player, sq, flipped)
+            if score > alpha:
+                alpha = score
+                best = sq
+                pv[:] = [sq] + child_pv
+                if alpha >= beta:
+                    break
+
+        if alpha >= beta:
+            self.tt.store(key, depth, LOWER, alpha, best)
+        elif alpha > alpha_orig:
+            self.tt.store(key, depth, EXACT, alpha, best)
+        else:
+            self.tt.store(key, depth, UPPER, alpha, best)
+        return alpha
+
+    # Print the statistics for a completed depth
+    def __report(self, depth, move, score, start):
+        elapsed = time.time() - start
+        nps = int(self.nodes / elapsed) if elapsed > 0 else 0
+        self.reports.append((depth, move, score, self.nodes, nps))
+        if self.verbose:
+            print "depth {0}: move {1} score {2} nodes {3} nps {4}".format(
+                depth, row_col(move), score, self.nodes, nps)
@@ -0,0 +1,101 @@
+################################################################################
+# TIME MANAGER
+#
+# Turns the clock the server reports (t1/t2), the round and the number of
+# empty squares into a soft and a hard deadline for the next move. Iterative
+# deepening does not start a new depth after the soft limit and is cut off at
+# the hard limit, which is always well inside the remaining clock.
+#
+SAFETY_MARGIN = 1.0     # seconds of the clock that are never planned for
+LATENCY = 0.05          # per-move overhead: network and the server's own sleeps
+MIN_TIME = 0.02         # the shortest deadline ever handed out
+HARD_FACTOR = 3.0       # the hard limit is this many soft limits ...
+MAX_FRACTION = 0.25     # ... but never more than this share of the usable clock
+
+
+def phase_weight(empties):
+    """
+    Relative importance of a move by the number of empty squares. Opening
+    moves matter least (and are often answered by the book), the midgame
+    decides most games, and the endgame is handled by the exact solver
+
+    :param empties: The number of empty squares before the move
+    :return: The weight of the move
+    """
+    if empties > 50:
+        return 0.5
+    if empties > 36:
+        return 1.0
+    if empties > 20:
+        return 1.6
+    return 1.0
+
+
+# ------------------------------------------------------------------------------
+# TimeManager
+#
+# Spreads the usable clock over the moves we still expect to make in
+# proportion to their phase weight.
+#
+class TimeManager(object):
+
+    # Constructor
+    def __init__(self, safety=SAFETY_MARGIN, latency=LATENCY):
+        self.safety = safety
+        self.latency = latency
+
+    def moves_left(self, empties):
+        """
+        Estimates how many more moves we will make, ignoring passes
+
+        :param empties: The number of empty squares before our move
+        :return: The number of moves including this one
+        """
+        return max(1, (empties + 1) // 2)
+
+    def usable(self, remaining, empties):
+        """
+        The part of the clock that can be planned for after keeping the safety
+        margin and the expected per-move overhead in reserve
+
+        :param remaining: The number of seconds left on our clock
+        :param empties: The number of empty squares before our move
+        :return: The usable number of seconds
+        """
+        reserve = self.safety + self.latency * self.moves_left(empties)
+        return max(0.0, remaining - reserve)
+
+    def allocate(self, remaining, round, empties):
+        """
+        Computes the deadlines for the next move
+
+        :param remaining: The number of seconds left on our clock
+        :param round: The server's round counter
+        :param empties: The number of empty squares before our move
+        :return: A (soft, hard) tuple of seconds from now
+        """
+        usable = self.usable(remaining, empties)
+        if round < 4 or usable <= 0.0:
+            # Centre placements are not worth thinking about
+            return MIN_TIME, MIN_TIME
+
+        # Our future moves happen at every other empty count
+        total = 0.0
+        for e in range(empties, 0, -2):
+            total += phase_weight(e)
+        soft = usable * phase_weight(empties) / total
+        hard = min(soft * HARD_FACTOR, usable * MAX_FRACTION)
+        soft = max(MIN_TIME, min(soft, hard))
+        hard = max(soft, hard)
+        return soft, hard
+
+    def endgame_limit(self, remaining, empties, fraction):
+        """
+        The time the exact endgame solver may use
+
+        :param remaining: The number of seconds left on our clock
+        :param empties: The number of empty squares before our move
+        :param fraction: The largest share of the usable clock to spend
+        :return: The number of seconds
+        """
+        return self.usable(remaining, empties) * fraction
@@ -0,0 +1,187 @@
+################################################################################
+# TRANSPOSITION TABLE
+#
+# Zobrist hashing of Reversi positions and a fixed-size transposition table.
+# The table is a set of parallel, preallocated arrays so its memory use does
+# not grow during a game, no matter how many positions are searched.
+#
+import random
+import ctypes
+from array import array
+from multiprocessing.sharedctypes import RawArray
+from bitboard import iter_bits
+
+ZOBRIST_SEED = 470      # fixed so hashes are identical in every process
+
+# Bound types stored with each score
+EXACT = 0
+LOWER = 1               # the score is a lower bound (the search failed high)
+UPPER = 2               # the score is an upper bound (the search failed low)
+
+NO_MOVE = -1
+ENTRY_BYTES = 12        # lock (4) + score (4) + depth, flag, move and age (1 each)
+
+
+def _zobrist_keys():
+    rng = random.Random(ZOBRIST_SEED)
+    keys = [[0] * 64]
+    for p in (1, 2):
+        keys.append([rng.getrandbits(64) for sq in range(64)])
+    return keys, rng.getrandbits(64)
+
+
+# ZOBRIST[player][sq] is xored in while 'player' owns 'sq'; SIDE is xored in
+# while player 2 is to move. FLIP[sq] changes the owner of a disc on 'sq'.
+ZOBRIST, SIDE = _zobrist_keys()
+FLIP = [ZOBRIST[1][sq] ^ ZOBRIST[2][sq] for sq in range(64)]
+
+
+# ------------------------------------------------------------------------------
+# Hash Helper Functions
+#
+def zobrist_hash(board, player):
+    """
+    Computes the Zobrist hash of a position from scratch
+
+    :param board: The Board to hash
+    :param player: The player to move (1 or 2)
+    :return: A 64-bit hash of the discs and the side to move
+    """
+    key = SIDE if player == 2 else 0
+    for p in (1, 2):
+        for sq in iter_bits(board.discs[p]):
+            key ^= ZOBRIST[p][sq]
+    return key
+
+
+def update_hash(key, player, sq, flipped):
+    """
+    Incrementally updates a hash for 'player' playing on 'sq'. The side to
+    move is switched as part of the update
+
+    :param key: The hash of the position before the move
+    :param player: The player making the move (1 or 2)
+    :param sq: The square played; None for a pass
+    :param flipped: The mask of flipped discs
+    :return: The hash of the position after the move
+    """
+    key ^= SIDE
+    if sq is None:
+        return key
+    key ^= ZOBRIST[player][sq]
+    while flipped:
+        low = flipped & -flipped
+        key ^= FLIP[low.bit_length() - 1]
+        flipped ^= low
+    return key
+
+
+# ------------------------------------------------------------------------------
+# TranspositionTable
+#
+# A two-tier table: every bucket has a depth-preferred slot, which only gives
+# way to deeper (or stale) entries, and an always-replace slot that catches
+# everything else. Each slot stores the upper 32 bits of the key as a lock,
+# the search depth, the bound type, the score and the best move.
+#
+# A shared table lives in shared memory so that processes forked after it was
+# created all read and write the same entries. Access is not locked; a torn
+# entry can at worst give a wrong score or an illegal hash move, and illegal
+# hash moves are ignored by the search.
+#
+class TranspositionTable(object):
+
+    # Constructor; 'size_mb' is the memory budget in megabytes
+    def __init__(self, size_mb=16, shared=False):
+        buckets = 1
+        while buckets * 4 * ENTRY_BYTES <= size_mb * 1024 * 1024:
+            buckets *= 2
+        self.mask = buckets - 1
+        self.size = buckets * 2
+        self.shared = shared
+        if shared:
+            self.locks = RawArray("I", self.size)
+            self.scores = RawArray("i", self.size)
+            self.depths = RawArray("b", self.size)
+            self.flags = RawArray("b", self.size)
+            self.moves = RawArray("b", self.size)
+            self.ages = RawArray("B", self.size)
+            ctypes.memset(self.depths, -1, self.size)
+        else:
+            self.locks = array("I", [0]) * self.size
+            self.scores = array("i", [0]) * self.size
+            self.depths = array("b", [-1]) * self.size
+            self.flags = array("b", [EXACT]) * self.size
+            self.moves = array("b", [NO_MOVE]) * self.size
+            self.ages = array("B", [0]) * self.size
+        self.age = 0
+        self.hits = 0
+        self.misses = 0
+        self.collisions = 0
+
+    # Start a new search; entries from older searches become replaceable
+    def new_search(self):
+        self.age = (self.age + 1) & 255
+
+    # Empty the table and reset the counters
+    def clear(self):
+        if self.shared:
+            ctypes.memset(self.depths, -1, self.size)
+        else:
+            self.depths = array("b", [-1]) * self.size
+        self.age = 0
+        self.hits = self.misses = self.collisions = 0
+
+    def probe(self, key):
+        """
+        Looks up a position
+
+        :param key: The Zobrist hash of the position
+        :return: A (depth, flag, score, move) tuple, or None if the position is
+                 not in the table
+        """
+        i = (key & self.mask) << 1
+        lock = key >> 32
+        depths = self.depths
+        if depths[i] >= 0 and self.locks[i] == lock:
+            self.hits += 1
+            return depths[i], self.flags[i], self.scores[i], self.moves[i]
+        if depths[i + 1] >= 0 and self.locks[i + 1] == lock:
+            self.hits += 1
+            return (depths[i + 1], self.flags[i + 1], self.scores[i + 1],
+                    self.moves[i + 1])
+        self.misses += 1
+        if depths[i] >= 0 or depths[i + 1] >= 0:
+            # The bucket is held by other positions
+            self.collisions += 1
+        return None
+
+    def store(self, key, depth, flag, score, move):
+        """
+        Stores the result of a search
+
+        :param key: The Zobrist hash of the position
+        :param depth: The depth the position was searched to
+        :param flag: EXACT, LOWER or UPPER
+        :param score: The score of the position
+        :param move: The best move found, or NO_MOVE
+        """
+        i = (key & self.mask) << 1
+        lock = key >> 32
+        if self.locks[i] != lock and depth < self.depths[i] and \
+                self.ages[i] == self.age:
+            # Keep the deeper entry and use the always-replace slot instead
+            i += 1
+        self.locks[i] = lock
+        self.depths[i] = depth
+        self.flags[i] = flag
+        self.scores[i] = score
+        self.moves[i] = move
+        self.ages[i] = self.age
+
+    # Summary of the table counters
+    def stats(self):
+        probes = self.hits + self.misses
+        rate = 100.0 * self.hits / probes if probes else 0.0
+        return "tt: hits {0} misses {1} collisions {2} hit rate {3:.1f}%".format(
+            self.hits, self.misses, self.collisions, rate)
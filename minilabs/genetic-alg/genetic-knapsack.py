@@ -2,95 +2,31 @@
 # Implementation for solving the Knapsack Problem using a Genetic Algorithm
 #
 import os
-import re
+import sys
 import random
 import numpy
 import time
-import copy
-from collections import defaultdict
+import multiprocessing
+from Queue import Empty
+from collections import defaultdict, OrderedDict
 
 ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_DIR = os.path.join(ROOT_DIR, "data/")
 
+# The shared knapsack package lives next to this minilab
+sys.path.insert(0, os.path.dirname(ROOT_DIR))
+from knapsack import exact, instances, model
+from knapsack.instrument import clock
+
 
 # ------------------------------------------------------------------------------
 # Knapsack
 #
-# Class representing a knapsack in the Knapsack Problem.
+# The shared Knapsack class (knapsack/model.py) with the genetic operators.
 #
-class Knapsack:
-
-    # Constructor
-    def __init__(self, objs=list(), weight=0, value=0, max_weight=0):
-        self.__objects = copy.deepcopy(objs)
-        self.__weight = weight
-        self.__value = value
-        self.__max_weight = max_weight
-
-    # Getter/Setter for objects list
-    def objects(self, objs=None):
-        if objs is None:
-            return self.__objects
-        else:
-            self.__objects = objs
-
-    # Add an object 'obj' to the list of objects
-    def add_object(self, obj):
-        if obj[0] + self.weight() > self.max_weight():
-            return False
-        self.__objects.append(obj)
-        self.__weight += obj[0]
-        self.__value += obj[1]
-        return True
-
-    # Remove an object 'obj' from the list of objects
-    def remove_object(self, obj):
-        if obj not in self.__objects:
-            return False
-        self.__objects.remove(obj)
-        self.__weight -= obj[0]
-        self.__value -= obj[1]
-        return True
-
-    # Getter/Setter for the knapsack weight
-    def weight(self, w=None):
-        if w is None:
-            return self.__weight
-        else:
-            self.__weight = w
-
-    # Getter/Setter for the knapsack's maximum weight limit
-    def max_weight(self, mw=None):
-        if mw is None:
-            return self.__max_weight
-        else:
-            self.__max_weight = mw
+class Knapsack(model.Knapsack):
 
-    # Getter/Setter for the knapsack's overall value
-    def value(self, v=None):
-        if v is None:
-            return self.__value
-        else:
-            self.__value = v
-
-    # Fill the knapsack to capacity randomly using the provided objects
-    def fill(self, objects, threshold=10, pack=False):
-        obj = random.choice(objects)
-        while self.add_object(obj):
-            obj = random.choice(objects)
-        if pack:
-            weight_diff = self.max_weight() - self.weight()
-            while self.weight() > self.max_weight() - threshold:
-                found_none = True
-                for o in objects:
-                    if o[0] <= weight_diff:
-                        self.add_object(o)
-                        found_none = False
-                        break
-                if found_none:
-                    obj = random.choice(self.objects())
-                    self.remove_object(obj)
-                weight_diff = self.max_weight() - self.weight()
+    __slots__ = ()
 
     # Cross this instances object list with another list of objects
     # NOTE: This function is genetic algorithm specific
@@ -133,55 +69,154 @@ class Knapsack:
             old_obj = self.objects()[pos]
             index = numpy.random.choice(len(objs))
             obj = objs[index]
-        self.objects()[pos] = obj
-        self.weight(self.weight() - old_obj[0] + obj[0])
-        self.value(self.value() - old_obj[1] + obj[1])
-
-    # toString method (used when str() is called on the knapsack object)
-    def __str__(self):
-        outstr = "---------- KNAPSACK CONTENTS ------------\n"
-        outstr += "Weight: {0}/{1}\t\tValue: {2}\n".format(self.weight(),
-                                                           self.max_weight(),
-                                                           self.value())
-
-        contents = defaultdict(int)
-        for o in self.objects():
-            contents[o] += 1
-        outstr += "Object\t\t\tCount\n"
-        for c in contents.keys():
-            outstr += "{0}\t\t\t{1}\n".format(c, contents[c])
-        return outstr
+        self.swap(pos, obj)
+
+
+# ------------------------------------------------------------------------------
+# KnapsackPopulation
+#
+# A whole population of knapsacks stored as NumPy arrays, used by the array
+# engine of genetic_knapsack. Row i of 'genes' holds the indices of the
+# objects in knapsack i in order, padded at the end with an extra index
+# ('empty') that stands for an object of weight and value 0. The weight and
+# value of every knapsack are kept in 'weights' and 'values'.
+#
+class KnapsackPopulation:
+
+    # Constructor; 'genes' rows are object indices padded with len(objs)
+    def __init__(self, objs, maxw, genes):
+        self.objs = objs
+        self.maxw = maxw
+        self.empty = len(objs)
+        self.object_weights = numpy.array([o[0] for o in objs] + [0])
+        self.object_values = numpy.array([o[1] for o in objs] + [0])
+        self.genes = genes
+        self.weights = None
+        self.values = None
+        self.totals()
+
+    # Number of knapsacks in the population
+    def size(self):
+        return self.genes.shape[0]
+
+    # Recompute the weight and value of every knapsack in one pass
+    def totals(self):
+        self.weights = self.object_weights[self.genes].sum(axis=1)
+        self.values = self.object_values[self.genes].sum(axis=1)
+
+    # Number of objects in every knapsack
+    def lengths(self):
+        return (self.genes != self.empty).sum(axis=1)
+
+    # Move the padding of every row to the end, keeping the order of the
+    # objects
+    def compact(self):
+        order = numpy.argsort(self.genes == self.empty, axis=1,
+                              kind="mergesort")
+        self.genes = numpy.take_along_axis(self.genes, order, axis=1)
+
+    # Replace the population with the children of rows 'x' and 'y': child i
+    # takes the objects of x[i] before its crossover point and those of y[i]
+    # from it on, like Knapsack.cross
+    def cross(self, x, y):
+        lengths = self.lengths()
+        shorter = numpy.minimum(lengths[x], lengths[y])
+        high = numpy.maximum(3 * shorter // 2, 1)
+        points = (numpy.random.random(len(x)) * high).astype(int)
+        columns = numpy.arange(self.genes.shape[1])
+        genes = numpy.where(columns < points[:, None], self.genes[x],
+                            self.genes[y])
+        self.genes = genes
+        self.compact()
+        self.repair()
+
+    # Cut every overweight knapsack back to its longest prefix that fits
+    def repair(self):
+        cumulative = self.object_weights[self.genes].cumsum(axis=1)
+        over = cumulative > self.maxw
+        if over.any():
+            self.genes[over] = self.empty
+        self.totals()
+
+    # Replace one object in a fraction 'rate' of the knapsacks with a random
+    # object, like Knapsack.mutate. Replacements that do not fit are drawn
+    # again, up to 'tries' times
+    def mutate(self, rate=0.1, tries=20):
+        rows = numpy.flatnonzero(numpy.random.random(self.size()) < rate)
+        for t in range(tries):
+            if len(rows) == 0:
+                break
+            # Like Knapsack.mutate, never pick the last object
+            high = numpy.maximum(self.lengths()[rows] - 1, 1)
+            positions = (numpy.random.random(len(rows)) * high).astype(int)
+            new = numpy.random.randint(0, len(self.objs), len(rows))
+            old = self.genes[rows, positions]
+            change = self.object_weights[new] - self.object_weights[old]
+            fits = self.weights[rows] + change <= self.maxw
+            self.genes[rows[fits], positions[fits]] = new[fits]
+            self.weights[rows[fits]] += change[fits]
+            self.values[rows[fits]] += self.object_values[new[fits]] - \
+                self.object_values[old[fits]]
+            rows = rows[~fits]
+
+    # Copy of the rows of the 'count' most valuable knapsacks, for migration
+    def top(self, count):
+        best = numpy.argsort(self.values)[-count:]
+        return self.genes[best].copy()
+
+    # Replace the least valuable knapsacks with 'rows' from another
+    # population, padding or cutting them to this population's width
+    def receive(self, rows):
+        width = self.genes.shape[1]
+        if rows.shape[1] < width:
+            padding = numpy.full((rows.shape[0], width - rows.shape[1]),
+                                 self.empty, dtype=rows.dtype)
+            rows = numpy.hstack((rows, padding))
+        worst = numpy.argsort(self.values)[:rows.shape[0]]
+        self.genes[worst] = rows[:, :width]
+        self.totals()
+
+    # Knapsack object for row 'i'
+    def knapsack(self, i):
+        objs = [self.objs[g] for g in self.genes[i] if g != self.empty]
+        return Knapsack(objs, int(self.weights[i]), int(self.values[i]),
+                        self.maxw)
+
+
+# ------------------------------------------------------------------------------
+# Random Population
+#
+# Fill 'popsize' knapsacks the same way genetic_knapsack does and store them as
+# a KnapsackPopulation
+#
+def random_population(objs, maxw, popsize):
+    # Index of the first copy of every object
+    index = dict()
+    for i, o in enumerate(objs):
+        index.setdefault(o, i)
+    rows = list()
+    for i in range(popsize):
+        k = Knapsack()
+        k.max_weight(maxw)
+        k.fill(objs, pack=True)
+        rows.append([index[o] for o in k.objects()])
+    width = max(len(r) for r in rows)
+    genes = numpy.full((popsize, width), len(objs), dtype=numpy.int64)
+    for i, r in enumerate(rows):
+        genes[i, :len(r)] = r
+    return KnapsackPopulation(objs, maxw, genes)
 
 
 # ------------------------------------------------------------------------------
 # Parse
 #
 # Parse the lisp formatted contents from the provided file into an object list
-# and max_weight value
+# and max_weight value (see knapsack/instances.py, which also reads the other
+# instance formats)
 #
 def parse(filename):
-    if os.path.exists(filename):
-        with open(filename, "r") as input_file:
-            o = list()
-            mw = 0
-            pair_pattern = re.compile("\([0-9]?[0-9] \. [0-9]?[0-9]\)")
-            weight_pattern = re.compile("\(setq MaxWeight [0-9][0-9][0-9]\)")
-            for line in input_file:
-                sline = line.strip()
-                match = pair_pattern.match(sline)
-                if match is not None:
-                    str_val = match.group(0)[1:-1]
-                    vals = str_val.split(" . ")
-                    obj = (int(vals[0]), int(vals[1]))
-                    o.append(obj)
-                else:
-                    match = weight_pattern.match(sline)
-                    if match is not None:
-                        s = match.group(0)
-                        mw = int(s.split(" ")[-1][:-1])
-
-            input_file.close()
-    return o, mw
+    weights, values, mw = instances.load_instance(filename, "lisp")
+    return instances.objects(weights, values), mw
 
 
 # ------------------------------------------------------------------------------
@@ -228,6 +263,451 @@ def knapsack_fitness_combo(population):
     return fitness
 
 
+# ------------------------------------------------------------------------------
+# Fitness Functions for a KnapsackPopulation
+#
+# The fitness functions above in terms of the weights and values of a whole
+# KnapsackPopulation, so the array engine can score a generation in one pass.
+# Each returns the scores before normalisation
+#
+FITNESS_TOTALS = {
+    knapsack_fitness: lambda weights, values: values,
+    knapsack_fitness_weight: lambda weights, values: weights,
+    knapsack_fitness_combo: lambda weights, values: weights + values,
+}
+
+
+# ------------------------------------------------------------------------------
+# Fitness of a KnapsackPopulation
+#
+# Returns the selection probability of every knapsack. Fitness functions
+# without an entry in FITNESS_TOTALS are called with a list of Knapsack objects
+#
+def population_fitness(population, fitfunc):
+    totals = FITNESS_TOTALS.get(fitfunc)
+    if totals is None:
+        knapsacks = [population.knapsack(i) for i in range(population.size())]
+        return numpy.array(fitfunc(knapsacks), dtype=float)
+    scores = totals(population.weights, population.values).astype(float)
+    total = scores.sum()
+    if total <= 0:
+        return numpy.full(len(scores), 1.0 / len(scores))
+    return scores / total
+
+
+# ------------------------------------------------------------------------------
+# Fitness Scores of a Knapsack
+#
+# The fitness functions above for a single knapsack, before normalisation. A
+# FitnessCache needs one of these (or a function like them) to score the
+# knapsacks it has not seen before
+#
+FITNESS_SCORES = {
+    knapsack_fitness: lambda k: k.value(),
+    knapsack_fitness_weight: lambda k: k.weight(),
+    knapsack_fitness_combo: lambda k: k.weight() + k.value(),
+}
+
+
+# ------------------------------------------------------------------------------
+# FitnessCache
+#
+# Remembers the fitness score of every knapsack it has scored, keyed by its
+# totals, its length and its digest (Knapsack.digest, a hash of its objects
+# that does not depend on their order and is kept up to date as objects are
+# added, removed and swapped), so knapsacks holding the same objects in any
+# order share one entry and are only scored once. (The totals are part of the
+# key because Knapsack.cross can leave a knapsack whose totals leave out the
+# last of its objects.) Two different knapsacks share an entry only if their
+# totals, lengths and digests all collide. The least recently used entries
+# are dropped once the (estimated) size of the cache passes 'max_bytes'.
+#
+class FitnessCache:
+
+    # Rough size of an entry on top of its key: the score, the dictionary slot
+    # and the link of the OrderedDict
+    ENTRY_BYTES = 160
+
+    # Constructor; 'score' maps a Knapsack to its unnormalised fitness
+    def __init__(self, score, max_bytes=64 * 1024 * 1024):
+        self.score = score
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__entries = OrderedDict()
+
+    # Number of knapsacks in the cache
+    def __len__(self):
+        return len(self.__entries)
+
+    # The fitness score of knapsack 'k', from the cache if possible
+    def lookup(self, k):
+        key = (k.weight(), k.value(), len(k), k.digest())
+        entries = self.__entries
+        if key in entries:
+            # Move the entry to the end, which is the most recently used
+            score = entries.pop(key)
+            entries[key] = score
+            self.hits += 1
+            return score
+        self.misses += 1
+        score = self.score(k)
+        entries[key] = score
+        self.size += self.__entry_bytes(key)
+        while self.size > self.max_bytes and len(entries) > 1:
+            old_key, old_score = entries.popitem(last=False)
+            self.size -= self.__entry_bytes(old_key)
+            self.evictions += 1
+        return score
+
+    # Summary of the cache statistics
+    def stats(self):
+        total = self.hits + self.misses
+        rate = 100.0 * self.hits / total if total else 0.0
+        return "gk: fitness cache hits {0} misses {1} hit rate {2:.1f}% " \
+               "entries {3} evictions {4}".format(self.hits, self.misses,
+                                                  rate, len(self),
+                                                  self.evictions)
+
+    # Size of the entry of 'key', counting the numbers in the key
+    def __entry_bytes(self, key):
+        return sys.getsizeof(key) + sum(sys.getsizeof(n) for n in key) + \
+            self.ENTRY_BYTES
+
+
+# ------------------------------------------------------------------------------
+# FitnessCache for a Fitness Function
+#
+# Returns a FitnessCache that scores knapsacks like 'fitfunc', which must be
+# one of the fitness functions in FITNESS_SCORES
+#
+def fitness_cache(fitfunc, max_bytes=64 * 1024 * 1024):
+    score = FITNESS_SCORES.get(fitfunc)
+    if score is None:
+        raise ValueError("no per-knapsack score for {0}; create a "
+                         "FitnessCache with one".format(fitfunc.__name__))
+    return FitnessCache(score, max_bytes)
+
+
+# ------------------------------------------------------------------------------
+# FitnessTable
+#
+# The fitness of a generation, built up one knapsack at a time as it is added
+# to the generation: every knapsack is scored through a FitnessCache, and the
+# running total and the cumulative scores grow with it, so nothing has to be
+# summed up or normalised again once the generation is complete. The parents
+# of the next generation are drawn from the cumulative scores as they are.
+#
+class FitnessTable:
+
+    # Constructor; scores the knapsacks of 'population' through 'cache'
+    def __init__(self, cache, population=()):
+        self.cache = cache
+        self.scores = list()
+        self.cumulative = list()
+        self.total = 0
+        for k in population:
+            self.add(k)
+
+    # Score knapsack 'k' and add it to the table
+    def add(self, k):
+        score = self.cache.lookup(k)
+        self.scores.append(score)
+        self.total += score
+        self.cumulative.append(self.total)
+
+    # Draw 'count' parents with 'selection'; a RouletteSelection draws from
+    # the cumulative scores, and other strategies are given the scores
+    def select(self, selection, count):
+        if isinstance(selection, RouletteSelection):
+            return selection.draw(numpy.array(self.cumulative, dtype=float),
+                                  count)
+        return selection.select(self.scores, count)
+
+
+# ------------------------------------------------------------------------------
+# Selection Strategies
+#
+# A selection strategy picks the parents of a whole generation in one call:
+# select(scores, count) takes the fitness score of every knapsack (any
+# non-negative numbers; they need not be normalised) and returns a NumPy array
+# of 'count' knapsack indices. genetic_knapsack pairs the first half of the
+# indices with the second half.
+#
+
+# ------------------------------------------------------------------------------
+# Alias Table
+#
+# Builds the tables of Vose's alias method for the distribution 'p', which
+# must sum to 1. A draw picks a column uniformly, then keeps it with
+# probability prob[column] or takes alias[column] otherwise
+#
+def alias_table(p):
+    n = len(p)
+    prob = numpy.zeros(n)
+    alias = numpy.zeros(n, dtype=int)
+    scaled = list(numpy.asarray(p, dtype=float) * n)
+    small = [i for i in range(n) if scaled[i] < 1.0]
+    large = [i for i in range(n) if scaled[i] >= 1.0]
+    while small and large:
+        s = small.pop()
+        l = large.pop()
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] -= 1.0 - scaled[s]
+        if scaled[l] < 1.0:
+            small.append(l)
+        else:
+            large.append(l)
+    # What is left over is 1 up to rounding errors
+    for i in small + large:
+        prob[i] = 1.0
+    return prob, alias
+
+
+# ------------------------------------------------------------------------------
+# RouletteSelection
+#
+# Fitness-proportionate selection, like numpy.random.choice with p=fitness:
+# the cumulative scores are summed up once per generation, in O(n), and every
+# draw after that is a binary search over them, in O(log n). The scores need
+# not be normalised. draw() takes the cumulative scores directly, for callers
+# that sum them up as they go (see FitnessTable).
+#
+class RouletteSelection:
+
+    def select(self, scores, count):
+        return self.draw(numpy.cumsum(numpy.asarray(scores, dtype=float)),
+                         count)
+
+    # Draw 'count' indices given the cumulative scores
+    def draw(self, cumulative, count):
+        n = len(cumulative)
+        total = cumulative[-1]
+        if total <= 0:
+            return numpy.random.randint(0, n, count)
+        picks = numpy.searchsorted(cumulative,
+                                   numpy.random.random(count) * total,
+                                   side="right")
+        return numpy.minimum(picks, n - 1)
+
+
+# ------------------------------------------------------------------------------
+# AliasSelection
+#
+# Fitness-proportionate selection with the alias method: building the tables
+# is O(n) once per generation, and every draw after that is O(1).
+#
+class AliasSelection:
+
+    def select(self, scores, count):
+        scores = numpy.asarray(scores, dtype=float)
+        n = len(scores)
+        total = scores.sum()
+        if total <= 0:
+            return numpy.random.randint(0, n, count)
+        prob, alias = alias_table(scores / total)
+        columns = numpy.random.randint(0, n, count)
+        keep = numpy.random.random(count) < prob[columns]
+        return numpy.where(keep, columns, alias[columns])
+
+
+# ------------------------------------------------------------------------------
+# TournamentSelection
+#
+# Every parent is the fittest of 'size' knapsacks drawn uniformly at random.
+# Only the order of the scores matters, and larger tournaments select harder.
+#
+class TournamentSelection:
+
+    # Constructor
+    def __init__(self, size=2):
+        self.size = size
+
+    def select(self, scores, count):
+        scores = numpy.asarray(scores, dtype=float)
+        entrants = numpy.random.randint(0, len(scores), (count, self.size))
+        winners = numpy.argmax(scores[entrants], axis=1)
+        return entrants[numpy.arange(count), winners]
+
+
+# ------------------------------------------------------------------------------
+# RankSelection
+#
+# Linear ranking: the knapsacks are sorted by score and the one of rank r (0
+# for the least fit) is picked with weight (2 - pressure) + 2 * (pressure - 1)
+# * r / (n - 1), so the fittest knapsack is 'pressure' times as likely as
+# average whatever the spread of the scores. 'pressure' is between 1 and 2.
+#
+class RankSelection:
+
+    # Constructor
+    def __init__(self, pressure=1.5):
+        self.pressure = pressure
+
+    def select(self, scores, count):
+        scores = numpy.asarray(scores, dtype=float)
+        n = len(scores)
+        ranks = numpy.empty(n)
+        ranks[numpy.argsort(scores, kind="mergesort")] = numpy.arange(n)
+        weights = (2 - self.pressure) + \
+            2 * (self.pressure - 1) * ranks / max(n - 1, 1)
+        return AliasSelection().select(weights, count)
+
+
+# ------------------------------------------------------------------------------
+# StochasticUniversalSampling
+#
+# Fitness-proportionate selection with a single spin: 'count' evenly spaced
+# pointers are laid over the cumulative scores, so a knapsack is picked
+# within one of its expected number of times. The parents are shuffled
+# afterwards, because the pointers pick them in population order.
+#
+class StochasticUniversalSampling:
+
+    def select(self, scores, count):
+        cumulative = numpy.cumsum(numpy.asarray(scores, dtype=float))
+        total = cumulative[-1]
+        if total <= 0:
+            return numpy.random.randint(0, len(cumulative), count)
+        pointers = (numpy.random.random() + numpy.arange(count)) * \
+            (total / count)
+        parents = numpy.searchsorted(cumulative, pointers, side="right")
+        parents = numpy.minimum(parents, len(cumulative) - 1)
+        numpy.random.shuffle(parents)
+        return parents
+
+
+SELECTIONS = {
+    "roulette": RouletteSelection,
+    "alias": AliasSelection,
+    "tournament": TournamentSelection,
+    "rank": RankSelection,
+    "sus": StochasticUniversalSampling,
+}
+
+
+# ------------------------------------------------------------------------------
+# Elites
+#
+# Indices of the 'count' knapsacks with the highest 'scores', best first
+#
+def elites(scores, count):
+    if count <= 0:
+        return numpy.zeros(0, dtype=int)
+    order = numpy.argsort(numpy.asarray(scores, dtype=float),
+                          kind="mergesort")
+    return order[::-1][:count]
+
+
+# ------------------------------------------------------------------------------
+# Crossover Strategies
+#
+# cross(child, other) replaces the objects of the Knapsack 'child' (a copy of
+# the first parent) with a mix of its own and those of 'other', and leaves it
+# within its weight limit.
+#
+
+# One-point crossover; Knapsack.cross
+class OnePointCrossover:
+
+    def cross(self, child, other):
+        child.cross(other.objects())
+
+
+# Uniform crossover: position i of the child comes from either parent with
+# equal probability ('rate' is the chance of taking the other parent's
+# object). Objects past the end of the shorter parent come from the longer
+# one. The child is then cut back to the longest prefix that fits
+class UniformCrossover:
+
+    # Constructor
+    def __init__(self, rate=0.5):
+        self.rate = rate
+
+    def cross(self, child, other):
+        mine = child.objects()
+        theirs = other.objects()
+        take = numpy.random.random(max(len(mine), len(theirs))) < self.rate
+        objects = list()
+        for i in range(len(take)):
+            if i >= len(mine) or (take[i] and i < len(theirs)):
+                objects.append(theirs[i])
+            else:
+                objects.append(mine[i])
+        weight = 0
+        value = 0
+        for pos in range(len(objects)):
+            if weight + objects[pos][0] > child.max_weight():
+                objects = objects[:pos]
+                break
+            weight += objects[pos][0]
+            value += objects[pos][1]
+        child.objects(objects)
+        child.weight(weight)
+        child.value(value)
+
+
+CROSSOVERS = {
+    "onepoint": OnePointCrossover,
+    "uniform": UniformCrossover,
+}
+
+
+# ------------------------------------------------------------------------------
+# Mutation Strategies
+#
+# mutate(child, objs) changes the Knapsack 'child' in place using the
+# available objects 'objs', keeping it within its weight limit.
+#
+
+# With probability 'rate', replace one object; Knapsack.mutate
+class PointMutation:
+
+    # Constructor
+    def __init__(self, rate=0.1):
+        self.rate = rate
+
+    def mutate(self, child, objs):
+        if numpy.random.random() < self.rate:
+            child.mutate(objs)
+
+
+# With probability 'rate', replace 'bits' objects (the same position may be
+# picked more than once)
+class MultiPointMutation:
+
+    # Constructor
+    def __init__(self, rate=0.1, bits=3):
+        self.rate = rate
+        self.bits = bits
+
+    def mutate(self, child, objs):
+        if numpy.random.random() < self.rate:
+            for b in range(self.bits):
+                child.mutate(objs)
+
+
+MUTATIONS = {
+    "point": PointMutation,
+    "multipoint": MultiPointMutation,
+}
+
+
+# ------------------------------------------------------------------------------
+# Generation Report
+#
+# Counts the knapsacks evaluated in a generation and reports its "generation"
+# event to 'instrument', with any 'fields' particular to the engine
+#
+def report_generation(instrument, generation, popsize, best_value, **fields):
+    instrument.count("evaluations", popsize)
+    instrument.event("generation", generation=generation,
+                     best_value=best_value, **fields)
+
+
 # ------------------------------------------------------------------------------
 # Genetic Algorithm for Solving the Knapsack Problem
 #
@@ -241,11 +721,56 @@ def knapsack_fitness_combo(population):
 #   fitfunc     - the function that determines the fitness of a knapsack. The
 #                 function has only one argument, which is the population (i.e.
 #                 the list of knapsacks)
+#   engine      - "list" evolves Knapsack objects; "array" runs the same
+#                 algorithm on a KnapsackPopulation (genetic_knapsack_array)
+#   cache       - a FitnessCache (see fitness_cache) for the list engine. When
+#                 given, knapsacks are scored through the cache instead of by
+#                 'fitfunc', each as it is added to the next generation, and
+#                 the parents are drawn from the running totals of a
+#                 FitnessTable. The parents are the ones the fitness function
+#                 would give, so for a given seed the run is the same. The
+#                 cache only pays off for scores that are expensive to
+#                 compute: those of the fitness functions above are read off
+#                 the totals of a knapsack, so none is used by default
+#   selection   - the selection strategy that draws the parents of every
+#                 generation (see SELECTIONS); roulette by default
+#   crossover   - the crossover strategy (see CROSSOVERS); one-point
+#                 crossover, Knapsack.cross, by default
+#   mutation    - the mutation strategy (see MUTATIONS); Knapsack.mutate on
+#                 one child in ten by default
+#   elite       - the number of fittest knapsacks copied unchanged into the
+#                 next generation
+#   stats       - a dictionary to fill in with the number of generations and
+#                 of knapsacks evaluated
+#   instrument  - an instrument.Instrument to time the fitness, selection,
+#                 crossover and mutation phases, count evaluations (and cache
+#                 hits and misses) and report a "generation" event after every
+#                 generation
+#
+# The array engine has operators of its own, so it only takes 'selection' and
+# 'elite'.
 #
 # Returns the most 'fit' knapsack object as the best solution
 #
 def genetic_knapsack(objs, maxw, popsize=1000, timelimit=60,
-                     fitfunc=knapsack_fitness):
+                     fitfunc=knapsack_fitness, engine="list", cache=None,
+                     selection=None, crossover=None, mutation=None, elite=0,
+                     stats=None, instrument=None):
+    if engine == "array":
+        if cache is not None:
+            raise ValueError("the array engine scores a whole generation at "
+                             "once and does not use a fitness cache")
+        if crossover is not None or mutation is not None:
+            raise ValueError("the array engine crosses and mutates whole "
+                             "populations and takes no operator strategies")
+        return genetic_knapsack_array(objs, maxw, popsize, timelimit, fitfunc,
+                                      selection, elite, stats, instrument)
+    if crossover is None:
+        crossover = OnePointCrossover()
+    if mutation is None:
+        mutation = PointMutation()
+    if selection is None:
+        selection = RouletteSelection()
 
     print "gk: Generating population of size {0}...".format(popsize)
     population = list()
@@ -255,6 +780,7 @@ def genetic_knapsack(objs, maxw, popsize=1000, timelimit=60,
         k.max_weight(maxw)
         k.fill(objs, pack=True)
         population.append(k)
+    table = FitnessTable(cache, population) if cache is not None else None
 
     # Initialize the timer
     print "gk: Initializing timer..."
@@ -266,28 +792,76 @@ def genetic_knapsack(objs, maxw, popsize=1000, timelimit=60,
     best_solution_count = 0
     best_solution_count_limit = 3
     new_best_found = False
+    generations = 0
 
     # Repeat several times to find optimal solution...
     print "gk: Beginning genetic algorithm (timeout={0})".format(timelimit)
+    timed = instrument is not None
     while cur_time - start < timelimit:
         print "gk: Reproducing..."
-        new_population = list()
-        fit_probabilities = fitfunc(population)
-        for i in range(popsize):
-            x = numpy.random.choice(population, p=fit_probabilities)
-            y = numpy.random.choice(population, p=fit_probabilities)
-            x.cross(y.objects())
-            if numpy.random.randint(0, 100) < 10:
-                x.mutate(objs)
+        if timed:
+            t0 = clock()
+            if cache is not None:
+                hits = cache.hits
+                misses = cache.misses
+        if table is None:
+            scores = fitfunc(population)
+        else:
+            scores = table.scores
+        if timed:
+            t1 = clock()
+            fitness_time = t1 - t0
+        if table is None:
+            parents = selection.select(scores, 2 * popsize)
+        else:
+            parents = table.select(selection, 2 * popsize)
+        if timed:
+            instrument.add("selection", clock() - t1)
+            cross_time = mutate_time = 0.0
+        new_population = [population[e].copy() for e in elites(scores, elite)]
+        if table is not None:
+            if timed:
+                t0 = clock()
+            table = FitnessTable(cache, new_population)
+            if timed:
+                fitness_time += clock() - t0
+        for i in range(len(new_population), popsize):
+            x = population[parents[i]].copy()
+            y = population[parents[popsize + i]]
+            if timed:
+                t0 = clock()
+            crossover.cross(x, y)
+            if timed:
+                t1 = clock()
+            mutation.mutate(x, objs)
+            if timed:
+                t2 = clock()
+                cross_time += t1 - t0
+                mutate_time += t2 - t1
             new_population.append(x)
+            if table is not None:
+                table.add(x)
+                if timed:
+                    fitness_time += clock() - t2
             if x.value() > best_solution.value():
-                best_solution = Knapsack(x.objects(),
-                                         x.weight(),
-                                         x.value(),
-                                         x.max_weight())
+                best_solution = x.copy()
                 new_best_found = True
 
         population = new_population
+        generations += 1
+        if timed:
+            instrument.add("fitness", fitness_time)
+            instrument.add("crossover", cross_time)
+            instrument.add("mutation", mutate_time)
+            if cache is None:
+                report_generation(instrument, generations, popsize,
+                                  best_solution.value())
+            else:
+                instrument.count("cache_hits", cache.hits - hits)
+                instrument.count("cache_misses", cache.misses - misses)
+                report_generation(instrument, generations, popsize,
+                                  best_solution.value(),
+                                  cache_size=len(cache))
 
         if new_best_found:
             best_solution_count = 0
@@ -301,39 +875,347 @@ def genetic_knapsack(objs, maxw, popsize=1000, timelimit=60,
         # Update the running time
         cur_time = time.time()
 
+    if cache is not None:
+        print cache.stats()
+    if stats is not None:
+        stats.update(generations=generations,
+                     evaluations=generations * popsize)
+    return best_solution
+
+
+# ------------------------------------------------------------------------------
+# One Generation of a KnapsackPopulation
+#
+# Replaces the population with the next generation: parents are drawn by
+# fitness in a single call (by roulette, or by a 'selection' strategy), then
+# crossed, repaired and mutated as arrays. The 'elite' fittest knapsacks of
+# the old generation take the place of the least valuable children. With an
+# 'instrument', the time of each step is added to its timers
+#
+def evolve_population(population, fitfunc, mutation_rate=0.1, selection=None,
+                      elite=0, instrument=None):
+    timed = instrument is not None
+    if timed:
+        t0 = clock()
+    popsize = population.size()
+    fit_probabilities = population_fitness(population, fitfunc)
+    if timed:
+        t1 = clock()
+    if selection is None:
+        parents = numpy.random.choice(popsize, 2 * popsize,
+                                      p=fit_probabilities)
+    else:
+        parents = selection.select(fit_probabilities, 2 * popsize)
+    kept = population.genes[elites(fit_probabilities, elite)].copy()
+    if timed:
+        t2 = clock()
+    population.cross(parents[:popsize], parents[popsize:])
+    if timed:
+        t3 = clock()
+    population.mutate(mutation_rate)
+    if elite > 0:
+        population.receive(kept)
+    if timed:
+        instrument.add("fitness", t1 - t0)
+        instrument.add("selection", t2 - t1)
+        instrument.add("crossover", t3 - t2)
+        instrument.add("mutation", clock() - t3)
+
+
+# ------------------------------------------------------------------------------
+# Genetic Algorithm on a KnapsackPopulation
+#
+# The array engine for genetic_knapsack; takes the same parameters, apart from
+# the cache and the operator strategies. Every step of a generation is done
+# for the whole population at once: the parents are drawn in a single call,
+# then crossed, repaired and mutated as arrays.
+#
+def genetic_knapsack_array(objs, maxw, popsize=1000, timelimit=60,
+                           fitfunc=knapsack_fitness, selection=None, elite=0,
+                           stats=None, instrument=None):
+
+    print "gk: Generating population of size {0}...".format(popsize)
+    population = random_population(objs, maxw, popsize)
+
+    # Initialize the timer
+    print "gk: Initializing timer..."
+    start = time.time()
+    cur_time = time.time()
+
+    # Set up some variables to keep track of the most fit solution so far
+    best_solution = Knapsack()
+    best_solution_count = 0
+    best_solution_count_limit = 3
+    generations = 0
+
+    print "gk: Beginning genetic algorithm (array engine, timeout={0})".format(
+        timelimit)
+    while cur_time - start < timelimit:
+        evolve_population(population, fitfunc, selection=selection,
+                          elite=elite, instrument=instrument)
+        generations += 1
+
+        best = int(numpy.argmax(population.values))
+        if population.values[best] > best_solution.value():
+            best_solution = population.knapsack(best)
+            best_solution_count = 0
+            print "gk: Found new best solution!"
+        else:
+            best_solution_count += 1
+        if instrument is not None:
+            report_generation(instrument, generations, popsize,
+                              best_solution.value(),
+                              mean_value=float(population.values.mean()))
+        if best_solution_count >= best_solution_count_limit:
+            break
+
+        # Update the running time
+        cur_time = time.time()
+
+    print "gk: {0} generations in {1:.2f}s".format(generations,
+                                                    time.time() - start)
+    if stats is not None:
+        stats.update(generations=generations,
+                     evaluations=generations * popsize)
     return best_solution
 
 
+# ------------------------------------------------------------------------------
+# Anytime Genetic Algorithm
+#
+# The array engine as an anytime algorithm (see knapsack/anytime.py): a
+# generator that yields the progress of the run after every generation, as a
+# dictionary with the best knapsack so far ("best") and its value, the
+# generation, the evaluations and seconds spent (over every resumed run) and
+# the trace of the best value. It runs until the 'budget' (an anytime.Budget)
+# is spent or, with 'stall_generations', until that many generations in a
+# row have not improved the best value (genetic_knapsack stops after 3);
+# with neither, it runs until the caller stops it.
+#
+# A new run seeds both random number generators with 'seed', unless it is
+# None, so it can be repeated. With a 'checkpoint' (an anytime.Checkpoint), a
+# run resumes from its file if there is one, with the generators as they were,
+# and saves the population and the rest of its state to it every interval and
+# when it stops. A resumed run must be given the same objects, weight limit
+# and strategies.
+#
+def genetic_anytime(objs, maxw, popsize=1000, fitfunc=knapsack_fitness,
+                    selection=None, elite=0, budget=None, checkpoint=None,
+                    instrument=None, stall_generations=None, seed=None):
+    state = checkpoint.load("ga") if checkpoint is not None else None
+    if state is None:
+        if seed is not None:
+            random.seed(seed)
+            numpy.random.seed(seed)
+        population = random_population(objs, maxw, popsize)
+        state = {"generations": 0, "seconds": 0.0, "trace": list(),
+                 "best_row": None, "best_value": 0, "stall": 0}
+    else:
+        population = KnapsackPopulation(objs, maxw, state["genes"])
+        popsize = population.size()
+        state.setdefault("stall", 0)
+
+    def save():
+        state["genes"] = population.genes
+        checkpoint.save("ga", state)
+
+    best_solution = None
+    seconds = state["seconds"]
+    start = time.time()
+    while True:
+        evolve_population(population, fitfunc, selection=selection,
+                          elite=elite, instrument=instrument)
+        state["generations"] += 1
+        state["seconds"] = seconds + time.time() - start
+        evaluations = state["generations"] * popsize
+
+        best = int(numpy.argmax(population.values))
+        if state["best_row"] is None or \
+                population.values[best] > state["best_value"]:
+            state["best_row"] = population.genes[best].copy()
+            state["best_value"] = int(population.values[best])
+            state["trace"].append([state["seconds"], evaluations,
+                                   state["best_value"]])
+            state["stall"] = 0
+            best_solution = None
+        else:
+            state["stall"] += 1
+        if best_solution is None:
+            row = state["best_row"]
+            best_solution = Knapsack([objs[g] for g in row if g < len(objs)],
+                                     sum(objs[g][0] for g in row
+                                         if g < len(objs)),
+                                     state["best_value"], maxw)
+        if instrument is not None:
+            report_generation(instrument, state["generations"], popsize,
+                              state["best_value"])
+        if checkpoint is not None and checkpoint.due():
+            save()
+        try:
+            yield {"best": best_solution, "value": state["best_value"],
+                   "generation": state["generations"],
+                   "evaluations": evaluations, "seconds": state["seconds"],
+                   "trace": state["trace"]}
+        except GeneratorExit:
+            if checkpoint is not None:
+                save()
+            raise
+        if budget is not None and budget.spent(state["seconds"], evaluations):
+            break
+        if stall_generations is not None and \
+                state["stall"] >= stall_generations:
+            break
+    if checkpoint is not None:
+        save()
+
+
+# ------------------------------------------------------------------------------
+# Island
+#
+# Worker process of island_knapsack. Evolves one KnapsackPopulation, and after
+# every 'interval' generations sends copies of its best 'migrants' knapsacks
+# (as rows of object indices) to the islands in 'outboxes', takes in whatever
+# migrants have arrived in 'inbox', and reports its best knapsack so far to
+# 'results' as (index, epoch, value, row). Reports None as the row when done.
+#
+def island(index, objs, maxw, popsize, fitfunc, interval, migrants, inbox,
+           outboxes, results, stop, timelimit, seed):
+    random.seed(seed + index)
+    numpy.random.seed(seed + index)
+    for outbox in outboxes:
+        # Do not wait for islands that have already stopped to read migrants
+        outbox.cancel_join_thread()
+    population = random_population(objs, maxw, popsize)
+    start = time.time()
+    best_value = -1
+    best_row = None
+    epoch = 0
+    while time.time() - start < timelimit and not stop.is_set():
+        for g in range(interval):
+            evolve_population(population, fitfunc)
+            best = int(numpy.argmax(population.values))
+            if population.values[best] > best_value:
+                best_value = int(population.values[best])
+                best_row = population.genes[best].copy()
+
+        rows = population.top(migrants)
+        for outbox in outboxes:
+            outbox.put(rows)
+        try:
+            while True:
+                population.receive(inbox.get_nowait())
+        except Empty:
+            pass
+        results.put((index, epoch, best_value, best_row))
+        epoch += 1
+    results.put((index, epoch, best_value, None))
+
+
+# ------------------------------------------------------------------------------
+# Island Model Genetic Algorithm
+#
+# Runs genetic_knapsack_array on several islands (worker processes) at once.
+# Takes the parameters of genetic_knapsack and the following:
+#   islands     - the number of islands; each has a population of 'popsize'
+#   interval    - the number of generations between two migrations
+#   migrants    - the number of knapsacks every island sends per migration
+#   topology    - "ring" sends migrants to the next island only, "full" to
+#                 every other island
+#   seed        - island i seeds its random number generators with seed + i
+#
+# Like genetic_knapsack, the search stops at the time limit or once three
+# migration rounds in a row have not improved on the best knapsack found on
+# any island. Returns the best knapsack found
+#
+def island_knapsack(objs, maxw, islands=4, popsize=1000, timelimit=60,
+                    fitfunc=knapsack_fitness, interval=10, migrants=5,
+                    topology="ring", seed=0):
+    if topology not in ("ring", "full"):
+        raise ValueError("unknown topology '{0}'".format(topology))
+
+    print "gk: Starting {0} islands with populations of {1}...".format(
+        islands, popsize)
+    inboxes = [multiprocessing.Queue() for i in range(islands)]
+    results = multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    processes = list()
+    for i in range(islands):
+        if topology == "ring":
+            outboxes = [inboxes[(i + 1) % islands]] if islands > 1 else []
+        else:
+            outboxes = [inboxes[j] for j in range(islands) if j != i]
+        p = multiprocessing.Process(target=island,
+                                    args=(i, objs, maxw, popsize, fitfunc,
+                                          interval, migrants, inboxes[i],
+                                          outboxes, results, stop, timelimit,
+                                          seed))
+        p.daemon = True
+        p.start()
+        processes.append(p)
+
+    # Set up some variables to keep track of the most fit solution so far
+    best_value = -1
+    best_row = None
+    best_solution_count = 0
+    best_solution_count_limit = 3
+    reported = defaultdict(int)     # epoch -> number of islands that reported
+    improved = defaultdict(bool)    # epoch -> a new best was found
+    finished = 0
+    next_epoch = 0
+    while finished < islands:
+        index, epoch, value, row = results.get()
+        if row is None:
+            finished += 1
+            continue
+        if value > best_value:
+            best_value = value
+            best_row = row
+            improved[epoch] = True
+            print "gk: Found new best solution on island {0}!".format(index)
+        reported[epoch] += 1
+        # Count the rounds in order once every island has reported them
+        while reported[next_epoch] == islands:
+            if improved[next_epoch]:
+                best_solution_count = 0
+            else:
+                best_solution_count += 1
+                if best_solution_count >= best_solution_count_limit:
+                    stop.set()
+            next_epoch += 1
+    stop.set()
+    for p in processes:
+        p.join()
+
+    if best_row is None:
+        return Knapsack()
+    objects = [objs[g] for g in best_row if g != len(objs)]
+    return Knapsack(objects, sum(o[0] for o in objects),
+                    sum(o[1] for o in objects), maxw)
+
+
 ################################################################################
 ################################################################################
 ################################################################################
 # RUN THE PROGRAM
 #
+# The optimal knapsack for comparison with the genetic algorithm. Knapsacks
+# are filled with replacement (the same object can be added more than once),
+# so this solves the unbounded problem
+#
 def knapsack_solution(objects, max_weight):
-    v = list()
-    w = list()
-    for o in objects:
-        w.append(o[0])
-        v.append(o[1])
-    n = len(objects)
-    w = max_weight
-    m = [[0 for x in range(w)] for y in range(n)]
-    for j in range(w):
-        m[0][j] = 0
-
-    for i in range(1, n):
-        for j in range(w):
-            if w[i] > j:
-                m[i][j] = m[i - 1][j]
-            else:
-                m[i][j] = max(m[i - 1][j], m[i - 1][j - w[i]] + v[i])
-
-    print "Solution:", m[n - 1][w - 1]
+    value, weight, taken = exact.solve(objects, max_weight, unbounded=True)
+    print "Solution:", value
+    return Knapsack([objects[i] for i in taken], weight, value, max_weight)
 
 
 def main():
-    # Run several different types of tests
-    objects, max_weight = parse(DATA_DIR + "testfile.txt")
+    # Run several different types of tests, on the instance file given (in
+    # any format of knapsack/instances.py) or the lisp test file
+    if len(sys.argv) > 1:
+        weights, values, max_weight = instances.load_instance(sys.argv[1])
+        objects = instances.objects(weights, values)
+    else:
+        objects, max_weight = parse(DATA_DIR + "testfile.txt")
 
     print "Testing genetic algorithm..."
     knapsack = genetic_knapsack(objects, max_weight,
@@ -342,6 +1224,9 @@ def main():
                                 fitfunc=knapsack_fitness_combo)
     print str(knapsack)
 
+    print "Computing the exact solution..."
+    print str(knapsack_solution(objects, max_weight))
+
 
 if __name__ == "__main__":
 
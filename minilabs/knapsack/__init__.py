@@ -0,0 +1,7 @@
+################################################################################
+# KNAPSACK
+#
+# Code shared by the knapsack minilabs (genetic-alg and simulated-annealing).
+# The minilab scripts put this directory's parent on sys.path and import the
+# modules from here, e.g. "from knapsack import exact".
+#
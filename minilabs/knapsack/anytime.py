@@ -0,0 +1,97 @@
+################################################################################
+# ANYTIME RUNS
+#
+# Budgets and checkpoints for the anytime forms of the solvers, sa_anytime and
+# genetic_anytime. Both are generators that yield their progress after every
+# temperature level or generation, as a dictionary with the best knapsack so
+# far ("best"), the evaluations and seconds spent, and the trace of the best
+# result over time ("trace", a list of [seconds, evaluations, best] rows).
+# The caller can stop them at any point; a Budget stops them by itself.
+#
+# A Checkpoint keeps the state of a run in a file: the search state (the chain
+# or the population, the temperature, the counters and the trace) and the
+# state of both random number generators, so a run that is stopped, or
+# killed, resumes where its last checkpoint was taken and goes on exactly as
+# it would have. The file is written to a temporary name and renamed, so a
+# run killed while saving leaves the previous checkpoint intact.
+#
+import os
+import time
+import random
+import cPickle as pickle
+import numpy
+
+FORMAT_VERSION = 1
+
+
+# ------------------------------------------------------------------------------
+# Budget
+#
+class Budget(object):
+
+    # Constructor; either limit may be None
+    def __init__(self, seconds=None, evaluations=None):
+        self.seconds = seconds
+        self.evaluations = evaluations
+
+    # Whether a run that has used 'seconds' and 'evaluations' must stop
+    def spent(self, seconds, evaluations):
+        return (self.seconds is not None and seconds >= self.seconds) or \
+            (self.evaluations is not None and evaluations >= self.evaluations)
+
+
+# ------------------------------------------------------------------------------
+# Checkpoint
+#
+class Checkpoint(object):
+
+    # Constructor; the state is saved to 'filename' at most every 'interval'
+    # seconds (and whenever the run stops)
+    def __init__(self, filename, interval=10.0):
+        self.filename = filename
+        self.interval = interval
+        self.saves = 0
+        self.__saved = time.time()
+
+    def load(self, solver):
+        """
+        Reads the checkpoint, if there is one, and restores the random number
+        generators to their state when it was saved
+
+        :param solver: The name of the solver resuming; a checkpoint of
+                       another solver is an error
+        :return: The saved search state, or None if there is no checkpoint
+        """
+        if not os.path.exists(self.filename):
+            return None
+        with open(self.filename, "rb") as input_file:
+            saved = pickle.load(input_file)
+        if saved.get("format") != FORMAT_VERSION or \
+                saved.get("solver") != solver:
+            raise ValueError("{0} is not a version {1} checkpoint of {2}"
+                             .format(self.filename, FORMAT_VERSION, solver))
+        random.setstate(saved["random"])
+        numpy.random.set_state(saved["numpy"])
+        self.__saved = time.time()
+        return saved["state"]
+
+    # Whether the interval since the last save has passed
+    def due(self):
+        return time.time() - self.__saved >= self.interval
+
+    def save(self, solver, state):
+        """
+        Writes the search state and the state of the random number generators
+
+        :param solver: The name of the solver
+        :param state: The search state; anything picklable
+        """
+        saved = {"format": FORMAT_VERSION, "solver": solver, "state": state,
+                 "random": random.getstate(),
+                 "numpy": numpy.random.get_state()}
+        temporary = self.filename + ".tmp"
+        with open(temporary, "wb") as output_file:
+            pickle.dump(saved, output_file, pickle.HIGHEST_PROTOCOL)
+        os.rename(temporary, self.filename)
+        self.saves += 1
+        self.__saved = time.time()
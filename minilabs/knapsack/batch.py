@@ -0,0 +1,336 @@
+################################################################################
+# KNAPSACK BATCH RUNNER
+#
+# Solves many knapsack instances with a pool of long-lived worker processes,
+# so the interpreter, NumPy and the solver scripts are loaded once per worker
+# rather than once per instance. Each worker is handed the next waiting job as
+# soon as it sends back the result of its last one, so a worker that draws
+# short jobs simply runs more of them.
+#
+# Jobs come from a directory (every instance file in it, in any format of
+# instances.py) or from a manifest: a file with one job per line, either the
+# name of an instance file or a JSON object with the keys of a job:
+#
+#   file       - the instance file (relative to the manifest)
+#   id         - a name for the job; defaults to the file name
+#   solver     - "sa" or "ga" (see SOLVERS)
+#   seconds    - the time limit of the job
+#   format     - the format of the file; detected by default
+#   max_weight - the weight limit, overriding the one in the file
+#   seed       - the random seed
+#   stall_generations
+#              - ga stops after this many generations without a better value
+#
+# Keys left out take the values given on the command line. The solvers run in
+# their anytime forms (sa_anytime, genetic_anytime) with the time limit as
+# their budget, and return the best knapsack found in it; ga jobs also stop
+# once they stall, as genetic_knapsack does, so small instances do not take
+# their whole time limit. A job that runs past the hard limit (HARD_FACTOR
+# times its time limit plus HARD_GRACE seconds) has its worker killed and
+# replaced, as does a job whose worker dies; either way the job is reported
+# as failed and the batch goes on.
+#
+# Results are written as they come in, one JSON object per line with the job,
+# its status ("ok", "error", "timeout" or "lost"), the value, weight and
+# objects ([weight, value, count] rows) of the solution, the seconds and
+# evaluations it took, and the error of a failed job.
+#
+# call: python batch.py instances [--out results.jsonl] [--solver sa|ga]
+#                       [--seconds S] [--processes P] [--seed S]
+#                       [--stall-generations G]
+#   where instances is a directory or a manifest
+#
+import os
+import sys
+import json
+import time
+import select
+import argparse
+import traceback
+import multiprocessing
+from collections import defaultdict, deque
+import anytime
+import benchmark
+import instances
+
+SOLVERS = ("sa", "ga")
+HARD_FACTOR = 2             # hard limit of a job, as a multiple of its limit
+HARD_GRACE = 5.0            # plus this many seconds, for loading the instance
+POLL_SECONDS = 0.5          # how often the workers are checked
+STALL_GENERATIONS = 3       # the stop of genetic_knapsack
+SKIPPED_SUFFIXES = (".npy", ".tmp", ".jsonl", ".json", ".md")
+
+
+# ------------------------------------------------------------------------------
+# Jobs
+#
+def read_jobs(source, defaults):
+    """
+    Lists the jobs of a directory or a manifest
+
+    :param source: A directory of instance files or a manifest file
+    :param defaults: A dictionary of the values of the keys a job leaves out
+    :return: A list of job dictionaries
+    """
+    entries = list()
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            path = os.path.join(source, name)
+            if not name.startswith(".") and os.path.isfile(path) and \
+                    not name.lower().endswith(SKIPPED_SUFFIXES):
+                entries.append({"file": path})
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, "r") as input_file:
+            for number, line in enumerate(input_file, 1):
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                if line.startswith("{"):
+                    entry = json.loads(line)
+                    if "file" not in entry:
+                        raise ValueError("{0}:{1}: job without a file".format(
+                            source, number))
+                else:
+                    entry = {"file": line}
+                entry["file"] = os.path.join(base, entry["file"])
+                entries.append(entry)
+
+    jobs = list()
+    for entry in entries:
+        job = dict(defaults)
+        job.update(entry)
+        job.setdefault("id", os.path.basename(job["file"]))
+        if job["solver"] not in SOLVERS:
+            raise ValueError("job {0}: unknown solver '{1}'".format(
+                job["id"], job["solver"]))
+        seconds = job.get("seconds")
+        if isinstance(seconds, bool) or \
+                not isinstance(seconds, (int, long, float)) or seconds <= 0:
+            raise ValueError("job {0}: the time limit must be a positive "
+                             "number of seconds, not {1!r}".format(job["id"],
+                                                                   seconds))
+        jobs.append(job)
+    return jobs
+
+
+def solve_job(job):
+    """
+    Solves the instance of a job with the anytime form of its solver
+
+    :param job: A job dictionary
+    :return: A dictionary with the value, weight, objects and evaluations of
+             the solution
+    """
+    weights, values, max_weight = instances.load_instance(
+        job["file"], job.get("format"), job.get("max_weight"))
+    objects = instances.objects(weights, values)
+    budget = anytime.Budget(seconds=job["seconds"])
+    if job["solver"] == "sa":
+        sa = benchmark.load_script("sa")
+        runs = sa.sa_anytime(objects, max_weight, sa.sa_cost_loss,
+                             job.get("iterations", 1000), seed=job["seed"],
+                             budget=budget)
+    else:
+        gk = benchmark.load_script("gk")
+        runs = gk.genetic_anytime(
+            objects, max_weight, job.get("popsize", 200), budget=budget,
+            stall_generations=job.get("stall_generations",
+                                      STALL_GENERATIONS), seed=job["seed"])
+    progress = None
+    for progress in runs:
+        pass
+    if progress is None:
+        return {"value": 0, "weight": 0, "objects": list(), "evaluations": 0}
+    knapsack = progress["best"]
+    counts = defaultdict(int)
+    for obj in knapsack.objects():
+        counts[obj] += 1
+    return {"value": knapsack.value(), "weight": knapsack.weight(),
+            "objects": [[w, v, c] for (w, v), c in sorted(counts.items())],
+            "evaluations": progress["evaluations"]}
+
+
+# ------------------------------------------------------------------------------
+# Workers
+#
+def worker(connection):
+    """
+    Runs the jobs sent over a pipe until it is sent None, and sends back the
+    result of every job, failed or not
+
+    :param connection: The worker's end of the pipe
+    """
+    # The solvers may report progress on stdout, which holds the results
+    # when they are not written to a file
+    sys.stdout = open(os.devnull, "w")
+    while True:
+        job = connection.recv()
+        if job is None:
+            return
+        result = {"id": job["id"], "file": job["file"],
+                  "solver": job["solver"], "worker": os.getpid()}
+        start = time.time()
+        try:
+            result.update(solve_job(job))
+            result["status"] = "ok"
+        except Exception as error:
+            result["status"] = "error"
+            result["error"] = "{0}: {1}".format(type(error).__name__, error)
+            result["traceback"] = traceback.format_exc()
+        result["seconds"] = time.time() - start
+        connection.send(result)
+
+
+class Worker(object):
+
+    # Constructor; starts the process
+    def __init__(self):
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=worker, args=(child,))
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+        self.job = None         # the job being run
+        self.started = None     # when it was sent
+
+    # Send 'job' to the worker, or None to stop it
+    def send(self, job):
+        self.connection.send(job)
+        self.job = job
+        self.started = time.time()
+
+    # Kill the worker
+    def kill(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.connection.close()
+
+
+def run_batch(jobs, output, processes=None, verbose=True):
+    """
+    Runs jobs on a pool of worker processes and writes every result as soon
+    as it comes in
+
+    :param jobs: A list of job dictionaries (see read_jobs)
+    :param output: An open file for the JSON lines of the results
+    :param processes: The number of workers; defaults to the number of CPUs
+    :param verbose: Print a line to stderr for every failed job and a
+                    summary at the end
+    :return: A dictionary of the number of results of every status
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(jobs)))
+    if len(set(job["id"] for job in jobs)) < len(jobs):
+        raise ValueError("two jobs have the same id")
+    waiting = deque(jobs)
+    counts = defaultdict(int)
+    finished = 0
+    start = time.time()
+
+    def record(result):
+        counts[result["status"]] += 1
+        output.write(json.dumps(result, sort_keys=True) + "\n")
+        output.flush()
+        if verbose and result["status"] != "ok":
+            print >> sys.stderr, "batch: job {0} {1}: {2}".format(
+                result["id"], result["status"], result.get("error"))
+
+    def failed(w, status, error):
+        record({"id": w.job["id"], "file": w.job["file"],
+                "solver": w.job["solver"], "worker": w.process.pid,
+                "status": status, "error": error,
+                "seconds": time.time() - w.started})
+
+    # Give worker 'w' the next job, if any
+    def dispatch(w):
+        if waiting:
+            w.send(waiting.popleft())
+        else:
+            w.job = None
+
+    workers = [Worker() for i in range(processes)]
+    try:
+        for w in workers:
+            dispatch(w)
+        while finished < len(jobs):
+            busy = [w for w in workers if w.job is not None]
+            ready, _, _ = select.select([w.connection for w in busy], [], [],
+                                        POLL_SECONDS)
+            now = time.time()
+            for number, w in enumerate(workers):
+                if w.job is None:
+                    continue
+                if w.connection in ready:
+                    try:
+                        record(w.connection.recv())
+                    except (EOFError, IOError):
+                        # The worker died during the job
+                        w.process.join()
+                        failed(w, "lost", "worker exited with code {0}"
+                               .format(w.process.exitcode))
+                        w.kill()
+                        w = workers[number] = Worker()
+                    finished += 1
+                    dispatch(w)
+                elif now - w.started > HARD_FACTOR * w.job["seconds"] + \
+                        HARD_GRACE:
+                    failed(w, "timeout", "killed after {0:.1f}s".format(
+                        now - w.started))
+                    w.kill()
+                    w = workers[number] = Worker()
+                    finished += 1
+                    dispatch(w)
+        for w in workers:
+            w.send(None)
+    finally:
+        for w in workers:
+            w.kill()
+
+    seconds = time.time() - start
+    if verbose:
+        print >> sys.stderr, "batch: {0} jobs in {1:.2f}s ({2:.1f} jobs/s) " \
+                             "on {3} workers: {4}".format(
+                                 len(jobs), seconds,
+                                 len(jobs) / seconds if seconds > 0 else 0.0,
+                                 processes,
+                                 ", ".join("{0} {1}".format(n, s) for s, n in
+                                           sorted(counts.items())))
+    return dict(counts)
+
+
+################################################################################
+################################################################################
+# RUN THE PROGRAM
+#
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("instances")
+    parser.add_argument("--out")
+    parser.add_argument("--solver", default="sa", choices=SOLVERS)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stall-generations", type=int,
+                        default=STALL_GENERATIONS)
+    args = parser.parse_args()
+
+    jobs = read_jobs(args.instances, {
+        "solver": args.solver, "seconds": args.seconds, "seed": args.seed,
+        "stall_generations": args.stall_generations})
+    if not jobs:
+        print >> sys.stderr, "batch: no jobs in {0}".format(args.instances)
+        return
+    if args.out:
+        with open(args.out, "w") as output_file:
+            counts = run_batch(jobs, output_file, args.processes)
+    else:
+        counts = run_batch(jobs, sys.stdout, args.processes)
+    if len(counts) > 1 or "ok" not in counts:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,369 @@
+################################################################################
+# KNAPSACK BENCHMARK
+#
+# Runs the simulated annealing and genetic algorithm solvers on generated
+# instances of the standard hard families (see instances.generate_instance)
+# and compares them with the exact optimum (see exact.py). Every run has a
+# fixed seed, so the same command line gives the same instances and the same
+# runs on every commit, and the results of two commits can be compared.
+#
+# Every run happens in a fresh process, which reports its wall time, the
+# evaluations per second of the solver, the peak memory of the process and
+# the gap between the value found and the optimum. The results are written as
+# JSON and summarized in a table; with --baseline the summary is compared with
+# an earlier results file and slower or worse solvers are flagged. With
+# --events, every run is instrumented (see instrument.py) and its events are
+# appended to a JSON lines file.
+#
+# call: python benchmark.py [--families F ...] [--sizes N ...]
+#                           [--solvers S ...] [--repeats R] [--seed S]
+#                           [--out results.json] [--baseline old.json]
+#                           [--events events.jsonl]
+#   e.g. python benchmark.py --sizes 50 1000 100000 --solvers sa ga
+#
+import os
+import sys
+import imp
+import json
+import time
+import random
+import platform
+import argparse
+import resource
+import subprocess
+import multiprocessing
+import numpy
+import exact
+import instances
+import instrument
+
+MINILABS = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = {
+    "sa": os.path.join(MINILABS, "simulated-annealing", "sa.py"),
+    "gk": os.path.join(MINILABS, "genetic-alg", "genetic-knapsack.py"),
+}
+FORMAT_VERSION = 1
+EXACT_NODES = 10 * 1000 * 1000     # node limit of the exact branch and bound
+TIME_TOLERANCE = 0.2                # slowdown flagged as a regression
+TIME_NOISE = 0.05                   # seconds of slowdown always ignored
+GAP_TOLERANCE = 0.5                 # percentage points of gap flagged as one
+
+_modules = dict()
+_instance = None        # (objects, max_weight, label) of the runs in progress
+
+
+def load_script(name):
+    """
+    Loads one of the minilab scripts as a module, once per process
+
+    :param name: A key of SCRIPTS
+    :return: The module
+    """
+    if name not in _modules:
+        _modules[name] = imp.load_source("benchmark_" + name, SCRIPTS[name])
+    return _modules[name]
+
+
+# ------------------------------------------------------------------------------
+# Solvers
+#
+# Each solver takes the objects, the weight limit, the seed, the options of
+# the benchmark and an Instrument (or None), and returns the best Knapsack
+# found and the number of knapsacks evaluated.
+#
+def run_sa(objects, max_weight, seed, options, probe=None, engine="array"):
+    sa = load_script("sa")
+    stats = dict()
+    knapsack = sa.sa_knapsack(objects, max_weight, sa.sa_cost_loss, engine,
+                              iterations=options["iterations"], seed=seed,
+                              stats=stats, instrument=probe)
+    return knapsack, stats["evaluations"]
+
+
+def run_sa_list(objects, max_weight, seed, options, probe=None):
+    return run_sa(objects, max_weight, seed, options, probe, "list")
+
+
+def run_ga(objects, max_weight, seed, options, probe=None, engine="array"):
+    gk = load_script("gk")
+    random.seed(seed)
+    numpy.random.seed(seed)
+    stats = dict()
+    knapsack = gk.genetic_knapsack(objects, max_weight, options["popsize"],
+                                   options["timelimit"], gk.knapsack_fitness,
+                                   engine, stats=stats, instrument=probe)
+    return knapsack, stats["evaluations"]
+
+
+def run_ga_list(objects, max_weight, seed, options, probe=None):
+    return run_ga(objects, max_weight, seed, options, probe, "list")
+
+
+SOLVERS = {
+    "sa": run_sa,
+    "sa-list": run_sa_list,
+    "ga": run_ga,
+    "ga-list": run_ga_list,
+}
+
+
+def _run(job):
+    """
+    Runs one solver on the current instance. Runs in a pool process of its
+    own, so the peak memory is that of this run
+
+    :param job: A tuple of the solver name, the seed, the options and the
+                name of the events file (or None)
+    :return: A dictionary with the results of the run, with the totals of the
+             timers and counters of an instrumented run
+    """
+    name, seed, options, events = job
+    objects, max_weight, label = _instance
+    probe = None
+    if events is not None:
+        probe = instrument.Instrument(events, run="{0} {1} seed {2}".format(
+            label, name, seed))
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # The solvers report their progress on stdout
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    try:
+        start = time.time()
+        knapsack, evaluations = SOLVERS[name](objects, max_weight, seed,
+                                              options, probe)
+        seconds = time.time() - start
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    run = {"solver": name, "seed": seed, "seconds": seconds,
+           "evaluations": evaluations,
+           "evals_per_second": evaluations / seconds if seconds > 0 else 0.0,
+           "value": knapsack.value(), "weight": knapsack.weight(),
+           "peak_mb": after / 1024.0, "peak_growth_mb": (after - before) /
+           1024.0}
+    if probe is not None:
+        probe.finish(value=knapsack.value(), seconds=seconds)
+        probe.close()
+        run.update(probe.summary())
+    return run
+
+
+# ------------------------------------------------------------------------------
+# Benchmark
+#
+def _environment():
+    """
+    Describes the code and machine the benchmark ran on
+
+    :return: A dictionary
+    """
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"],
+                                         cwd=MINILABS,
+                                         stderr=open(os.devnull, "w")).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(),
+            "numpy": numpy.__version__, "machine": platform.machine(),
+            "platform": platform.platform(),
+            "cpus": multiprocessing.cpu_count()}
+
+
+def run_benchmark(families, sizes, solvers, repeats=3, seed=0, options=None,
+                  verbose=True, events=None):
+    """
+    Runs every solver on one instance of every family and size
+
+    :param families: Instance families (see instances.FAMILIES)
+    :param sizes: Numbers of objects
+    :param solvers: Names from SOLVERS
+    :param repeats: The number of runs of every solver on every instance;
+                    run r uses seed + r
+    :param seed: The seed of the instances and the first run
+    :param options: Solver options: iterations (sa), popsize and timelimit
+                    (ga)
+    :param verbose: Print every run as it finishes
+    :param events: A JSON lines file to append the events of instrumented
+                   runs to, or None not to instrument them
+    :return: A dictionary with the environment, the options, one entry per
+             instance (with its optimum) and one per run
+    """
+    global _instance
+    options = dict(options or dict())
+    options.setdefault("iterations", 1000)
+    options.setdefault("popsize", 200)
+    options.setdefault("timelimit", 10)
+    results = {"format": FORMAT_VERSION, "environment": _environment(),
+               "options": options, "seed": seed, "repeats": repeats,
+               "instances": list(), "runs": list()}
+
+    for family in families:
+        for n in sizes:
+            weights, values, max_weight = instances.generate_instance(
+                family, n, seed=seed)
+            objects = instances.objects(weights, values)
+            stats = dict()
+            optimum = exact.solve(objects, max_weight, unbounded=True,
+                                  stats=stats, max_nodes=EXACT_NODES)[0]
+            results["instances"].append({
+                "family": family, "n": n, "max_weight": max_weight,
+                "optimum": optimum, "optimal": stats.get("optimal", True),
+                "exact_method": stats["method"],
+                "exact_seconds": stats["time"]})
+            if verbose:
+                print >> sys.stderr, "benchmark: {0} n={1}: optimum {2} " \
+                                     "({3}, {4:.2f}s)".format(
+                                         family, n, optimum, stats["method"],
+                                         stats["time"])
+
+            # The pool processes are forked after the instance is set, and
+            # every run gets a process of its own
+            _instance = (objects, max_weight, "{0} n={1}".format(family, n))
+            jobs = [(name, seed + r, options, events) for name in solvers
+                    for r in range(repeats)]
+            pool = multiprocessing.Pool(1, maxtasksperchild=1)
+            try:
+                for run in pool.imap(_run, jobs):
+                    run.update(family=family, n=n,
+                               gap=100.0 * (optimum - run["value"]) / optimum
+                               if optimum else 0.0)
+                    results["runs"].append(run)
+                    if verbose:
+                        print >> sys.stderr, "benchmark: {0} n={1} {2} seed " \
+                                             "{3}: value {4} gap {5:.2f}% " \
+                                             "{6:.2f}s".format(
+                                                 family, n, run["solver"],
+                                                 run["seed"], run["value"],
+                                                 run["gap"], run["seconds"])
+            finally:
+                pool.close()
+                pool.join()
+            _instance = None
+    return results
+
+
+def summarize(results):
+    """
+    Averages the runs of every solver on every instance
+
+    :param results: The dictionary from run_benchmark
+    :return: A dictionary from (family, n, solver) to a dictionary of the mean
+             seconds, evaluations per second, peak memory and gap, and the
+             worst gap
+    """
+    groups = dict()
+    for run in results["runs"]:
+        key = (run["family"], run["n"], run["solver"])
+        groups.setdefault(key, list()).append(run)
+    summary = dict()
+    for key, runs in groups.items():
+        count = float(len(runs))
+        summary[key] = {
+            "runs": len(runs),
+            "seconds": sum(r["seconds"] for r in runs) / count,
+            "evals_per_second": sum(r["evals_per_second"] for r in runs) /
+            count,
+            "peak_mb": max(r["peak_mb"] for r in runs),
+            "gap": sum(r["gap"] for r in runs) / count,
+            "worst_gap": max(r["gap"] for r in runs)}
+    return summary
+
+
+def table(summary, baseline=None):
+    """
+    Formats a summary as a table
+
+    :param summary: The dictionary from summarize
+    :param baseline: The summary of earlier results to compare with, or None
+    :return: A tuple of the lines of the table and the number of regressions
+    """
+    header = "{0:<13} {1:>8} {2:<8} {3:>9} {4:>11} {5:>8} {6:>7} {7:>7}"\
+        .format("family", "n", "solver", "seconds", "evals/s", "peak MB",
+                "gap %", "worst %")
+    if baseline is not None:
+        header += "  vs baseline"
+    lines = [header, "-" * len(header)]
+    regressions = 0
+    for key in sorted(summary):
+        s = summary[key]
+        line = "{0:<13} {1:>8} {2:<8} {3:>9.3f} {4:>11.0f} {5:>8.1f} " \
+               "{6:>7.2f} {7:>7.2f}".format(key[0], key[1], key[2],
+                                            s["seconds"],
+                                            s["evals_per_second"],
+                                            s["peak_mb"], s["gap"],
+                                            s["worst_gap"])
+        if baseline is not None and key in baseline:
+            old = baseline[key]
+            ratio = s["seconds"] / old["seconds"] if old["seconds"] else 1.0
+            change = s["gap"] - old["gap"]
+            line += "  time x{0:.2f} gap {1:+.2f}".format(ratio, change)
+            slower = ratio > 1 + TIME_TOLERANCE and \
+                s["seconds"] - old["seconds"] > TIME_NOISE
+            if slower or change > GAP_TOLERANCE:
+                line += "  REGRESSION"
+                regressions += 1
+        lines.append(line)
+    return lines, regressions
+
+
+def load_summary(filename):
+    """
+    Reads the summary of a results file written by main
+
+    :param filename: The name of the JSON file
+    :return: The dictionary from summarize
+    """
+    with open(filename, "r") as input_file:
+        results = json.load(input_file)
+    if results.get("format") != FORMAT_VERSION:
+        raise ValueError("{0} is not a version {1} results file".format(
+            filename, FORMAT_VERSION))
+    for run in results["runs"]:
+        run["family"] = str(run["family"])
+        run["solver"] = str(run["solver"])
+    return summarize(results)
+
+
+################################################################################
+################################################################################
+# RUN THE PROGRAM
+#
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--families", nargs="+", default=instances.FAMILIES,
+                        choices=instances.FAMILIES)
+    parser.add_argument("--sizes", nargs="+", type=int,
+                        default=[50, 1000, 10000])
+    parser.add_argument("--solvers", nargs="+", default=["sa", "ga"],
+                        choices=sorted(SOLVERS))
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--popsize", type=int, default=200)
+    parser.add_argument("--timelimit", type=float, default=10)
+    parser.add_argument("--out", default="benchmark.json")
+    parser.add_argument("--baseline")
+    parser.add_argument("--events")
+    args = parser.parse_args()
+
+    options = {"iterations": args.iterations, "popsize": args.popsize,
+               "timelimit": args.timelimit}
+    results = run_benchmark(args.families, args.sizes, args.solvers,
+                            args.repeats, args.seed, options,
+                            events=args.events)
+    with open(args.out, "w") as output_file:
+        json.dump(results, output_file, indent=1, sort_keys=True)
+
+    baseline = load_summary(args.baseline) if args.baseline else None
+    lines, regressions = table(summarize(results), baseline)
+    for line in lines:
+        print line
+    print >> sys.stderr, "benchmark: wrote {0}".format(args.out)
+    if regressions:
+        print >> sys.stderr, "benchmark: {0} regressions".format(regressions)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+################################################################################
+# EXACT KNAPSACK SOLVERS
+#
+# Optimal solutions for the knapsack problem, as the baseline the genetic
+# algorithm and simulated annealing minilabs are measured against. Both the
+# 0/1 problem (every object at most once) and the unbounded problem (any
+# object any number of times, which is what Knapsack.fill builds) are
+# supported, by two methods:
+#
+#   dp  - dynamic programming over the capacities 0..W with a single NumPy
+#         row, O(n W) time and O(W) memory. The objects of the solution are
+#         recovered by divide and conquer: the objects are split in two
+#         halves, the best way to share the capacity between the halves is
+#         read off the rows of both, and each half is solved again with its
+#         share
+#   bnb - depth-first branch and bound over the objects in order of value per
+#         unit of weight, pruned with the fractional (LP relaxation) bound.
+#         Its cost does not depend on W, so it suits large capacities
+#
+# solve() picks dp while n * W is at most DP_LIMIT and bnb otherwise.
+#
+# call: python exact.py datafile [--unbounded] [--method auto|dp|bnb]
+#   where datafile is in any format of instances.py
+#
+import time
+import bisect
+import argparse
+import numpy
+import instances
+
+DP_LIMIT = 50 * 1000 * 1000     # largest n * W solved by dynamic programming
+INT64_LIMIT = 2 ** 62           # larger values are summed as Python integers
+
+
+def _useful(objects, max_weight, unbounded):
+    """
+    Picks the objects that can be part of an optimal solution
+
+    :param objects: A list of (weight, value) pairs
+    :param max_weight: The weight limit
+    :param unbounded: Objects may be used more than once
+    :return: A tuple of the indices of the objects that fit and have a
+             positive value, and the indices of those that weigh nothing
+    """
+    items = list()
+    free = list()
+    for i, (weight, value) in enumerate(objects):
+        if weight < 0:
+            raise ValueError("object {0} has a negative weight".format(i))
+        if value <= 0 or weight > max_weight:
+            continue
+        if weight == 0:
+            if unbounded:
+                raise ValueError("object {0} weighs nothing, so the unbounded "
+                                 "problem has no optimum".format(i))
+            free.append(i)
+        else:
+            items.append(i)
+    return items, free
+
+
+def _expand(objects, items, max_weight):
+    """
+    Turns the unbounded problem into a 0/1 problem by binary splitting: an
+    object that fits k times becomes copies of 1, 2, 4, ... of it, which can
+    make up any count from 0 to k
+
+    :param objects: A list of (weight, value) pairs
+    :param items: The indices of the objects to expand
+    :param max_weight: The weight limit
+    :return: A list of (index, count) pairs
+    """
+    copies = list()
+    for i in items:
+        most = max_weight // objects[i][0]
+        count = 1
+        while most > 0:
+            take = min(count, most)
+            copies.append((i, take))
+            most -= take
+            count *= 2
+    return copies
+
+
+def _dtype(objects, pieces):
+    """
+    Chooses the type of the dynamic programming row: 64-bit integers unless the
+    best value could overflow them
+
+    :param objects: A list of (weight, value) pairs
+    :param pieces: The (index, count) pairs being packed
+    :return: numpy.int64 or object
+    """
+    bound = 0
+    for i, count in pieces:
+        bound += objects[i][1] * count
+    return numpy.int64 if bound < INT64_LIMIT else object
+
+
+def dp_values(objects, pieces, capacity, dtype=numpy.int64):
+    """
+    Computes the best value of every capacity with one rolling row
+
+    :param objects: A list of (weight, value) pairs
+    :param pieces: The (index, count) pairs that may be packed, each at most
+                   once; a piece stands for 'count' copies of the object
+    :param capacity: The largest capacity
+    :param dtype: The type of the row
+    :return: An array whose entry c is the best value of the pieces within
+             weight c
+    """
+    best = numpy.zeros(capacity + 1, dtype=dtype)
+    for i, count in pieces:
+        weight = objects[i][0] * count
+        if weight > capacity:
+            continue
+        # The right-hand side is computed in full before it is assigned, so
+        # every capacity uses the row from before this piece
+        best[weight:] = numpy.maximum(best[weight:],
+                                      best[:capacity + 1 - weight] +
+                                      objects[i][1] * count)
+    return best
+
+
+def _reconstruct(objects, pieces, capacity, dtype):
+    """
+    Finds the pieces of an optimal packing by divide and conquer
+
+    :param objects: A list of (weight, value) pairs
+    :param pieces: The (index, count) pairs that may be packed
+    :param capacity: The weight limit
+    :param dtype: The type of the dynamic programming rows
+    :return: The list of pieces packed
+    """
+    taken = list()
+    stack = [(pieces, capacity)]
+    while stack:
+        pieces, capacity = stack.pop()
+        if not pieces or capacity <= 0:
+            continue
+        if len(pieces) == 1:
+            i, count = pieces[0]
+            if objects[i][0] * count <= capacity:
+                taken.append(pieces[0])
+            continue
+        half = len(pieces) // 2
+        left = dp_values(objects, pieces[:half], capacity, dtype)
+        right = dp_values(objects, pieces[half:], capacity, dtype)
+        # Both rows are non-decreasing, so the best split of the capacity
+        # gives the left half c and the right half the rest
+        share = int(numpy.argmax(left + right[::-1]))
+        stack.append((pieces[:half], share))
+        stack.append((pieces[half:], capacity - share))
+    return taken
+
+
+def solve_dp(objects, max_weight, unbounded=False):
+    """
+    Solves the knapsack problem by dynamic programming
+
+    :param objects: A list of (weight, value) pairs with integer weights
+    :param max_weight: The weight limit
+    :param unbounded: Objects may be used more than once
+    :return: A tuple of the best value, its weight and the list of the indices
+             of the objects packed (repeated for objects packed more than once)
+    """
+    items, free = _useful(objects, max_weight, unbounded)
+    if unbounded:
+        pieces = _expand(objects, items, max_weight)
+    else:
+        pieces = [(i, 1) for i in items]
+    dtype = _dtype(objects, pieces)
+    taken = list(free)
+    for i, count in _reconstruct(objects, pieces, max_weight, dtype):
+        taken.extend([i] * count)
+    taken.sort()
+    return (sum(objects[i][1] for i in taken),
+            sum(objects[i][0] for i in taken), taken)
+
+
+def solve_bnb(objects, max_weight, unbounded=False, max_nodes=None,
+              stats=None):
+    """
+    Solves the knapsack problem by branch and bound. Every node either packs
+    the next object (one more copy of it, in the unbounded problem) or moves
+    past it, and nodes whose fractional bound is no better than the best
+    packing found so far are cut off
+
+    :param objects: A list of (weight, value) pairs
+    :param max_weight: The weight limit
+    :param unbounded: Objects may be used more than once
+    :param max_nodes: Stop after this many nodes and return the best packing
+                      found, which may not be optimal
+    :param stats: A dictionary to fill in with the number of nodes and whether
+                  the search finished ('optimal')
+    :return: A tuple of the best value, its weight and the list of the indices
+             of the objects packed (repeated for objects packed more than once)
+    """
+    items, free = _useful(objects, max_weight, unbounded)
+    items.sort(key=lambda i: (-float(objects[i][1]) / objects[i][0],
+                              objects[i][0]))
+    n = len(items)
+    weights = [objects[i][0] for i in items]
+    values = [objects[i][1] for i in items]
+    ratios = [float(v) / w for w, v in zip(weights, values)] + [0.0]
+    # Prefix sums for the fractional bound of the 0/1 problem
+    prefix_weight = [0]
+    prefix_value = [0]
+    for w, v in zip(weights, values):
+        prefix_weight.append(prefix_weight[-1] + w)
+        prefix_value.append(prefix_value[-1] + v)
+
+    def bound(k, capacity):
+        if unbounded:
+            return capacity * ratios[k]
+        # Pack objects k, k + 1, ... whole while they fit, then a fraction of
+        # the next one
+        end = bisect.bisect_right(prefix_weight, prefix_weight[k] + capacity,
+                                  k) - 1
+        room = capacity - (prefix_weight[end] - prefix_weight[k])
+        return prefix_value[end] - prefix_value[k] + room * ratios[end]
+
+    best_value = 0
+    best_path = None
+    nodes = 0
+    optimal = True
+    # Nodes are (next object, remaining capacity, value, path), where the
+    # path is a linked list of (object, rest of the path)
+    stack = [(0, max_weight, 0, None)]
+    while stack:
+        if max_nodes is not None and nodes >= max_nodes:
+            optimal = False
+            break
+        k, capacity, value, path = stack.pop()
+        nodes += 1
+        if value > best_value:
+            best_value = value
+            best_path = path
+        if k == n or value + bound(k, capacity) <= best_value:
+            continue
+        stack.append((k + 1, capacity, value, path))
+        if weights[k] <= capacity:
+            # Pushed last, so packing is tried first
+            stack.append((k if unbounded else k + 1, capacity - weights[k],
+                          value + values[k], (items[k], path)))
+
+    if stats is not None:
+        stats["nodes"] = nodes
+        stats["optimal"] = optimal
+    taken = list(free)
+    while best_path is not None:
+        taken.append(best_path[0])
+        best_path = best_path[1]
+    taken.sort()
+    return (sum(objects[i][1] for i in taken),
+            sum(objects[i][0] for i in taken), taken)
+
+
+def solve(objects, max_weight, unbounded=False, method="auto", stats=None,
+          max_nodes=None):
+    """
+    Solves the knapsack problem exactly
+
+    :param objects: A list of (weight, value) pairs with integer weights
+    :param max_weight: The weight limit
+    :param unbounded: Objects may be used more than once
+    :param method: "dp", "bnb", or "auto" to use dp while the number of
+                   objects times max_weight is at most DP_LIMIT
+    :param stats: A dictionary to fill in with the method used and the
+                  seconds it took (and the statistics of solve_bnb)
+    :param max_nodes: The node limit of solve_bnb
+    :return: A tuple of the best value, its weight and the list of the indices
+             of the objects packed (repeated for objects packed more than once)
+    """
+    if method == "auto":
+        method = "dp" if len(objects) * max_weight <= DP_LIMIT else "bnb"
+    start = time.time()
+    if method == "dp":
+        result = solve_dp(objects, max_weight, unbounded)
+    elif method == "bnb":
+        result = solve_bnb(objects, max_weight, unbounded, max_nodes, stats)
+    else:
+        raise ValueError("unknown method '{0}'".format(method))
+    if stats is not None:
+        stats["method"] = method
+        stats["time"] = time.time() - start
+    return result
+
+
+################################################################################
+################################################################################
+# RUN THE PROGRAM
+#
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("datafile")
+    parser.add_argument("--unbounded", action="store_true")
+    parser.add_argument("--method", default="auto",
+                        choices=("auto", "dp", "bnb"))
+    args = parser.parse_args()
+
+    weights, values, max_weight = instances.load_instance(args.datafile)
+    objects = instances.objects(weights, values)
+    stats = dict()
+    value, weight, taken = solve(objects, max_weight, args.unbounded,
+                                 args.method, stats)
+    print "exact: {0} objects, max weight {1}, {2} method, {3:.3f}s".format(
+        len(objects), max_weight, stats["method"], stats["time"])
+    print "Value: {0}\tWeight: {1}/{2}".format(value, weight, max_weight)
+    print "Objects:", [objects[i] for i in taken]
+
+
+if __name__ == "__main__":
+    main()
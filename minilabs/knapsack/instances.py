@@ -0,0 +1,314 @@
+################################################################################
+# KNAPSACK INSTANCES
+#
+# Loads knapsack instances from any of the formats the minilabs use:
+#
+#   plain - the weight limit on the first line, then one "weight value" pair
+#           per line (simulated-annealing/data.txt)
+#   lisp  - dotted pairs "(weight . value)" and "(setq MaxWeight limit)"
+#           (genetic-alg/data/testfile.txt)
+#   csv   - "weight,value" rows; a "max_weight,limit" row gives the limit and
+#           other rows that do not start with a number (headers) are skipped
+#
+# The file is read in chunks of lines into one NumPy array, which grows by
+# doubling, so instances with millions of objects load without building a
+# list of tuples first. Besides the array, at most one chunk of text and its
+# numbers are held at a time; while the array grows, its spare capacity (up
+# to as much again as has been read) is part of the peak memory as well.
+# Numbers may be of any size; instances with numbers beyond 64 bits are kept
+# in arrays of Python integers.
+#
+# Large instances are cached next to the file as "<file>.npy", which is
+# memory-mapped on the next load instead of parsed. The cache is rebuilt when
+# the file is newer than it, or when it was parsed in another format than the
+# one asked for.
+#
+# generate_instance() makes instances of the standard hard families for
+# benchmarks.
+#
+# call: python instances.py datafile [--format plain|lisp|csv] [--no-cache]
+#
+import os
+import re
+import sys
+import time
+import argparse
+import itertools
+import numpy
+
+FORMATS = ("plain", "lisp", "csv")
+FAMILIES = ("uncorrelated", "weakly", "strongly", "subset-sum")
+CAPACITY_OBJECTS = 25           # average objects a generated knapsack holds
+CHUNK_LINES = 1 << 16           # lines parsed at a time
+CACHE_MIN_BYTES = 1 << 20       # files this large are cached by default
+MAX_WEIGHT_NAMES = ("max_weight", "maxweight", "capacity")
+NO_LIMIT = -1                   # weight limit stored in a cache without one
+
+PAIR_PATTERN = re.compile(r"\(\s*([-+]?\d+)\s*\.\s*([-+]?\d+)\s*\)")
+WEIGHT_PATTERN = re.compile(r"\(\s*setq\s+MaxWeight\s+([-+]?\d+)\s*\)",
+                            re.IGNORECASE)
+
+
+def _is_int(text):
+    return text.lstrip("-+").isdigit()
+
+
+def detect_format(filename):
+    """
+    Guesses the format of an instance file from its name and first line
+
+    :param filename: The name of the file
+    :return: One of FORMATS
+    """
+    if filename.lower().endswith(".csv"):
+        return "csv"
+    with open(filename, "r") as input_file:
+        for line in input_file:
+            line = line.strip()
+            if line:
+                if line[0] in ";(":
+                    return "lisp"
+                return "csv" if "," in line else "plain"
+    return "plain"
+
+
+def _to_array(fields):
+    """
+    Converts decimal strings to integers
+
+    :param fields: A list of strings
+    :return: An int64 array, or an object array of Python integers if any
+             number does not fit in 64 bits
+    """
+    try:
+        return numpy.array(fields, dtype=numpy.int64)
+    except OverflowError:
+        return numpy.array([int(f) for f in fields], dtype=object)
+
+
+def read_chunks(input_file, fmt, meta, chunk_lines=CHUNK_LINES):
+    """
+    Parses an instance file a chunk of lines at a time
+
+    :param input_file: The open file
+    :param fmt: One of FORMATS
+    :param meta: A dictionary whose "max_weight" is set when the weight limit
+                 is read
+    :param chunk_lines: The number of lines per chunk
+    :return: A generator of arrays with one (weight, value) row per object
+    """
+    # Lisp forms may span lines, so the text after the last complete form of
+    # a chunk, from its last "(", is carried over to the next chunk
+    carry = ""
+    while True:
+        lines = list(itertools.islice(input_file, chunk_lines))
+        if not lines:
+            return
+        fields = list()
+        if fmt == "lisp":
+            text = carry + "".join(lines)
+            end = 0
+            for match in WEIGHT_PATTERN.finditer(text):
+                meta["max_weight"] = int(match.group(1))
+                end = max(end, match.end())
+            for match in PAIR_PATTERN.finditer(text):
+                fields.extend(match.groups())
+                end = max(end, match.end())
+            start = text.rfind("(", end)
+            carry = text[start:] if start >= 0 else ""
+        elif fmt == "csv":
+            for line in lines:
+                parts = [p.strip() for p in line.split(",")]
+                if len(parts) < 2:
+                    continue
+                if _is_int(parts[0]) and _is_int(parts[1]):
+                    fields.append(parts[0])
+                    fields.append(parts[1])
+                elif parts[0].lower() in MAX_WEIGHT_NAMES and \
+                        _is_int(parts[1]):
+                    meta["max_weight"] = int(parts[1])
+        elif fmt == "plain":
+            for line in lines:
+                parts = line.split()
+                if len(parts) >= 2:
+                    fields.append(parts[0])
+                    fields.append(parts[1])
+                elif len(parts) == 1 and "max_weight" not in meta:
+                    meta["max_weight"] = int(parts[0])
+        else:
+            raise ValueError("unknown format '{0}'".format(fmt))
+        if fields:
+            yield _to_array(fields).reshape(-1, 2)
+
+
+def _cache_fresh(cache_file, filename):
+    return os.path.exists(cache_file) and \
+        os.path.getmtime(cache_file) >= os.path.getmtime(filename)
+
+
+def _format_code(fmt):
+    # The format as stored in a cache. Negative, so the caches written before
+    # the format was stored, which held the number of objects there, never
+    # match
+    return -1 - FORMATS.index(fmt)
+
+
+def _write_cache(cache_file, table, fmt, max_weight):
+    """
+    Saves a parsed instance for load_instance. Row 0 holds the weight limit
+    and the format (see _format_code), the other rows the objects. Instances
+    that need Python integers are not cached, because they cannot be
+    memory-mapped
+
+    :param cache_file: The name of the cache file
+    :param table: The array of (weight, value) rows
+    :param fmt: The format the file was parsed in
+    :param max_weight: The weight limit read from the file, or None
+    """
+    if max_weight is None:
+        max_weight = NO_LIMIT
+    if table.dtype == object or not -2 ** 63 <= max_weight < 2 ** 63:
+        return
+    header = numpy.array([[max_weight, _format_code(fmt)]], dtype=numpy.int64)
+    temporary = cache_file + ".tmp"
+    try:
+        with open(temporary, "wb") as output_file:
+            numpy.save(output_file, numpy.vstack((header, table)))
+        os.rename(temporary, cache_file)
+    except (IOError, OSError):
+        # The cache is only an optimisation; a read-only directory is fine
+        pass
+
+
+def load_instance(filename, fmt=None, max_weight=None, cache=None,
+                  chunk_lines=CHUNK_LINES):
+    """
+    Loads a knapsack instance
+
+    :param filename: The name of the file
+    :param fmt: One of FORMATS, or None to detect it
+    :param max_weight: The weight limit, overriding the one in the file
+    :param cache: Use and write the "<file>.npy" cache; None does so for files
+                  of at least CACHE_MIN_BYTES. A cache of the file parsed in
+                  another format is not used, but written again
+    :param chunk_lines: The number of lines parsed at a time
+    :return: A tuple of the array of weights, the array of values and the
+             weight limit
+    """
+    cache_file = filename + ".npy"
+    if cache is None:
+        cache = os.path.getsize(filename) >= CACHE_MIN_BYTES
+    if fmt is None:
+        fmt = detect_format(filename)
+    elif fmt not in FORMATS:
+        raise ValueError("unknown instance format '{0}'".format(fmt))
+    table = None
+    if cache and _cache_fresh(cache_file, filename):
+        table = numpy.load(cache_file, mmap_mode="r")
+        if table[0, 1] != _format_code(fmt):
+            table = None
+        else:
+            if max_weight is None and table[0, 0] != NO_LIMIT:
+                max_weight = int(table[0, 0])
+            table = table[1:]
+    if table is None:
+        meta = dict()
+        table = numpy.zeros((0, 2), dtype=numpy.int64)
+        used = 0
+        with open(filename, "r") as input_file:
+            for chunk in read_chunks(input_file, fmt, meta, chunk_lines):
+                if chunk.dtype == object and table.dtype != object:
+                    table = table[:used].astype(object)
+                end = used + len(chunk)
+                if end > len(table):
+                    # Grown in place where the allocator allows it
+                    table.resize((max(end, 2 * len(table)), 2),
+                                 refcheck=False)
+                table[used:end] = chunk
+                used = end
+        table.resize((used, 2), refcheck=False)
+        if cache:
+            _write_cache(cache_file, table, fmt, meta.get("max_weight"))
+        if max_weight is None:
+            max_weight = meta.get("max_weight")
+    if max_weight is None:
+        raise ValueError("{0} has no weight limit".format(filename))
+    return table[:, 0], table[:, 1], max_weight
+
+
+def objects(weights, values):
+    """
+    Turns the arrays of load_instance into the object lists the solvers use
+
+    :param weights: The array of weights
+    :param values: The array of values
+    :return: A list of (weight, value) tuples of Python integers
+    """
+    return zip(weights.tolist(), values.tolist())
+
+
+# ------------------------------------------------------------------------------
+# Generated instances
+#
+def generate_instance(family, n, coefficient_range=1000, capacity=None,
+                      seed=0):
+    """
+    Generates an instance of one of the classic families of hard knapsack
+    instances. Weights are uniform in [1, R], and values are
+      uncorrelated - uniform in [1, R]
+      weakly       - within R / 10 of the weight (and at least 1)
+      strongly     - the weight plus R / 10
+      subset-sum   - equal to the weight
+    The solvers pack objects with replacement, so the default capacity does
+    not grow with n: it holds CAPACITY_OBJECTS objects of average weight
+
+    :param family: One of FAMILIES
+    :param n: The number of objects
+    :param coefficient_range: R
+    :param capacity: The weight limit; None for the default
+    :param seed: The random seed; the same arguments give the same instance
+    :return: A tuple of the array of weights, the array of values and the
+             weight limit, like load_instance
+    """
+    rng = numpy.random.RandomState(seed)
+    r = coefficient_range
+    weights = rng.randint(1, r + 1, n).astype(numpy.int64)
+    if family == "uncorrelated":
+        values = rng.randint(1, r + 1, n).astype(numpy.int64)
+    elif family == "weakly":
+        values = numpy.maximum(weights + rng.randint(-(r // 10), r // 10 + 1, n),
+                               1)
+    elif family == "strongly":
+        values = weights + r // 10
+    elif family == "subset-sum":
+        values = weights.copy()
+    else:
+        raise ValueError("unknown instance family '{0}'".format(family))
+    if capacity is None:
+        capacity = CAPACITY_OBJECTS * (r + 1) // 2
+    return weights, values, capacity
+
+
+################################################################################
+################################################################################
+# RUN THE PROGRAM
+#
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("datafile")
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--no-cache", dest="cache", action="store_false",
+                        default=None)
+    args = parser.parse_args()
+
+    start = time.time()
+    weights, values, max_weight = load_instance(args.datafile, args.format,
+                                                cache=args.cache)
+    print >> sys.stderr, "instances: {0} objects, max weight {1}, total " \
+                         "weight {2}, total value {3}, {4:.3f}s".format(
+                             len(weights), max_weight, weights.sum(),
+                             values.sum(), time.time() - start)
+
+
+if __name__ == "__main__":
+    main()
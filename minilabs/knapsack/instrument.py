@@ -0,0 +1,188 @@
+################################################################################
+# INSTRUMENTATION
+#
+# Timers, counters and events for the solver loops. sa_knapsack and
+# genetic_knapsack take an Instrument as 'instrument'; they add the time of
+# each phase of their loop to its timers (neighbour, cost, accept for
+# annealing; fitness, selection, crossover, mutation for the genetic
+# algorithm), count evaluations, accepted moves and cache hits, and report an
+# event after every temperature level or generation. The default is no
+# Instrument, in which case the loops only test one local variable per phase.
+#
+# Events go to the hooks of the Instrument (functions taking the event
+# dictionary) and, as one JSON object per line, to its log, so a run can be
+# watched as it goes or loaded into other tools afterwards. Every event has
+# the fields "event", "run" and "t" (seconds since the Instrument was made);
+# the last one, "finish", also holds the totals of every timer and counter.
+#
+# profile() runs a function under cProfile, and Sampler is a statistical
+# profiler that looks at the stack of the main thread at a fixed interval.
+#
+import sys
+import json
+import time
+import signal
+import cProfile
+import pstats
+from collections import defaultdict
+
+clock = time.time
+
+
+# ------------------------------------------------------------------------------
+# Instrument
+#
+class Instrument(object):
+
+    # Constructor; 'log' is a file name or an open file for the JSON lines,
+    # 'hooks' functions to call with every event and 'run' a name for the
+    # events of this run
+    def __init__(self, log=None, hooks=(), run=None):
+        self.timers = defaultdict(float)
+        self.counters = defaultdict(int)
+        self.hooks = list(hooks)
+        self.run = run
+        self.start = clock()
+        self.__close = isinstance(log, basestring)
+        self.__log = open(log, "a") if self.__close else log
+
+    # Add 'seconds' to the timer of 'phase'
+    def add(self, phase, seconds):
+        self.timers[phase] += seconds
+
+    # Add 'n' to counter 'name'
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def event(self, kind, **fields):
+        """
+        Reports an event to the hooks and the log
+
+        :param kind: The kind of event ("level", "generation", "finish", ...)
+        :param fields: The data of the event; must be JSON serializable
+        :return: The event dictionary
+        """
+        record = {"event": kind, "run": self.run, "t": clock() - self.start}
+        record.update(fields)
+        for hook in self.hooks:
+            hook(record)
+        if self.__log is not None:
+            self.__log.write(json.dumps(record, sort_keys=True) + "\n")
+        return record
+
+    # Totals of every timer and counter
+    def summary(self):
+        return {"timers": dict(self.timers), "counters": dict(self.counters)}
+
+    # Report the "finish" event with the totals, plus 'fields'
+    def finish(self, **fields):
+        fields.update(self.summary())
+        record = self.event("finish", **fields)
+        if self.__log is not None:
+            self.__log.flush()
+        return record
+
+    # Close the log if the Instrument opened it
+    def close(self):
+        if self.__close and self.__log is not None:
+            self.__log.close()
+            self.__log = None
+
+    def report(self):
+        """
+        Formats the timers and counters as text
+
+        :return: A list of lines
+        """
+        total = sum(self.timers.values())
+        lines = list()
+        for phase, seconds in sorted(self.timers.items(),
+                                     key=lambda item: -item[1]):
+            lines.append("{0:<12} {1:9.3f}s {2:5.1f}%".format(
+                phase, seconds, 100.0 * seconds / total if total else 0.0))
+        for name, value in sorted(self.counters.items()):
+            lines.append("{0:<12} {1:>10}".format(name, value))
+        return lines
+
+
+# ------------------------------------------------------------------------------
+# Profiling
+#
+def profile(function, *args, **kwargs):
+    """
+    Calls a function under cProfile and prints the most expensive functions
+    to stderr. Takes the keyword arguments 'profile_out' (a file to save the
+    statistics to, for pstats or a viewer), 'profile_sort' and 'profile_top'
+    besides those of the function
+
+    :param function: The function to call
+    :param args: Its arguments
+    :param kwargs: Its keyword arguments
+    :return: What the function returns
+    """
+    out = kwargs.pop("profile_out", None)
+    sort = kwargs.pop("profile_sort", "cumulative")
+    top = kwargs.pop("profile_top", 20)
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args, **kwargs)
+    finally:
+        if out is not None:
+            profiler.dump_stats(out)
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats(sort)\
+            .print_stats(top)
+
+
+class Sampler(object):
+
+    # Constructor; samples the stack every 'interval' seconds of CPU time.
+    # Uses SIGPROF, so it only works on Unix and in the main thread
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = 0
+        self.functions = defaultdict(int)   # samples inside, or below, each
+        self.lines = defaultdict(int)       # samples at the top of the stack
+        self.__previous = None
+
+    def __enter__(self):
+        self.__previous = signal.signal(signal.SIGPROF, self.__sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        return self
+
+    def __exit__(self, kind, value, traceback):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, self.__previous or signal.SIG_DFL)
+        return False
+
+    def report(self, top=20):
+        """
+        Formats the most sampled functions and lines
+
+        :param top: The number of each to list
+        :return: A list of lines
+        """
+        lines = ["{0} samples every {1}s".format(self.samples,
+                                                 self.interval)]
+        for title, table in (("functions", self.functions),
+                             ("lines", self.lines)):
+            lines.append(title + ":")
+            for key, count in sorted(table.items(),
+                                     key=lambda item: -item[1])[:top]:
+                lines.append("{0:6.1f}% {1}".format(
+                    100.0 * count / max(self.samples, 1), key))
+        return lines
+
+    # Signal handler
+    def __sample(self, signum, frame):
+        self.samples += 1
+        code = frame.f_code
+        self.lines["{0}:{1} ({2})".format(code.co_filename, frame.f_lineno,
+                                          code.co_name)] += 1
+        seen = set()
+        while frame is not None:
+            code = frame.f_code
+            key = "{0}:{1}".format(code.co_filename, code.co_name)
+            if key not in seen:
+                seen.add(key)
+                self.functions[key] += 1
+            frame = frame.f_back
@@ -0,0 +1,218 @@
+################################################################################
+# KNAPSACK MODEL
+#
+# The Knapsack class used by both minilabs. A knapsack is a list of objects
+# ((weight, value) tuples, repeated for objects packed more than once) with
+# running weight and value totals.
+#
+# The class is built for the hot loops of the solvers: it has slots instead of
+# an instance dictionary, keeps the number of copies of every object next to
+# the list once they have been asked for, and copy() shares the list and
+# counts until one of the copies changes them. Adding an object, replacing the
+# object at a position (swap) and counting the copies of an object are O(1).
+# Removing an object keeps the order of the list, which the one-point
+# crossover of the genetic algorithm cuts at a position, so it is O(n) in the
+# length of the list. (A swap-remove with an index of positions would be O(1),
+# but the crossover replaces the list of every child, so the index would be
+# built again, in O(n), for nearly every knapsack it served.)
+#
+# The counts are not made by the constructor; they are counted, in O(n), on
+# the first count(). Replacing the whole list through objects(), as the
+# crossover does, and changing a copy drop them again. The hot loops of the
+# solvers make, copy and change knapsacks without counting, so they never pay
+# for counts they do not use.
+#
+# digest() is a hash of the knapsack's objects that does not depend on their
+# order: the sum of the hashes of the objects. It is kept up to date by add,
+# remove and swap in O(1), is carried over by copy(), and is only summed up
+# again, in O(n), after the list is replaced through objects().
+#
+import random
+from collections import defaultdict
+
+
+# ------------------------------------------------------------------------------
+# Knapsack
+#
+# Class representing a knapsack in the Knapsack Problem.
+#
+class Knapsack(object):
+
+    __slots__ = ("__objects", "__weight", "__value", "__max_weight",
+                 "__counts", "__shared", "__digest")
+
+    # Constructor; the object list is copied, the totals are taken as given
+    def __init__(self, objs=None, weight=0, value=0, max_weight=0):
+        self.__objects = list(objs) if objs is not None else list()
+        self.__weight = weight
+        self.__value = value
+        self.__max_weight = max_weight
+        self.__shared = False       # the list and counts are shared with a copy
+        self.__digest = None        # sum of the hashes of the objects
+        self.__counts = None        # object -> its copies; counted when needed
+
+    # Getter/Setter for objects list. The list returned must not be changed;
+    # use add_object, remove_object and swap. The setter takes over 'objs'
+    # and leaves the totals alone
+    def objects(self, objs=None):
+        if objs is None:
+            return self.__objects
+        else:
+            self.__objects = objs
+            self.__counts = None
+            self.__shared = False
+            self.__digest = None
+
+    # Add an object 'obj' to the list of objects
+    def add_object(self, obj):
+        if obj[0] + self.__weight > self.__max_weight:
+            return False
+        self.__own()
+        self.__objects.append(obj)
+        if self.__counts is not None:
+            self.__counts[obj] = self.__counts.get(obj, 0) + 1
+        if self.__digest is not None:
+            self.__digest += hash(obj)
+        self.__weight += obj[0]
+        self.__value += obj[1]
+        return True
+
+    # Remove the first copy of object 'obj' from the list of objects
+    def remove_object(self, obj):
+        if self.__counts is not None and obj not in self.__counts:
+            return False
+        self.__own()
+        try:
+            self.__objects.remove(obj)
+        except ValueError:
+            return False
+        if self.__counts is not None:
+            self.__uncount(obj)
+        if self.__digest is not None:
+            self.__digest -= hash(obj)
+        self.__weight -= obj[0]
+        self.__value -= obj[1]
+        return True
+
+    # Replace the object at position 'pos' with 'obj' (the weight limit is not
+    # checked) and return the object that was there
+    def swap(self, pos, obj):
+        self.__own()
+        old_obj = self.__objects[pos]
+        self.__objects[pos] = obj
+        if self.__counts is not None:
+            self.__uncount(old_obj)
+            self.__counts[obj] = self.__counts.get(obj, 0) + 1
+        if self.__digest is not None:
+            self.__digest += hash(obj) - hash(old_obj)
+        self.__weight += obj[0] - old_obj[0]
+        self.__value += obj[1] - old_obj[1]
+        return old_obj
+
+    # Number of copies of 'obj' in the knapsack
+    def count(self, obj):
+        if self.__counts is None:
+            self.__recount()
+        return self.__counts.get(obj, 0)
+
+    # Hash of the objects in the knapsack, whatever their order. Knapsacks
+    # with the same objects have the same digest; different ones almost never
+    def digest(self):
+        if self.__digest is None:
+            self.__digest = sum(hash(o) for o in self.__objects)
+        return self.__digest
+
+    # Number of objects in the knapsack
+    def __len__(self):
+        return len(self.__objects)
+
+    # Getter/Setter for the knapsack weight
+    def weight(self, w=None):
+        if w is None:
+            return self.__weight
+        else:
+            self.__weight = w
+
+    # Getter/Setter for the knapsack's maximum weight limit
+    def max_weight(self, mw=None):
+        if mw is None:
+            return self.__max_weight
+        else:
+            self.__max_weight = mw
+
+    # Getter/Setter for the knapsack's overall value
+    def value(self, v=None):
+        if v is None:
+            return self.__value
+        else:
+            self.__value = v
+
+    # Copy of the knapsack, sharing the object list until either changes it
+    def copy(self):
+        k = self.__class__.__new__(self.__class__)
+        k.__objects = self.__objects
+        k.__weight = self.__weight
+        k.__value = self.__value
+        k.__max_weight = self.__max_weight
+        k.__counts = self.__counts
+        k.__shared = True
+        k.__digest = self.__digest
+        self.__shared = True
+        return k
+
+    # Fill the knapsack to capacity randomly using the provided objects
+    def fill(self, objects, threshold=10, pack=False):
+        obj = random.choice(objects)
+        while self.add_object(obj):
+            obj = random.choice(objects)
+        if pack:
+            weight_diff = self.max_weight() - self.weight()
+            while self.weight() > self.max_weight() - threshold:
+                found_none = True
+                for o in objects:
+                    if o[0] <= weight_diff:
+                        self.add_object(o)
+                        found_none = False
+                        break
+                if found_none:
+                    obj = random.choice(self.objects())
+                    self.remove_object(obj)
+                weight_diff = self.max_weight() - self.weight()
+
+    # toString method (used when str() is called on the knapsack object)
+    def __str__(self):
+        outstr = "---------- KNAPSACK CONTENTS ------------\n"
+        outstr += "Weight: {0}/{1}\t\tValue: {2}\n".format(self.weight(),
+                                                           self.max_weight(),
+                                                           self.value())
+
+        contents = defaultdict(int)
+        for o in self.objects():
+            contents[o] += 1
+        outstr += "Object\t\t\tCount\n"
+        for c in contents.keys():
+            outstr += "{0}\t\t\t{1}\n".format(c, contents[c])
+        return outstr
+
+    # Give this knapsack its own list before changing it; the counts are
+    # left to the other copy
+    def __own(self):
+        if self.__shared:
+            self.__objects = list(self.__objects)
+            self.__counts = None
+            self.__shared = False
+
+    # Count the copies of every object in the list
+    def __recount(self):
+        counts = dict()
+        for o in self.__objects:
+            counts[o] = counts.get(o, 0) + 1
+        self.__counts = counts
+
+    # Take one copy of 'obj' off the counts
+    def __uncount(self, obj):
+        left = self.__counts[obj] - 1
+        if left:
+            self.__counts[obj] = left
+        else:
+            del self.__counts[obj]
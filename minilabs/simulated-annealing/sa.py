@@ -2,107 +2,20 @@
 # SIMULATED ANNEALING MINILAB
 #
 import os
-import copy
+import sys
+import itertools
 import random
 import numpy
 import logging
 import math
-from collections import defaultdict
+import time
+import multiprocessing
 
-
-# ------------------------------------------------------------------------------
-# Knapsack
-#
-# Class representing a knapsack in the Knapsack Problem.
-#
-class Knapsack:
-
-    # Constructor
-    def __init__(self, objs=list(), weight=0, value=0, max_weight=0):
-        self.__objects = copy.deepcopy(objs)
-        self.__weight = weight
-        self.__value = value
-        self.__max_weight = max_weight
-
-    # Getter/Setter for objects list
-    def objects(self, objs=None):
-        if objs is None:
-            return self.__objects
-        else:
-            self.__objects = objs
-
-    # Add an object 'obj' to the list of objects
-    def add_object(self, obj):
-        if obj[0] + self.weight() > self.max_weight():
-            return False
-        self.__objects.append(obj)
-        self.__weight += obj[0]
-        self.__value += obj[1]
-        return True
-
-    # Remove an object 'obj' from the list of objects
-    def remove_object(self, obj):
-        if obj not in self.__objects:
-            return False
-        self.__objects.remove(obj)
-        self.__weight -= obj[0]
-        self.__value -= obj[1]
-        return True
-
-    # Getter/Setter for the knapsack weight
-    def weight(self, w=None):
-        if w is None:
-            return self.__weight
-        else:
-            self.__weight = w
-
-    # Getter/Setter for the knapsack's maximum weight limit
-    def max_weight(self, mw=None):
-        if mw is None:
-            return self.__max_weight
-        else:
-            self.__max_weight = mw
-
-    # Getter/Setter for the knapsack's overall value
-    def value(self, v=None):
-        if v is None:
-            return self.__value
-        else:
-            self.__value = v
-
-    # Fill the knapsack to capacity randomly using the provided objects
-    def fill(self, objects, threshold=10, pack=False):
-        obj = random.choice(objects)
-        while self.add_object(obj):
-            obj = random.choice(objects)
-        if pack:
-            weight_diff = self.max_weight() - self.weight()
-            while self.weight() > self.max_weight() - threshold:
-                found_none = True
-                for o in objects:
-                    if o[0] <= weight_diff:
-                        self.add_object(o)
-                        found_none = False
-                        break
-                if found_none:
-                    obj = random.choice(self.objects())
-                    self.remove_object(obj)
-                weight_diff = self.max_weight() - self.weight()
-
-    # toString method (used when str() is called on the knapsack object)
-    def __str__(self):
-        outstr = "---------- KNAPSACK CONTENTS ------------\n"
-        outstr += "Weight: {0}/{1}\t\tValue: {2}\n".format(self.weight(),
-                                                           self.max_weight(),
-                                                           self.value())
-
-        contents = defaultdict(int)
-        for o in self.objects():
-            contents[o] += 1
-        outstr += "Object\t\t\tCount\n"
-        for c in contents.keys():
-            outstr += "{0}\t\t\t{1}\n".format(c, contents[c])
-        return outstr
+# The shared knapsack package lives next to this minilab
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from knapsack import instances
+from knapsack.model import Knapsack
+from knapsack.instrument import clock
 
 
 # ------------------------------------------------------------------------------
@@ -118,14 +31,9 @@ def parse_knapsack(filename):
     :return: A tuple containing the knapsack max_weight and a list of objects
     """
     if os.path.exists(filename):
-        objects = list()
-        with open(filename, "r") as input_file:
-            max_weight = int(input_file.readline().rstrip())
-            for line in input_file:
-                parts = line.split()
-                objects.append((int(parts[0]), int(parts[1])))
-            input_file.close()
-        return max_weight, objects
+        weights, values, max_weight = instances.load_instance(filename,
+                                                              "plain")
+        return max_weight, instances.objects(weights, values)
 
 
 # ------------------------------------------------------------------------------
@@ -164,6 +72,18 @@ def sa_cost_combo(knapsack):
                * float(knapsack.value()))
 
 
+def sa_cost_loss(knapsack):
+    """
+    Evaluates the cost of a knapsack solution as its value lost, i.e. the
+    negated value, so that annealing (which minimizes the cost) looks for the
+    most valuable knapsack
+
+    :param knapsack: The knapsack object to evaluate
+    :return: The negated value of the knapsack
+    """
+    return -knapsack.value()
+
+
 def sa_neighbor(knapsack, objects):
     """
     Generates a random neighbor to the provided knapsack by only changing one
@@ -173,8 +93,7 @@ def sa_neighbor(knapsack, objects):
     :param objects: The list of available objects
     :return: A new knapsack object that is a neighbor to the original
     """
-    neighbor = Knapsack(knapsack.objects(), knapsack.weight(), knapsack.value(),
-                        knapsack.max_weight())
+    neighbor = knapsack.copy()
     pos = numpy.random.randint(0, len(neighbor.objects()) - 1)
     old_obj = neighbor.objects()[pos]
     index = numpy.random.choice(len(objects))
@@ -184,9 +103,7 @@ def sa_neighbor(knapsack, objects):
         old_obj = neighbor.objects()[pos]
         index = numpy.random.choice(len(objects))
         obj = objects[index]
-    neighbor.objects()[pos] = obj
-    neighbor.weight(neighbor.weight() - old_obj[0] + obj[0])
-    neighbor.value(neighbor.value() - old_obj[1] + obj[1])
+    neighbor.swap(pos, obj)
 
     return neighbor
 
@@ -201,52 +118,805 @@ def sa_acceptance_probability(old_cost, new_cost, temperature):
     :param temperature: The temperature of the algorithm at this time
     :return: The probability that we will accept the new solution
     """
+    if new_cost <= old_cost:
+        # exp() of a non-negative number, which can overflow at low
+        # temperatures; any probability of at least 1 means the same
+        return 1.0
     return math.exp(float(float((old_cost - new_cost)) / float(temperature)))
 
 
+# Cost functions written in terms of the knapsack totals, used by the array
+# engine so a neighbor can be evaluated without building a Knapsack
+SA_TOTALS_COST = {
+    sa_cost_value: lambda weight, value, max_weight: value,
+    sa_cost_weight: lambda weight, value, max_weight: weight,
+    sa_cost_loss: lambda weight, value, max_weight: -value,
+    sa_cost_combo: lambda weight, value, max_weight: int(
+        weight * 2.0 / max_weight * value),
+}
+
+
+# ------------------------------------------------------------------------------
+# KnapsackView
+#
+# Read-only stand-in for a Knapsack held by the array engine, so that cost
+# functions without a totals-based form can still be used. The object list is
+# only built when the cost function asks for it.
+#
+class KnapsackView:
+
+    # Constructor
+    def __init__(self, objects, slots, max_weight):
+        self.__objects = objects
+        self.__slots = slots
+        self.__max_weight = max_weight
+        self.__weight = 0
+        self.__value = 0
+        self.__change = None
+
+    # Look at the knapsack with the object in slot 'pos' replaced by object
+    # 'index' (None for no change) and the given totals
+    def propose(self, weight, value, pos=None, index=None):
+        self.__weight = weight
+        self.__value = value
+        self.__change = None if pos is None else (pos, index)
+        return self
+
+    def objects(self):
+        objs = [self.__objects[i] for i in self.__slots]
+        if self.__change is not None:
+            objs[self.__change[0]] = self.__objects[self.__change[1]]
+        return objs
+
+    def weight(self):
+        return self.__weight
+
+    def value(self):
+        return self.__value
+
+    def max_weight(self):
+        return self.__max_weight
+
+
+# ------------------------------------------------------------------------------
+# Cooling schedules
+#
+# A schedule hands out the temperature of every level. start() returns the
+# first temperature; after each level next() is told the fraction of moves
+# that were accepted and whether the best cost improved, and returns the
+# next temperature or None to stop.
+#
+class GeometricCooling:
+
+    # Constructor; the defaults are the original sa_knapsack parameters
+    def __init__(self, temperature=1.0, temp_min=0.00001, alpha=0.9):
+        self.temperature = temperature
+        self.temp_min = temp_min
+        self.alpha = alpha
+
+    def start(self):
+        return self.temperature if self.temperature > self.temp_min else None
+
+    def next(self, temperature, acceptance, improved):
+        temperature *= self.alpha
+        return temperature if temperature > self.temp_min else None
+
+
+class LinearCooling:
+
+    # Constructor; the temperature drops in equal steps over 'levels' levels
+    def __init__(self, temperature=1.0, temp_min=0.00001, levels=110):
+        self.temperature = temperature
+        self.step = float(temperature - temp_min) / max(levels - 1, 1)
+        self.levels = levels
+        self.__level = 0
+
+    def start(self):
+        self.__level = 0
+        return self.temperature
+
+    def next(self, temperature, acceptance, improved):
+        self.__level += 1
+        if self.__level >= self.levels:
+            return None
+        return self.temperature - self.__level * self.step
+
+
+class LogarithmicCooling:
+
+    # Constructor; level k runs at temperature * log(2) / log(k + 2), the
+    # slow schedule of the classic convergence proof
+    def __init__(self, temperature=1.0, temp_min=0.00001, levels=110):
+        self.temperature = temperature
+        self.temp_min = temp_min
+        self.levels = levels
+        self.__level = 0
+
+    def start(self):
+        self.__level = 0
+        return self.temperature
+
+    def next(self, temperature, acceptance, improved):
+        self.__level += 1
+        temperature = self.temperature * math.log(2) / \
+            math.log(self.__level + 2)
+        if self.__level >= self.levels or temperature <= self.temp_min:
+            return None
+        return temperature
+
+
+class AdaptiveCooling:
+
+    # Constructor. Cools by alpha ** 2 while more than 'high' of the moves are
+    # accepted (still too hot to matter) and by sqrt(alpha) while fewer than
+    # 'low' are (freezing, where the work is). After 'patience' levels without
+    # a new best cost the temperature is multiplied by 'reheat' (but not above
+    # the starting temperature), up to 'reheats' times; without reheats, or
+    # once they are used up, it stops. Levels above the temperature of the
+    # last reheat do not count towards the patience
+    def __init__(self, temperature=1.0, temp_min=0.00001, alpha=0.9, low=0.02,
+                 high=0.5, patience=10, reheat=None, reheats=3):
+        self.temperature = temperature
+        self.temp_min = temp_min
+        self.alpha = alpha
+        self.low = low
+        self.high = high
+        self.patience = patience
+        self.reheat = reheat
+        self.reheats = reheats
+        self.__stale = 0
+        self.__reheated = 0
+        self.__resume = float("inf")
+
+    def start(self):
+        self.__stale = 0
+        self.__reheated = 0
+        self.__resume = float("inf")
+        return self.temperature
+
+    def next(self, temperature, acceptance, improved):
+        if improved or temperature > self.__resume:
+            self.__stale = 0
+        else:
+            self.__stale += 1
+        if self.__stale >= self.patience:
+            if self.reheat is None or self.__reheated >= self.reheats:
+                return None
+            self.__stale = 0
+            self.__reheated += 1
+            self.__resume = temperature
+            return min(temperature * self.reheat, self.temperature)
+        if acceptance > self.high:
+            temperature *= self.alpha ** 2
+        elif acceptance < self.low:
+            temperature *= math.sqrt(self.alpha)
+        else:
+            temperature *= self.alpha
+        return temperature if temperature > self.temp_min else None
+
+
+class ListCooling:
+
+    # Constructor; runs one level at each of the given temperatures
+    def __init__(self, temperatures):
+        self.temperatures = list(temperatures)
+        self.__level = 0
+
+    def start(self):
+        self.__level = 0
+        return self.temperatures[0] if self.temperatures else None
+
+    def next(self, temperature, acceptance, improved):
+        self.__level += 1
+        if self.__level >= len(self.temperatures):
+            return None
+        return self.temperatures[self.__level]
+
+
 # ------------------------------------------------------------------------------
 # Algorithm implementation
 #
-def sa_knapsack(objects, max_weight, costfun=sa_cost_value):
+def sa_seed(seed):
+    """
+    Seeds both random number generators used by the algorithm, so that a run
+    can be repeated
+
+    :param seed: The seed, or None to leave the generators alone
+    """
+    if seed is not None:
+        random.seed(seed)
+        numpy.random.seed(seed)
+
+
+def sa_knapsack(objects, max_weight, costfun=sa_cost_value, engine="list",
+                temperature=1.0, temp_min=0.00001, alpha=0.9, iterations=1000,
+                seed=None, stats=None, schedule=None, instrument=None):
     """
     Solves the knapsack problem using the simulated annealing algorithm.
 
     :param objects: A list of objects that can be included in the knapsack. Each
                     object is  a weight, value pair
     :param max_weight: The maximum weight of the knapsack
+    :param engine: "list" works on Knapsack objects, "array" runs the same
+                   algorithm with sa_knapsack_array
+    :param temperature: The starting temperature
+    :param temp_min: The algorithm stops once the temperature drops below this
+    :param alpha: The temperature is multiplied by alpha after every level
+    :param iterations: The number of neighbors tried at each temperature
+    :param seed: Seed for the random number generators
+    :param stats: A dictionary to fill in with the number of levels,
+                  evaluations, accepted moves and the final cost
+    :param schedule: A cooling schedule; replaces temperature, temp_min and
+                     alpha, which otherwise make a GeometricCooling
+    :param instrument: An instrument.Instrument to time the neighbor, cost and
+                       accept phases, count evaluations and accepted moves and
+                       report a "level" event after every temperature level
     :return: A knapsack object containing the solution
     """
+    if schedule is None:
+        schedule = GeometricCooling(temperature, temp_min, alpha)
+    if engine == "array":
+        return sa_knapsack_array(objects, max_weight, costfun, iterations,
+                                 seed, stats, schedule, instrument)
 
     # Generate a knapsack
+    sa_seed(seed)
     solution = Knapsack(max_weight=max_weight)
     solution.fill(objects, pack=True)
     old_cost = costfun(solution)
-    temperature = 1.0
-    temp_min = 0.00001
-    alpha = 0.9
-    while temperature > temp_min:
+    best_cost = old_cost
+    levels = 0
+    accepted = 0
+    timed = instrument is not None
+    temperature = schedule.start()
+    while temperature is not None:
+        level_best = best_cost
+        level_accepted = 0
+        neighbor_time = cost_time = accept_time = 0.0
         i = 0
-        while i < 1000:
+        while i < iterations:
+            if timed:
+                t0 = clock()
             new_solution = sa_neighbor(solution, objects)
+            if timed:
+                t1 = clock()
             new_cost = costfun(new_solution)
+            if timed:
+                t2 = clock()
             ap = sa_acceptance_probability(old_cost, new_cost, temperature)
             if ap > random.random():
                 solution = new_solution
                 old_cost = new_cost
+                level_accepted += 1
+                if new_cost < best_cost:
+                    best_cost = new_cost
+            if timed:
+                t3 = clock()
+                neighbor_time += t1 - t0
+                cost_time += t2 - t1
+                accept_time += t3 - t2
             i += 1
-        temperature *= alpha
+        accepted += level_accepted
+        levels += 1
+        if timed:
+            instrument.add("neighbor", neighbor_time)
+            instrument.add("cost", cost_time)
+            instrument.add("accept", accept_time)
+            sa_report_level(instrument, levels, temperature, iterations,
+                            level_accepted, old_cost, best_cost)
+        temperature = schedule.next(temperature,
+                                    float(level_accepted) / iterations,
+                                    best_cost < level_best)
+    if stats is not None:
+        stats.update(levels=levels, evaluations=levels * iterations,
+                     accepted=accepted, cost=old_cost)
     return solution
 
     return None
 
 
+def sa_report_level(instrument, level, temperature, iterations, accepted,
+                    cost, best_cost):
+    """
+    Counts the moves of a temperature level and reports its "level" event
+
+    :param instrument: The instrument.Instrument
+    :param level: The number of the level, from 1
+    :param temperature: The temperature of the level
+    :param iterations: The number of neighbors tried
+    :param accepted: The number of them accepted
+    :param cost: The cost at the end of the level
+    :param best_cost: The best cost so far
+    """
+    instrument.count("evaluations", iterations)
+    instrument.count("accepted", accepted)
+    instrument.event("level", level=level, temperature=temperature,
+                     acceptance=float(accepted) / iterations, cost=cost,
+                     best_cost=best_cost)
+
+
+def sa_draw_batches(slots, count, size):
+    """
+    Generates batches of random neighbor moves for the array engine
+
+    :param slots: The number of slots a move can pick from
+    :param count: The number of available objects
+    :param size: The number of moves in a batch
+    :return: A generator of lists of (slot, object index) pairs
+    """
+    while True:
+        yield zip(numpy.random.randint(0, slots, size).tolist(),
+                  numpy.random.randint(0, count, size).tolist())
+
+
+def sa_fill_slots(objects, max_weight):
+    """
+    Fills a knapsack the same way sa_knapsack does and returns it as an array
+    of object indices
+
+    :param objects: The list of available objects
+    :param max_weight: The maximum weight of the knapsack
+    :return: A list holding the index of every object in the knapsack
+    """
+    index = dict()
+    for i, o in enumerate(objects):
+        index.setdefault(o, i)
+    solution = Knapsack(max_weight=max_weight)
+    solution.fill(objects, pack=True)
+    return [index[o] for o in solution.objects()]
+
+
+def sa_anneal_levels(objects, max_weight, state, costfun, schedule,
+                     iterations=1000, instrument=None):
+    """
+    The array engine, one temperature level at a time. The knapsack is kept
+    as an array of object indices (one slot per object in the knapsack) with
+    running weight and value totals, so a neighbor is evaluated from the
+    change to the totals instead of by copying the knapsack. The random
+    numbers for each temperature level are drawn in one batch, and a move is
+    accepted when its cost increase is below -T * log(u), which is the same
+    test as sa_acceptance_probability(old, new, T) > u
+
+    The state is a dictionary that is updated in place and yielded after
+    every level. It starts with only "slots" (the object indices of the
+    starting solution) and is given the temperature of the next level (None
+    after the last one), the totals and cost of the solution, the best cost
+    met with its slots and totals, and the numbers of levels, evaluations and
+    accepted moves. A state yielded earlier can be passed in again to carry
+    on from it, with the schedule in the state it was in at the time
+
+    :param objects: The list of available objects
+    :param max_weight: The maximum weight of the knapsack
+    :param state: The state to start or carry on from
+    :param costfun: The cost function; functions in SA_TOTALS_COST are
+                    evaluated from the totals, others through a KnapsackView
+    :param schedule: The cooling schedule
+    :param iterations: The number of neighbors tried at each temperature
+    :param instrument: An instrument.Instrument, as in sa_knapsack. Drawing,
+                       evaluating and accepting a move are one short loop
+                       here, so the loop is timed as a whole per level: the
+                       phases are "draw" (the thresholds of a level) and
+                       "moves"
+    :return: A generator yielding the state after every level
+    """
+    weights = [o[0] for o in objects]
+    values = [o[1] for o in objects]
+    slots = state["slots"]
+    weight = sum(weights[i] for i in slots)
+    value = sum(values[i] for i in slots)
+
+    cost = SA_TOTALS_COST.get(costfun)
+    view = None
+    if cost is None:
+        view = KnapsackView(objects, slots, max_weight)
+        cost = lambda w, v, mw: costfun(view)
+        view.propose(weight, value)
+    old_cost = cost(weight, value, max_weight)
+    if "temperature" not in state:
+        state.update(temperature=schedule.start(), levels=0, evaluations=0,
+                     accepted=0, best_cost=old_cost, best_slots=list(slots),
+                     best_weight=weight, best_value=value)
+    state.update(weight=weight, value=value, cost=old_cost)
+
+    # Like sa_neighbor, never pick the last slot
+    high = max(len(slots) - 1, 1)
+    best_cost = state["best_cost"]
+    best_slots = state["best_slots"]
+    best_weight = state["best_weight"]
+    best_value = state["best_value"]
+    timed = instrument is not None
+    temperature = state["temperature"]
+    while temperature is not None:
+        level_best = best_cost
+        level_accepted = 0
+        if timed:
+            t0 = clock()
+        thresholds = (-temperature * numpy.log(
+            1.0 - numpy.random.random(iterations))).tolist()
+        if timed:
+            t1 = clock()
+        # Moves are drawn afresh every level, so that nothing drawn is left
+        # over when the state is yielded
+        draws = itertools.chain.from_iterable(
+            sa_draw_batches(high, len(objects), iterations))
+        for threshold in thresholds:
+            # Draw until the replacement fits, as sa_neighbor does
+            for pos, index in draws:
+                old = slots[pos]
+                new_weight = weight - weights[old] + weights[index]
+                if new_weight <= max_weight:
+                    break
+            new_value = value - values[old] + values[index]
+            if view is not None:
+                view.propose(new_weight, new_value, pos, index)
+            new_cost = cost(new_weight, new_value, max_weight)
+            if new_cost - old_cost < threshold:
+                slots[pos] = index
+                weight = new_weight
+                value = new_value
+                old_cost = new_cost
+                level_accepted += 1
+                if new_cost < best_cost:
+                    best_cost = new_cost
+                    best_slots = slots[:]
+                    best_weight = weight
+                    best_value = value
+        if timed:
+            instrument.add("draw", t1 - t0)
+            instrument.add("moves", clock() - t1)
+            sa_report_level(instrument, state["levels"] + 1, temperature,
+                            iterations, level_accepted, old_cost, best_cost)
+        temperature = schedule.next(temperature,
+                                    float(level_accepted) / iterations,
+                                    best_cost < level_best)
+        state.update(temperature=temperature, weight=weight, value=value,
+                     cost=old_cost, best_cost=best_cost, best_slots=best_slots,
+                     best_weight=best_weight, best_value=best_value,
+                     levels=state["levels"] + 1,
+                     evaluations=state["evaluations"] + iterations,
+                     accepted=state["accepted"] + level_accepted)
+        yield state
+
+
+def sa_anneal_slots(objects, max_weight, slots, costfun, schedule,
+                    iterations=1000, stats=None, instrument=None):
+    """
+    Runs the array engine (see sa_anneal_levels) through the whole schedule
+
+    :param objects: The list of available objects
+    :param max_weight: The maximum weight of the knapsack
+    :param slots: The object indices of the starting solution; updated in place
+    :param costfun: The cost function
+    :param schedule: The cooling schedule
+    :param iterations: The number of neighbors tried at each temperature
+    :param stats: A dictionary whose levels, evaluations and accepted counts
+                  are increased, and whose cost is set to the final cost
+    :param instrument: An instrument.Instrument (see sa_anneal_levels)
+    :return: A tuple of the final weight, value and cost
+    """
+    state = {"slots": slots}
+    for state in sa_anneal_levels(objects, max_weight, state, costfun,
+                                  schedule, iterations, instrument):
+        pass
+
+    if stats is not None:
+        stats["levels"] = stats.get("levels", 0) + state["levels"]
+        stats["evaluations"] = stats.get("evaluations", 0) + \
+            state["evaluations"]
+        stats["accepted"] = stats.get("accepted", 0) + state["accepted"]
+        stats["cost"] = state["cost"]
+    return state["weight"], state["value"], state["cost"]
+
+
+def sa_knapsack_array(objects, max_weight, costfun=sa_cost_value,
+                      iterations=1000, seed=None, stats=None, schedule=None,
+                      instrument=None):
+    """
+    Runs the same annealing as sa_knapsack with the array engine (see
+    sa_anneal_slots)
+
+    :param objects: A list of objects that can be included in the knapsack. Each
+                    object is  a weight, value pair
+    :param max_weight: The maximum weight of the knapsack
+    :param costfun: The cost function
+    :param iterations: The number of neighbors tried at each temperature
+    :param seed: Seed for the random number generators
+    :param stats: A dictionary to fill in with the number of levels,
+                  evaluations, accepted moves and the final cost
+    :param schedule: The cooling schedule; defaults to GeometricCooling()
+    :param instrument: An instrument.Instrument (see sa_anneal_slots)
+    :return: A knapsack object containing the solution
+    """
+    if schedule is None:
+        schedule = GeometricCooling()
+    sa_seed(seed)
+    slots = sa_fill_slots(objects, max_weight)
+    weight, value, cost = sa_anneal_slots(objects, max_weight, slots, costfun,
+                                          schedule, iterations, stats,
+                                          instrument)
+    return Knapsack([objects[i] for i in slots], weight, value, max_weight)
+
+
+def sa_anytime(objects, max_weight, costfun=sa_cost_value, iterations=1000,
+               seed=None, schedule=None, budget=None, checkpoint=None,
+               instrument=None):
+    """
+    Runs the array engine as an anytime algorithm (see knapsack/anytime.py):
+    a generator that yields the progress of the run after every temperature
+    level, stops when the schedule ends or the budget is spent, and can be
+    stopped at any point by the caller
+
+    :param objects: A list of objects that can be included in the knapsack. Each
+                    object is  a weight, value pair
+    :param max_weight: The maximum weight of the knapsack
+    :param costfun: The cost function
+    :param iterations: The number of neighbors tried at each temperature
+    :param seed: Seed for the random number generators of a new run
+    :param schedule: The cooling schedule; defaults to GeometricCooling()
+    :param budget: An anytime.Budget, or None to run the whole schedule
+    :param checkpoint: An anytime.Checkpoint. A run resumes from its file if
+                       there is one, and saves its state to it every interval
+                       and when it stops; a resumed run must be given the
+                       same objects, cost function, iterations and schedule
+    :param instrument: An instrument.Instrument (see sa_anneal_levels)
+    :return: A generator of dictionaries with the best knapsack so far
+             ("best") and its cost, the temperature level, the next
+             temperature, the evaluations and seconds spent (over every
+             resumed run) and the trace of the best cost
+    """
+    if schedule is None:
+        schedule = GeometricCooling()
+    state = checkpoint.load("sa") if checkpoint is not None else None
+    if state is None:
+        sa_seed(seed)
+        state = {"slots": sa_fill_slots(objects, max_weight), "seconds": 0.0,
+                 "trace": list()}
+    else:
+        # Carry on with the schedule where it was
+        vars(schedule).update(state["schedule"])
+
+    def save():
+        state["schedule"] = dict(vars(schedule))
+        checkpoint.save("sa", state)
+
+    best = None
+    seconds = state["seconds"]
+    start = time.time()
+    for state in sa_anneal_levels(objects, max_weight, state, costfun,
+                                  schedule, iterations, instrument):
+        state["seconds"] = seconds + time.time() - start
+        trace = state["trace"]
+        if not trace or state["best_cost"] < trace[-1][2]:
+            trace.append([state["seconds"], state["evaluations"],
+                          state["best_cost"]])
+            best = None
+        if best is None:
+            best = Knapsack([objects[i] for i in state["best_slots"]],
+                            state["best_weight"], state["best_value"],
+                            max_weight)
+        if checkpoint is not None and checkpoint.due():
+            save()
+        try:
+            yield {"best": best, "cost": state["best_cost"],
+                   "level": state["levels"],
+                   "temperature": state["temperature"],
+                   "evaluations": state["evaluations"],
+                   "seconds": state["seconds"], "trace": trace}
+        except GeneratorExit:
+            if checkpoint is not None:
+                save()
+            raise
+        if budget is not None and budget.spent(state["seconds"],
+                                               state["evaluations"]):
+            break
+    if checkpoint is not None:
+        save()
+
+
+# ------------------------------------------------------------------------------
+# Parallel annealing
+#
+# Both functions below run chains on a multiprocessing pool, so the cost
+# function has to be picklable (a module-level function, not a lambda).
+#
+def sa_pool(processes):
+    """
+    Starts a process pool
+
+    :param processes: The number of processes; None uses every CPU
+    :return: The pool, or None when only one process is asked for, in which
+             case the chains run in this process
+    """
+    if processes == 1:
+        return None
+    return multiprocessing.Pool(processes)
+
+
+def sa_pool_map(pool, function, jobs):
+    """
+    Maps a function over jobs on a pool from sa_pool
+
+    :param pool: The pool, or None to run in this process
+    :param function: A module-level function taking one job
+    :param jobs: The list of jobs
+    :return: The list of results, in the order of the jobs
+    """
+    if pool is None:
+        return map(function, jobs)
+    return pool.map(function, jobs)
+
+
+def sa_pool_close(pool):
+    """
+    Shuts down a pool from sa_pool
+
+    :param pool: The pool, or None
+    """
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+
+def sa_chain_job(job):
+    """
+    Runs one independent chain for sa_multistart
+
+    :param job: A tuple of objects, max_weight, costfun and the keyword
+                arguments for sa_knapsack
+    :return: A tuple of the solution and its statistics
+    """
+    objects, max_weight, costfun, params = job
+    stats = dict(params)
+    start = time.time()
+    solution = sa_knapsack(objects, max_weight, costfun, stats=stats, **params)
+    stats["weight"] = solution.weight()
+    stats["value"] = solution.value()
+    stats["seconds"] = time.time() - start
+    return solution, stats
+
+
+def sa_multistart(objects, max_weight, chains=4, costfun=sa_cost_value,
+                  processes=None, seed=0, **params):
+    """
+    Runs several independent annealing chains in parallel and keeps the best
+
+    :param objects: A list of objects that can be included in the knapsack
+    :param max_weight: The maximum weight of the knapsack
+    :param chains: The number of chains, or a list with a dictionary of
+                   sa_knapsack keyword arguments (temperature, temp_min, alpha,
+                   iterations, schedule, engine, seed) for every chain
+    :param costfun: The cost function
+    :param processes: The number of processes; None uses every CPU
+    :param seed: Chain i without a seed of its own uses seed + i
+    :param params: Keyword arguments for sa_knapsack shared by every chain;
+                   the engine defaults to "array"
+    :return: A tuple of the solution with the lowest cost and a list with the
+             statistics of every chain
+    """
+    if isinstance(chains, int):
+        chains = [dict() for i in range(chains)]
+    params.setdefault("engine", "array")
+    jobs = list()
+    for i, chain in enumerate(chains):
+        chain_params = dict(params)
+        chain_params["seed"] = seed + i
+        chain_params.update(chain)
+        jobs.append((objects, max_weight, costfun, chain_params))
+
+    pool = sa_pool(processes)
+    try:
+        results = sa_pool_map(pool, sa_chain_job, jobs)
+    finally:
+        sa_pool_close(pool)
+    best = min(results, key=lambda result: result[1]["cost"])
+    return best[0], [stats for solution, stats in results]
+
+
+def sa_replica_job(job):
+    """
+    Runs one replica of sa_replica_exchange at its temperature for a round
+
+    :param job: A tuple of objects, max_weight, costfun, the replica's slots,
+                its temperature, the number of iterations and the seed
+    :return: A tuple of the new slots, weight, value, cost and the number of
+             accepted moves
+    """
+    objects, max_weight, costfun, slots, temperature, iterations, seed = job
+    sa_seed(seed)
+    stats = dict()
+    weight, value, cost = sa_anneal_slots(objects, max_weight, slots, costfun,
+                                          ListCooling([temperature]),
+                                          iterations, stats)
+    return slots, weight, value, cost, stats["accepted"]
+
+
+def sa_replica_exchange(objects, max_weight, replicas=8,
+                        costfun=sa_cost_value, temperature=1.0,
+                        temp_min=0.00001, iterations=1000, rounds=100,
+                        processes=None, seed=0):
+    """
+    Parallel tempering: one replica runs at each temperature of a geometric
+    ladder, and after every round of 'iterations' moves neighboring replicas
+    swap their solutions with probability
+    min(1, exp((E_i - E_j) * (1/T_i - 1/T_j))). Good solutions found by the hot
+    replicas can in this way move down to the cold ones
+
+    :param objects: A list of objects that can be included in the knapsack
+    :param max_weight: The maximum weight of the knapsack
+    :param replicas: The number of replicas (at least 2)
+    :param costfun: The cost function
+    :param temperature: The temperature of the hottest replica
+    :param temp_min: The temperature of the coldest replica
+    :param iterations: The number of neighbors each replica tries per round
+    :param rounds: The number of rounds (at least 1)
+    :param processes: The number of processes; None uses every CPU
+    :param seed: Seed for the starting solutions, the moves and the swaps
+    :return: A tuple of the solution with the lowest cost seen at the end of
+             any round and a list with the statistics of every temperature
+    """
+    if replicas < 2:
+        raise ValueError("replica exchange needs at least 2 replicas, not "
+                         "{0}".format(replicas))
+    if rounds < 1:
+        raise ValueError("replica exchange needs at least 1 round, not "
+                         "{0}".format(rounds))
+    ladder = [temperature * (float(temp_min) / temperature) **
+              (float(k) / (replicas - 1)) for k in range(replicas)]
+    sa_seed(seed)
+    swaps = random.Random(seed)
+    states = [sa_fill_slots(objects, max_weight) for k in range(replicas)]
+    stats = [dict(temperature=t, accepted=0, swaps=0, swap_attempts=0)
+             for t in ladder]
+
+    best = None
+    costs = [None] * replicas   # of every replica at the end of the round
+    pool = sa_pool(processes)
+    try:
+        for r in range(rounds):
+            jobs = [(objects, max_weight, costfun, states[k], ladder[k],
+                     iterations, seed + 1 + r * replicas + k)
+                    for k in range(replicas)]
+            results = sa_pool_map(pool, sa_replica_job, jobs)
+            for k, result in enumerate(results):
+                slots, weight, value, cost, accepted = result
+                states[k] = slots
+                costs[k] = cost
+                stats[k]["accepted"] += accepted
+                if best is None or cost < best[0]:
+                    best = (cost, list(slots), weight, value)
+
+            # Swap neighbors, alternating between even and odd pairs
+            for k in range(r % 2, replicas - 1, 2):
+                stats[k]["swap_attempts"] += 1
+                exponent = (costs[k] - costs[k + 1]) * \
+                    (1.0 / ladder[k] - 1.0 / ladder[k + 1])
+                if exponent >= 0 or math.exp(exponent) > swaps.random():
+                    states[k], states[k + 1] = states[k + 1], states[k]
+                    costs[k], costs[k + 1] = costs[k + 1], costs[k]
+                    stats[k]["swaps"] += 1
+    finally:
+        sa_pool_close(pool)
+
+    for k in range(replicas):
+        stats[k]["evaluations"] = rounds * iterations
+        stats[k]["cost"] = costs[k]
+    cost, slots, weight, value = best
+    return Knapsack([objects[i] for i in slots], weight, value,
+                    max_weight), stats
+
+
 ################################################################################
 ################################################################################
 # RUN THE PROGRAM
 #
 def main():
     logging.getLogger("sa_alg")
-    max_weight, objects = parse_knapsack("./data.txt")
+    # Any instance file of knapsack/instances.py may be given instead
+    if len(sys.argv) > 1:
+        weights, values, max_weight = instances.load_instance(sys.argv[1])
+        objects = instances.objects(weights, values)
+    else:
+        max_weight, objects = parse_knapsack("./data.txt")
     solution = sa_knapsack(objects, max_weight, costfun=sa_cost_weight)
     print str(solution)
 